@@ -0,0 +1,113 @@
+"""
+Run the ktest benchmarks.
+
+Usage::
+
+    python -m benchmarks [-o results.json] [-c baseline.json] [suite ...]
+
+The results are printed and optionally stored as JSON. With --compare,
+each result is compared to a previous results file, and the exit status
+is non-zero if any of them regressed by more than the threshold.
+"""
+
+import sys
+import json
+import platform
+import argparse
+import subprocess
+from dataclasses import asdict
+from typing import Callable
+
+from . import bench_connection, bench_context, bench_util
+from .common import Result
+
+SUITES: dict[str, Callable[[int], dict[str, Result]]] = {
+    "util": bench_util.run,
+    "context": bench_context.run,
+    "local": bench_connection.run_local,
+    "ssh": bench_connection.run_ssh,
+}
+
+
+def _revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _compare(
+    results: dict[str, Result], baseline: dict[str, dict], threshold: float
+) -> bool:
+    """Print the change of each result and return False on a regression."""
+    ok = True
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old = baseline[name]["value"]
+        change = (result.value - old) / old if old else 0.0
+        regression = -change if result.higher_is_better else change
+        flag = ""
+        if regression > threshold:
+            flag = "  REGRESSION"
+            ok = False
+        print(f"{name:32} {old:12.2f} -> {result.value:12.2f} {change:+8.1%}{flag}")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "suites", nargs="*", metavar="suite", help=f"one of {', '.join(SUITES)}"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", help="write the results to a JSON file")
+    parser.add_argument("-c", "--compare", help="compare to a JSON results file")
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="relative change reported as a regression (default: 0.1)",
+    )
+    args = parser.parse_args()
+    for suite in args.suites:
+        if suite not in SUITES:
+            parser.error(f"unknown suite: {suite}")
+
+    results: dict[str, Result] = {}
+    for suite in args.suites or SUITES:
+        results.update(SUITES[suite](args.repeat))
+
+    for name, result in results.items():
+        print(f"{name:32} {result.value:12.2f} {result.unit}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "revision": _revision(),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": {name: asdict(r) for name, r in results.items()},
+                },
+                f,
+                indent=2,
+            )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        print()
+        if not _compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+sys.exit(main())
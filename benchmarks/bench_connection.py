@@ -0,0 +1,66 @@
+import os
+import time
+import tempfile
+import contextlib
+import statistics
+
+from ktest.connection import local, ssh
+from ktest.connection.base import Connection
+
+from .common import Result, best_time
+from .loopback import LoopbackSSHD
+
+COMMANDS = 50
+FILE_SIZE = 64 * 2**20
+
+
+def run_ssh(repeat: int) -> dict[str, Result]:
+    """Measure ssh command latency and file transfer bandwidth."""
+    # fabric echoes the commands to stdout
+    with LoopbackSSHD() as sshd, open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            return _run("ssh", ssh.Connection(sshd.config), repeat)
+
+
+def run_local(repeat: int) -> dict[str, Result]:
+    """Measure the local backend, the reference for the other backends."""
+    return _run("local", local.Connection(), repeat)
+
+
+def _run(name: str, connection: Connection, repeat: int) -> dict[str, Result]:
+    start = time.perf_counter()
+    connection.run_command("true")
+    connect_time = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(COMMANDS):
+        start = time.perf_counter()
+        connection.run_command("true")
+        latencies.append(time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src = os.path.join(tmp, "src")
+        remote = os.path.join(tmp, "remote")
+        dest = os.path.join(tmp, "dest")
+        with open(src, "wb") as f:
+            f.write(os.urandom(FILE_SIZE))
+
+        put_time = best_time(lambda: connection.put(src, remote), repeat)
+        get_time = best_time(lambda: connection.get(remote, dest), repeat)
+
+    connection.close()
+
+    return {
+        f"{name}.connect": Result(connect_time * 1e3, "ms", False),
+        f"{name}.command.median": Result(
+            statistics.median(latencies) * 1e3, "ms", False
+        ),
+        f"{name}.command.p95": Result(
+            statistics.quantiles(latencies, n=20)[-1] * 1e3, "ms", False
+        ),
+        f"{name}.put": Result(FILE_SIZE / put_time / 2**20, "MiB/s", True),
+        f"{name}.get": Result(FILE_SIZE / get_time / 2**20, "MiB/s", True),
+    }
+
+
+__all__ = ["run_local", "run_ssh"]
@@ -0,0 +1,49 @@
+from git.repo import Repo
+
+from ktest.context import Context
+from ktest.task import Task
+
+from .common import Result, best_time
+
+TASKS = 2000
+
+
+class _NopTask(Task):
+    def execute(self) -> None:
+        pass
+
+
+def _chain(ctx: Context) -> None:
+    previous: tuple[Task, ...] = ()
+    for _ in range(TASKS):
+        previous = (_NopTask(ctx, dependencies=previous),)
+
+
+def _layers(ctx: Context, width: int = 50) -> None:
+    previous: tuple[Task, ...] = ()
+    for _ in range(TASKS // width):
+        previous = tuple(_NopTask(ctx, dependencies=previous) for _ in range(width))
+
+
+def run(repeat: int) -> dict[str, Result]:
+    """Measure the Context.run scheduling overhead per task."""
+    repo = Repo()
+    results: dict[str, Result] = {}
+
+    for name, build in (("chain", _chain), ("layers", _layers)):
+        for max_workers in (1, 8):
+
+            def schedule() -> None:
+                ctx = Context(repo)
+                build(ctx)
+                ctx.run(max_workers=max_workers)
+
+            elapsed = best_time(schedule, repeat)
+            results[f"context.{name}.workers{max_workers}"] = Result(
+                elapsed / TASKS * 1e6, "us/task", False
+            )
+
+    return results
+
+
+__all__ = ["run"]
@@ -0,0 +1,37 @@
+from ktest.util import run_cmd
+
+from .common import Result, best_time
+
+LINES = 1_000_000
+LINE_SIZE = 80
+
+
+def run(repeat: int) -> dict[str, Result]:
+    """Measure run_cmd throughput on high volume output."""
+    cmd = f"yes {'x' * (LINE_SIZE - 1)} | head -n {LINES}"
+
+    def capture() -> None:
+        run_cmd(cmd, capture_output=True)
+
+    def stream() -> None:
+        count = 0
+
+        def on_output(stream: str, line: str) -> None:
+            nonlocal count
+            count += 1
+
+        run_cmd(cmd, on_output=on_output)
+
+    capture_time = best_time(capture, repeat)
+    stream_time = best_time(stream, repeat)
+
+    return {
+        "run_cmd.capture": Result(LINES / capture_time, "lines/s", True),
+        "run_cmd.capture_bandwidth": Result(
+            LINES * LINE_SIZE / capture_time / 2**20, "MiB/s", True
+        ),
+        "run_cmd.stream": Result(LINES / stream_time, "lines/s", True),
+    }
+
+
+__all__ = ["run"]
@@ -0,0 +1,45 @@
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass(frozen=True)
+class Result:
+    """
+    A benchmark measurement.
+
+    Constructor arguments:
+
+        :param value: The measured value.
+        :type value: float
+        :param unit: The unit of the value.
+        :type unit: str
+        :param higher_is_better: True for throughputs, False for latencies.
+        :type higher_is_better: bool
+    """
+
+    value: float
+    unit: str
+    higher_is_better: bool
+
+
+def best_time(fn: Callable[[], object], repeat: int) -> float:
+    """
+    Run a callable several times and return its fastest run time.
+
+    :param fn: The callable to measure.
+    :type fn: Callable
+    :param repeat: The number of runs.
+    :type repeat: int
+    :return: The shortest elapsed time in seconds.
+    :rtype: float
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+__all__ = ["Result", "best_time"]
@@ -0,0 +1,195 @@
+import os
+import errno
+import socket
+import threading
+import subprocess
+from types import TracebackType
+from contextlib import AbstractContextManager
+from typing import IO
+
+import paramiko
+from paramiko import SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface
+from paramiko.common import AUTH_SUCCESSFUL, OPEN_SUCCEEDED
+from paramiko.sftp import SFTP_OK
+
+from ktest.connection.ssh import HostConfig
+
+_READ_SIZE = 65536
+
+
+class _Handle(SFTPHandle):
+    readfile: IO[bytes]
+    writefile: IO[bytes]
+
+    def stat(self):
+        return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr):
+        return SFTP_OK
+
+
+class _SFTPInterface(SFTPServerInterface):
+    """Serve the local file system."""
+
+    def open(self, path, flags, attr):
+        fd = os.open(path, flags, 0o644)
+        f = os.fdopen(fd, "wb" if flags & (os.O_WRONLY | os.O_RDWR) else "rb")
+        handle = _Handle(flags)
+        handle.readfile = f
+        handle.writefile = f
+        return handle
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(path))
+        except OSError as ex:
+            return SFTPServer.convert_errno(ex.errno or errno.EIO)
+
+    lstat = stat
+
+    def list_folder(self, path):
+        result = []
+        for name in os.listdir(path):
+            attr = SFTPAttributes.from_stat(os.stat(os.path.join(path, name)))
+            attr.filename = name
+            result.append(attr)
+        return result
+
+    def chattr(self, path, attr):
+        atime, mtime = getattr(attr, "atime", None), getattr(attr, "mtime", None)
+        if atime is not None and mtime is not None:
+            os.utime(path, (atime, mtime))
+        return SFTP_OK
+
+    def mkdir(self, path, attr):
+        os.mkdir(path)
+        return SFTP_OK
+
+    def remove(self, path):
+        os.remove(path)
+        return SFTP_OK
+
+    def canonicalize(self, path):
+        return os.path.abspath(path)
+
+
+class _Server(paramiko.ServerInterface):
+    """Accept any user and run commands in a local shell."""
+
+    def check_channel_request(self, kind, chanid):
+        return OPEN_SUCCEEDED
+
+    def check_auth_none(self, username):
+        return AUTH_SUCCESSFUL
+
+    def check_auth_password(self, username, password):
+        return AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return "none,password"
+
+    def check_channel_pty_request(
+        self, channel, term, width, height, pixelwidth, pixelheight, modes
+    ):
+        return True
+
+    def check_channel_env_request(self, channel, name, value):
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(
+            target=self.__exec, args=(channel, command), daemon=True
+        ).start()
+        return True
+
+    @staticmethod
+    def __exec(channel: paramiko.Channel, command: bytes) -> None:
+        p = subprocess.Popen(
+            command.decode(),
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        assert p.stdin and p.stdout and p.stderr
+
+        def feed(stdin: IO[bytes]) -> None:
+            while data := channel.recv(_READ_SIZE):
+                stdin.write(data)
+            stdin.close()
+
+        def forward_stderr(stderr: IO[bytes]) -> None:
+            while data := stderr.read1(_READ_SIZE):  # type: ignore[attr-defined]
+                channel.sendall_stderr(data)
+
+        threading.Thread(target=feed, args=(p.stdin,), daemon=True).start()
+        err = threading.Thread(target=forward_stderr, args=(p.stderr,), daemon=True)
+        err.start()
+        while data := p.stdout.read1(_READ_SIZE):  # type: ignore[attr-defined]
+            channel.sendall(data)
+        err.join()
+        channel.send_exit_status(p.wait())
+        channel.close()
+
+
+class LoopbackSSHD(AbstractContextManager):
+    """
+    Run an in-process ssh server on the loopback interface.
+
+    It is a stand-in for a test host: commands run as the current user in
+    a local shell and SFTP serves the local file system. It needs no
+    container or network access, so benchmarks run offline.
+    """
+
+    def __init__(self) -> None:
+        self.__key = paramiko.RSAKey.generate(2048)
+        self.__transports: list[paramiko.Transport] = []
+        self.__sock = socket.socket()
+        self.__sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.__sock.bind(("127.0.0.1", 0))
+        self.__sock.listen(16)
+        self.port: int = self.__sock.getsockname()[1]
+        threading.Thread(target=self.__accept, daemon=True).start()
+
+    @property
+    def config(self) -> HostConfig:
+        """Return the connection configuration of the server."""
+        return HostConfig(
+            host="127.0.0.1",
+            user=os.environ.get("USER", "root"),
+            port=self.port,
+            connect_kwargs={
+                "password": "",
+                "look_for_keys": False,
+                "allow_agent": False,
+            },
+        )
+
+    def __accept(self) -> None:
+        while True:
+            try:
+                client, _ = self.__sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.__key)
+            transport.set_subsystem_handler("sftp", SFTPServer, _SFTPInterface)
+            transport.start_server(server=_Server())
+            self.__transports.append(transport)
+
+    def close(self) -> None:
+        self.__sock.close()
+        for transport in self.__transports:
+            transport.close()
+
+    def __exit__(
+        self,
+        __exc_type: type[BaseException] | None,
+        __exc_value: BaseException | None,
+        __traceback: TracebackType | None,
+    ) -> bool | None:
+        self.close()
+        return None
+
+
+__all__ = ["LoopbackSSHD"]
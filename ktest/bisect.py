@@ -0,0 +1,200 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Sequence
+
+from git.objects import Commit
+from git.repo import Repo
+from git.types import PathLike
+
+from .cache import BuildCache
+from .connection.base import FactoryType
+from .context import Context
+from .tasks import Boot, Build, Install
+from ._log import logger
+
+EvaluateType = Callable[[Commit, int], bool]
+TestType = Callable[[Context], bool]
+
+
+def _midpoints(lo: int, hi: int, count: int) -> list[int]:
+    """
+    Split the open interval (lo, hi) in count + 1 parts.
+
+    >>> _midpoints(-1, 10, 1)
+    [5]
+    >>> _midpoints(-1, 10, 3)
+    [2, 5, 7]
+    >>> _midpoints(0, 3, 4)
+    [1, 2]
+    """
+    count = min(count, hi - lo - 1)
+    step = (hi - lo) / (count + 1)
+    return sorted({lo + round(step * (i + 1)) for i in range(count)})
+
+
+class Bisect:
+    """
+    Find the first bad commit between a good and a bad revision.
+
+    Each round tests several commits at once, splitting the suspect range
+    in workers + 1 parts, so a bisection takes about log(n) / log(workers + 1)
+    rounds. With workers=1 it is a regular binary search.
+
+    The commits between good and bad are searched in topological order as if
+    the history were linear, so a regression introduced by a merge may be
+    reported at the merge commit or at a commit of the merged branch.
+    """
+
+    def __init__(
+        self,
+        repo: Repo,
+        good: str,
+        bad: str,
+        evaluate: EvaluateType,
+        workers: int = 1,
+    ) -> None:
+        """
+        :param repo: Kernel git repository.
+        :type repo: Repo
+        :param good: A revision known to be good.
+        :type good: str
+        :param bad: A revision known to be bad.
+        :type bad: str
+        :param evaluate: A callable that receives a commit and a worker slot
+                         number, from 0 to workers - 1, and returns True if
+                         the commit is good. Calls with different slots may
+                         run at the same time.
+        :type evaluate: EvaluateType
+        :param workers: The number of commits tested concurrently.
+        :type workers: int
+        """
+        self.repo = repo
+        self.good = good
+        self.bad = bad
+        self.evaluate = evaluate
+        self.workers = workers
+
+    def run(self) -> Commit:
+        """
+        Run the bisection.
+
+        :return: The first bad commit.
+        :rtype: Commit
+        :raise ValueError: if bad is not a descendant of good.
+        """
+        commits = list(
+            self.repo.iter_commits(
+                f"{self.good}..{self.bad}",
+                ancestry_path=True,
+                topo_order=True,
+                reverse=True,
+            )
+        )
+        if not commits:
+            raise ValueError(f"{self.bad} is not a descendant of {self.good}")
+
+        # commits[lo] is good (-1 stands for the good revision), commits[hi] is bad
+        lo, hi = -1, len(commits) - 1
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while hi - lo > 1:
+                points = _midpoints(lo, hi, self.workers)
+                logger.info(
+                    f"Bisect: {hi - lo - 1} suspect commits, testing "
+                    + ", ".join(commits[i].hexsha[:12] for i in points)
+                )
+
+                results = dict(
+                    zip(
+                        points,
+                        pool.map(
+                            self.evaluate,
+                            (commits[i] for i in points),
+                            range(len(points)),
+                        ),
+                    )
+                )
+
+                for i in points:
+                    logger.info(
+                        f"Bisect: {commits[i].hexsha[:12]} is "
+                        + ("good" if results[i] else "bad")
+                    )
+
+                hi = min((i for i in points if not results[i]), default=hi)
+                lo = max((i for i in points if results[i] and i < hi), default=lo)
+
+        logger.info(f"Bisect: first bad commit is {commits[hi].hexsha}")
+        return commits[hi]
+
+
+class KernelTest:
+    """
+    Evaluate a commit by building, installing and booting the kernel in a
+    test host, and then running a test.
+
+    Worker slot n builds in a git worktree of its own, reused across rounds
+    so builds are incremental, and tests on hosts[n]. The ktest-bisect-n
+    branch of the slot is deleted once the kernel is booted.
+    """
+
+    def __init__(
+        self,
+        ctx: Context,
+        hosts: Sequence[FactoryType],
+        test: TestType,
+        config: PathLike | None = None,
+        build_options: str = "",
+        cache: BuildCache | None = None,
+        cmdline: str = "",
+    ) -> None:
+        """
+        :param ctx: The Context with the kernel repository.
+        :type ctx: Context
+        :param hosts: A Connection factory to each test host, one per worker.
+        :type hosts: Sequence[FactoryType]
+        :param test: A callable that receives the Context of a host running
+                     the kernel under test and returns True if it is good.
+        :type test: TestType
+        :param config: The path to the .config kernel configuration file.
+        :type config: PathLike | None
+        :param build_options: Extra options to pass to make.
+        :type build_options: str
+        :param cache: A kernel build cache.
+        :type cache: BuildCache | None
+        :param cmdline: Additional kernel command line arguments.
+        :type cmdline: str
+        """
+        self.ctx = ctx
+        self.hosts = hosts
+        self.test = test
+        self.config = config
+        self.build_options = build_options
+        self.cache = cache
+        self.cmdline = cmdline
+
+    def __call__(self, commit: Commit, slot: int) -> bool:
+        with self.ctx.repo_lock:
+            head = self.ctx.repo.create_head(
+                f"ktest-bisect-{slot}", commit.hexsha, force=True
+            )
+        try:
+            ctx = self.ctx.fork(self.hosts[slot])
+            build = Build(
+                ctx,
+                config=self.config,
+                head=head,
+                build_options=self.build_options,
+                cache=self.cache,
+                worktree=True,
+            )
+            # Boot waits until the host runs the new kernel
+            Boot(Install(build), cmdline=self.cmdline)
+            ctx.run()
+        finally:
+            # The worktree of the slot is detached, so the branch can go
+            with self.ctx.repo_lock:
+                self.ctx.repo.delete_head(head, force=True)
+
+        return self.test(ctx)
+
+
+__all__ = ["Bisect", "EvaluateType", "KernelTest", "TestType"]
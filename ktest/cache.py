@@ -0,0 +1,185 @@
+import os
+import shutil
+import hashlib
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from git.types import PathLike
+
+from .util import expd
+from .package import PackageFormat
+from ._log import logger
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """
+    A cached kernel build.
+
+    Constructor arguments:
+
+        :param packages: The paths to the kernel packages inside the cache,
+                         by format.
+        :type packages: dict[PackageFormat, Path]
+        :param release: The kernel release of the packages.
+        :type release: str
+    """
+
+    packages: dict[PackageFormat, Path]
+    release: str
+
+
+class BuildCache:
+    """
+    A local content-addressed cache of kernel packages.
+
+    Each entry is stored in a directory named after a hash of the build
+    inputs (commit, configuration, make options and architecture), and
+    holds the packages of the build in each format that was created. When
+    the cache grows beyond max_size bytes, the least recently used entries
+    are removed.
+    """
+
+    RELEASE_FILE = "release"
+
+    def __init__(
+        self, root: PathLike = "~/.cache/ktest/builds", max_size: int = 20 * 2**30
+    ) -> None:
+        """
+        :param root: The cache root directory.
+        :type root: str | os.PathLike
+        :param max_size: The maximum size of the cache in bytes.
+        :type max_size: int
+        """
+        self.root = Path(expd(root))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+    @staticmethod
+    def key(commit: str, config: bytes, build_options: str, arch: str) -> str:
+        """
+        Compute the cache key of a build.
+
+        :param commit: The hexsha of the built commit.
+        :type commit: str
+        :param config: The content of the configuration file.
+        :type config: bytes
+        :param build_options: Extra options passed to make.
+        :type build_options: str
+        :param arch: The target architecture.
+        :type arch: str
+        :return: The cache key.
+        :rtype: str
+        """
+        h = hashlib.sha256()
+        for data in (commit.encode(), config, build_options.encode(), arch.encode()):
+            h.update(hashlib.sha256(data).digest())
+        return h.hexdigest()
+
+    def lookup(self, key: str) -> CacheEntry | None:
+        """
+        Find a build in the cache.
+
+        :param key: The cache key.
+        :type key: str
+        :return: The cache entry, or None if the build is not in the cache.
+        :rtype: CacheEntry | None
+        """
+        entry = self.root / key
+        try:
+            release = (entry / self.RELEASE_FILE).read_text()
+            packages = self.__packages(entry)
+            os.utime(entry)
+        except OSError:
+            return None
+        if not packages:
+            return None
+
+        logger.info(f"Build cache hit: {key}")
+        return CacheEntry(packages, release)
+
+    def store(self, key: str, package: PathLike, release: str) -> CacheEntry:
+        """
+        Add a package of a build to the cache.
+
+        The package is added next to the packages of the build in other
+        formats, if any.
+
+        :param key: The cache key.
+        :type key: str
+        :param package: The path to the kernel package.
+        :type package: str | os.PathLike
+        :param release: The kernel release of the package.
+        :type release: str
+        :return: The new cache entry.
+        :rtype: CacheEntry
+        """
+        package = Path(package)
+        entry = self.root / key
+
+        if not entry.is_dir():
+            tmp = Path(tempfile.mkdtemp(dir=self.root, prefix=".tmp-"))
+            try:
+                (tmp / self.RELEASE_FILE).write_text(release)
+                os.rename(tmp, entry)
+            except OSError:
+                # Another process stored the same build first
+                shutil.rmtree(tmp, ignore_errors=True)
+                if not entry.exists():
+                    raise
+
+        fd, tmp_name = tempfile.mkstemp(dir=entry, prefix=".tmp-")
+        os.close(fd)
+        try:
+            shutil.copyfile(package, tmp_name)
+            os.replace(tmp_name, entry / package.name)
+        except OSError:
+            Path(tmp_name).unlink(missing_ok=True)
+            raise
+
+        logger.info(f"Build cache store: {key} ({package.name})")
+        self.evict(keep=key)
+        return CacheEntry(self.__packages(entry), release)
+
+    @staticmethod
+    def __packages(entry: Path) -> dict[PackageFormat, Path]:
+        packages = {}
+        for path in entry.iterdir():
+            if path.name.startswith(".tmp-"):
+                continue
+            try:
+                packages[PackageFormat.from_path(path)] = path
+            except ValueError:
+                continue
+        return packages
+
+    def evict(self, keep: str | None = None) -> None:
+        """
+        Remove the least recently used entries until the cache fits max_size.
+
+        :param keep: The key of an entry that must not be removed.
+        :type keep: str | None
+        """
+        entries = []
+        for entry in self.root.iterdir():
+            if entry.name.startswith(".tmp-"):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_size:
+                break
+            if entry.name == keep:
+                continue
+            logger.info(f"Build cache evict: {entry.name}")
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+
+__all__ = ["BuildCache", "CacheEntry"]
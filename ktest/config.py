@@ -0,0 +1,185 @@
+import re
+import hashlib
+from pathlib import Path
+from typing import Iterable
+
+from git.repo import Repo
+
+from ._log import logger
+
+# The file in the build directory that records the configuration inputs
+STAMP_FILE = ".ktest-config"
+
+# The files that olddefconfig and defconfig read from the source tree
+KCONFIG_PATHSPECS = (":(glob)**/Kconfig*", ":(glob)arch/*/configs/**")
+
+_SYMBOL = re.compile(r"^(CONFIG_\w+)=(.*)$")
+_NOT_SET = re.compile(r"^# (CONFIG_\w+) is not set$")
+
+
+def parse(text: str) -> dict[str, str | None]:
+    """
+    Parse a kernel configuration.
+
+    >>> parse("CONFIG_A=y\\n# CONFIG_B is not set\\n# a comment\\n")
+    {'CONFIG_A': 'y', 'CONFIG_B': None}
+
+    :param text: The content of a .config file or fragment.
+    :type text: str
+    :return: A map of the symbols to their values, None if not set.
+    :rtype: dict[str, str | None]
+    """
+    symbols: dict[str, str | None] = {}
+    for line in text.splitlines():
+        line = line.strip()
+        if match := _SYMBOL.match(line):
+            symbols[match[1]] = match[2]
+        elif match := _NOT_SET.match(line):
+            symbols[match[1]] = None
+    return symbols
+
+
+def dump(symbols: dict[str, str | None]) -> str:
+    """
+    Format symbols as a kernel configuration.
+
+    :param symbols: A map of the symbols to their values, None if not set.
+    :type symbols: dict[str, str | None]
+    :rtype: str
+    """
+    return "".join(
+        f"# {name} is not set\n" if value is None else f"{name}={value}\n"
+        for name, value in symbols.items()
+    )
+
+
+def merge(base: str, fragments: Iterable[str]) -> str:
+    """
+    Merge configuration fragments into a base configuration.
+
+    Like scripts/kconfig/merge_config.sh, each fragment overrides the
+    symbols set by the base and the previous fragments.
+
+    :param base: The base configuration.
+    :type base: str
+    :param fragments: The content of the fragments, in order.
+    :type fragments: Iterable[str]
+    :return: The merged configuration, to be resolved with olddefconfig.
+    :rtype: str
+    """
+    symbols = parse(base)
+    for fragment in fragments:
+        for name, value in parse(fragment).items():
+            if name in symbols and symbols[name] != value:
+                logger.info(
+                    f"Value of {name} is redefined by fragment: "
+                    f"{symbols[name]} -> {value}"
+                )
+            symbols[name] = value
+    return dump(symbols)
+
+
+def check(requested: str, resolved: str) -> list[str]:
+    """
+    Find the requested symbols that the resolved configuration does not honor.
+
+    A symbol can be dropped by olddefconfig, e.g. when its dependencies are
+    not met. A symbol not set is honored if it is missing from the resolved
+    configuration.
+
+    :param requested: The merged input configuration.
+    :type requested: str
+    :param resolved: The configuration written by olddefconfig.
+    :type resolved: str
+    :return: The names of the symbols with another value.
+    :rtype: list[str]
+    """
+    actual = parse(resolved)
+    return [
+        name for name, value in parse(requested).items() if actual.get(name) != value
+    ]
+
+
+def kconfig_digest(repo: Repo) -> str:
+    """
+    Hash the Kconfig files and the defconfigs of a source tree.
+
+    It hashes the blob ids in the index, and the local changes
+    of these files, without reading the whole tree.
+
+    :param repo: The repository of the source tree.
+    :type repo: Repo
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    h.update(repo.git.ls_files("-s", "--", *KCONFIG_PATHSPECS).encode())
+    h.update(repo.git.diff("HEAD", "--", *KCONFIG_PATHSPECS).encode())
+    return h.hexdigest()
+
+
+def fingerprint(*inputs: str) -> str:
+    """
+    Compute the fingerprint of the configuration inputs.
+
+    :param inputs: The inputs, e.g. the merged configuration, the
+                   architecture and the Kconfig digest.
+    :type inputs: str
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    for data in inputs:
+        h.update(hashlib.sha256(data.encode()).digest())
+    return h.hexdigest()
+
+
+def _digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def up_to_date(build_dir: Path, digest: str) -> bool:
+    """
+    Check if the configuration of a build directory has a fingerprint.
+
+    The configuration is up to date if it was resolved from inputs with
+    this fingerprint, and the .config file was not modified since.
+
+    :param build_dir: The build output directory.
+    :type build_dir: Path
+    :param digest: The fingerprint of the configuration inputs.
+    :type digest: str
+    :rtype: bool
+    """
+    stamp = build_dir / STAMP_FILE
+    dot_config = build_dir / ".config"
+    if not stamp.is_file() or not dot_config.is_file():
+        return False
+    return stamp.read_text().split() == [digest, _digest(dot_config)]
+
+
+def record(build_dir: Path, digest: str) -> None:
+    """
+    Record the fingerprint of the resolved configuration of a build directory.
+
+    :param build_dir: The build output directory.
+    :type build_dir: Path
+    :param digest: The fingerprint of the configuration inputs.
+    :type digest: str
+    """
+    dot_config = build_dir / ".config"
+    if not dot_config.is_file():
+        return
+    (build_dir / STAMP_FILE).write_text(f"{digest} {_digest(dot_config)}\n")
+
+
+__all__ = [
+    "KCONFIG_PATHSPECS",
+    "STAMP_FILE",
+    "check",
+    "dump",
+    "fingerprint",
+    "kconfig_digest",
+    "merge",
+    "parse",
+    "record",
+    "up_to_date",
+]
@@ -1,8 +1,21 @@
-from typing import Callable
+import uuid
+import shutil
+import asyncio
+import tempfile
+from contextlib import contextmanager
+from typing import IO, TYPE_CHECKING, Callable, Iterable, Iterator
 from abc import ABC, abstractmethod
 
 from git.types import PathLike
 
+from . import transfer
+from .transfer import ProgressType, TransferChannel, TransferStats
+
+if TYPE_CHECKING:
+    from .batch import CommandBatch
+
+FilesType = Iterable[tuple[PathLike, PathLike]]
+
 
 class Connection(ABC):
     """
@@ -51,6 +64,211 @@ class Connection(ABC):
         :rtype: None
         """
 
+    def pipe_command(self, cmd: PathLike, stdin: IO[bytes]) -> None:
+        """
+        Run a command in the remote host, feeding its standard input from a
+        local stream.
+
+        The default implementation stages the stream in a temporary file in
+        the host. Implementations should override it to send the data as it
+        is read.
+
+        :param cmd: The command to run.
+        :type cmd: PathLike
+        :param stdin: The stream to send to the command standard input.
+        :type stdin: IO[bytes]
+        :rtype: None
+        :raise subprocess.CalledprocessorError: if the command fails.
+        """
+        dest = f"/tmp/ktest-stdin-{uuid.uuid4().hex}"
+        with tempfile.NamedTemporaryFile() as f:
+            shutil.copyfileobj(stdin, f)
+            f.flush()
+            self.put(f.name, dest)
+
+        self.run_command(f"{cmd} < {dest}; rc=$?; rm -f {dest}; exit $rc")
+
+    @contextmanager
+    def transfer_channel(self) -> Iterator[TransferChannel]:
+        """
+        Open a channel for a worker of the bulk transfer methods.
+
+        The default implementation returns the connection itself, so
+        put() and get() must be thread safe. Implementations should
+        override it to give each worker a channel of its own.
+
+        :rtype: Iterator[TransferChannel]
+        """
+        yield self
+
+    def put_many(
+        self,
+        files: FilesType,
+        max_workers: int = 4,
+        progress: ProgressType | None = None,
+        skip_unchanged=True,
+    ) -> TransferStats:
+        """
+        Copy several local files to the host concurrently.
+
+        The modification time of the sources is kept, so files whose size
+        and modification time already match in the host can be skipped.
+
+        :param files: Pairs of local source paths and host destination paths.
+        :type files: FilesType
+        :param max_workers: The maximum number of concurrent transfers.
+        :type max_workers: int
+        :param progress: A callable that receives the statistics after each
+                         file is transferred.
+        :type progress: ProgressType | None
+        :param skip_unchanged: Skip the files that are up to date in the host.
+        :type skip_unchanged: bool
+        :rtype: TransferStats
+        :raise FileNotFoundError: if a source file does not exist.
+        """
+        return transfer.put_many(self, files, max_workers, progress, skip_unchanged)
+
+    def get_many(
+        self,
+        files: FilesType,
+        max_workers: int = 4,
+        progress: ProgressType | None = None,
+        skip_unchanged=True,
+    ) -> TransferStats:
+        """
+        Copy several files from the host concurrently.
+
+        The modification time of the sources is kept, so files whose size
+        and modification time already match locally can be skipped.
+
+        :param files: Pairs of host source paths and local destination paths.
+        :type files: FilesType
+        :param max_workers: The maximum number of concurrent transfers.
+        :type max_workers: int
+        :param progress: A callable that receives the statistics after each
+                         file is transferred.
+        :type progress: ProgressType | None
+        :param skip_unchanged: Skip the files that are up to date locally.
+        :type skip_unchanged: bool
+        :rtype: TransferStats
+        :raise FileNotFoundError: if a source file does not exist.
+        """
+        return transfer.get_many(self, files, max_workers, progress, skip_unchanged)
+
+    def sync_dir(
+        self,
+        src: PathLike,
+        dest: PathLike,
+        upload=True,
+        max_workers: int = 4,
+        progress: ProgressType | None = None,
+        checksum=False,
+    ) -> TransferStats:
+        """
+        Copy the files of a directory tree that are missing or out of date.
+
+        Files are compared by size and modification time, or by content
+        with checksum. Files that only exist in the destination are kept.
+
+        :param src: The source directory, local if upload is True.
+        :type src: PathLike
+        :param dest: The destination directory, in the host if upload is True.
+        :type dest: PathLike
+        :param upload: Copy from the local machine to the host, or the reverse.
+        :type upload: bool
+        :param max_workers: The maximum number of concurrent transfers.
+        :type max_workers: int
+        :param progress: A callable that receives the statistics after each
+                         file is transferred.
+        :type progress: ProgressType | None
+        :param checksum: Compare the file contents instead of the modification
+                         times.
+        :type checksum: bool
+        :rtype: TransferStats
+        """
+        return transfer.sync_dir(
+            self, src, dest, upload, max_workers, progress, checksum
+        )
+
+    @property
+    def address(self) -> tuple[str, int] | None:
+        """
+        Return the host name and TCP port the connection reaches the host at.
+
+        The default implementation returns None, for connections that are
+        not made over the network.
+
+        :rtype: tuple[str, int] | None
+        """
+        return None
+
+    def batch(self) -> "CommandBatch":
+        """
+        Create a CommandBatch that runs its commands through this connection.
+
+        :rtype: CommandBatch
+        """
+        from .batch import CommandBatch
+
+        return CommandBatch(self)
+
+    def close(self) -> None:
+        """
+        Close the connection to the host.
+
+        The default implementation does nothing.
+        """
+
+    async def arun_command(self, cmd: PathLike, capture_output=False) -> str:
+        """
+        Run a command in the remote host without blocking the event loop.
+
+        The default implementation runs run_command in the event loop's
+        default executor, so each command in flight holds one of its
+        threads. Connections override it to drive their commands from the
+        event loop.
+
+        :param cmd: The command to run.
+        :type cmd: PathLike
+        :param capture_output: Should we return the command output?
+        :type capture_output: bool
+        :return: if capture_output is True, return the command output,
+                 otherwise return an empty string.
+        :rtype: str
+        :raise subprocess.CalledprocessorError: if the command fails.
+        """
+        return await asyncio.to_thread(self.run_command, cmd, capture_output)
+
+    async def aput(self, src: PathLike, dest: PathLike) -> None:
+        """
+        Copy a local file to the host without blocking the event loop.
+
+        The default implementation runs put in the event loop's default
+        executor.
+
+        :param src: The local source file.
+        :type src: PathLike
+        :param dest: The destination path in the host.
+        :type dest: PathLike
+        :rtype: None
+        """
+        await asyncio.to_thread(self.put, src, dest)
+
+    async def aget(self, src: PathLike, dest: PathLike) -> None:
+        """
+        Copy a file from the host without blocking the event loop.
+
+        The default implementation runs get in the event loop's default
+        executor.
+
+        :param src: The remote source file.
+        :type src: PathLike
+        :param dest: The destination path in the local machine.
+        :type dest: PathLike
+        :rtype: None
+        """
+        await asyncio.to_thread(self.get, src, dest)
+
 
 class ConnectionFactory(ABC):
     """Create new Connection object."""
@@ -104,6 +322,7 @@ FactoryType = Callable[[], Connection]
 
 __all__ = [
     "FactoryType",
+    "FilesType",
     "Connection",
     "ConnectionFactory",
     "NullConnection",
@@ -0,0 +1,166 @@
+import os
+import uuid
+from types import TracebackType
+from typing import IO
+from subprocess import CalledProcessError
+from dataclasses import dataclass
+
+from git.types import PathLike
+
+from .base import Connection
+
+
+@dataclass(frozen=True)
+class CommandResult:
+    """
+    The outcome of a command run in a batch.
+
+    Constructor arguments:
+
+        :param cmd: The command line.
+        :type cmd: str
+        :param stdout: The command standard output.
+        :type stdout: str
+        :param returncode: The command exit status.
+        :type returncode: int
+    """
+
+    cmd: str
+    stdout: str
+    returncode: int
+
+
+class CommandBatch(Connection):
+    """
+    Run several commands in a single remote shell invocation.
+
+    A CommandBatch is a Connection that defers the commands whose output
+    is not needed. They run, in order, together with the next command that
+    captures its output, the next file transfer, or when the batch is
+    flushed, which happens on exit of the with block. So helpers that
+    receive a Connection work unchanged and cost one round trip per flush::
+
+        with ctx.connection.batch() as batch:
+            make_initrd(batch, release)
+            Grubby(batch, kernel).add_kernel()
+            title = grub.title(batch, release)  # first round trip
+            grub.grub2reboot(batch, title)
+        # second round trip
+
+    As with separate run_command calls, each command runs in its own
+    subshell and the commands after a failing one do not run. The commands
+    run with their standard input closed.
+    """
+
+    def __init__(self, connection: Connection) -> None:
+        """
+        :param connection: The Connection object that runs the batch.
+        :type connection: Connection
+        """
+        self.connection = connection
+        self.__pending: list[str] = []
+
+    def __enter__(self) -> "CommandBatch":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc_type is None:
+            self.flush()
+        else:
+            self.__pending.clear()
+
+    def flush(self, check=True) -> list[CommandResult]:
+        """
+        Run the pending commands.
+
+        :param check: If True, stop at the first failing command and raise
+                      an exception. Otherwise, run all commands.
+        :type check: bool
+        :return: The result of each command that ran.
+        :rtype: list[CommandResult]
+        :raise subprocess.CalledProcessError: if check is True and a command fails.
+        :raise RuntimeError: if check is True and the shell stopped early.
+        """
+        cmds, self.__pending = self.__pending, []
+        if not cmds:
+            return []
+
+        marker = f"ktest-{uuid.uuid4().hex}"
+        on_error = "exit 0" if check else ":"
+        script = "\n".join(
+            f"( {cmd}\n) < /dev/null; rc=$?; printf '\\n%s %d %d\\n' {marker} {i} $rc"
+            f"; [ $rc -eq 0 ] || {on_error}"
+            for i, cmd in enumerate(cmds)
+        )
+        output = self.connection.run_command(script, capture_output=True)
+
+        results = []
+        rest = output
+        for i, cmd in enumerate(cmds):
+            stdout, sep, rest = rest.partition(f"\n{marker} {i} ")
+            if not sep:
+                break
+            status, _, rest = rest.partition("\n")
+            results.append(CommandResult(cmd, stdout, int(status)))
+
+        for result in results:
+            if check and result.returncode:
+                raise CalledProcessError(
+                    returncode=result.returncode,
+                    cmd=result.cmd,
+                    output=result.stdout,
+                )
+
+        if check and len(results) < len(cmds):
+            raise RuntimeError(f"Command batch stopped before: {cmds[len(results)]}")
+
+        return results
+
+    def run_command(self, cmd: PathLike, capture_output=False) -> str:
+        """
+        Add a command to the batch.
+
+        If capture_output is True, run the batch now and return the command
+        output. Otherwise, defer the command.
+
+        :param cmd: The command to run.
+        :type cmd: PathLike
+        :param capture_output: Should we return the command output?
+        :type capture_output: bool
+        :return: if capture_output is True, return the command output,
+                 otherwise return an empty string.
+        :rtype: str
+        :raise subprocess.CalledprocessorError: if a command fails.
+        """
+        self.__pending.append(os.fspath(cmd))
+        if capture_output:
+            return self.flush()[-1].stdout
+        return ""
+
+    def put(self, src: PathLike, dest: PathLike) -> None:
+        self.flush()
+        self.connection.put(src, dest)
+
+    def get(self, src: PathLike, dest: PathLike) -> None:
+        self.flush()
+        self.connection.get(src, dest)
+
+    def pipe_command(self, cmd: PathLike, stdin: IO[bytes]) -> None:
+        self.flush()
+        self.connection.pipe_command(cmd, stdin)
+
+    @property
+    def address(self) -> tuple[str, int] | None:
+        return self.connection.address
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+
+__all__ = ["CommandBatch", "CommandResult"]
@@ -0,0 +1,177 @@
+import io
+import os
+import errno
+import fcntl
+import shutil
+import threading
+from typing import IO
+from dataclasses import dataclass
+
+from git.types import PathLike
+
+from . import base
+from ..util import run_cmd
+from .. import _log
+
+# ioctl request that shares the source file extents with the destination
+FICLONE = 0x40049409
+
+_CHUNK_SIZE = 2**30
+
+# errno values meaning that a copy method is not available for the files
+_UNSUPPORTED = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP}
+
+
+def _copy_range(src: int, dest: int, size: int, copy) -> bool:
+    offset = 0
+    while offset < size:
+        n = copy(src, dest, min(size - offset, _CHUNK_SIZE), offset)
+        if n == 0:
+            break
+        offset += n
+    return offset == size
+
+
+def copy_file(src: PathLike, dest: PathLike) -> None:
+    """
+    Copy a file with the fastest method the file systems support.
+
+    It tries, in order, to clone the file (reflink), to copy it in the
+    kernel with copy_file_range(2), and to copy it with sendfile(2), and
+    falls back to a regular copy.
+
+    :param src: The source file path.
+    :type src: str | os.PathLike
+    :param dest: The destination file path.
+    :type dest: str | os.PathLike
+    """
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdest:
+        infd, outfd = fsrc.fileno(), fdest.fileno()
+        size = os.fstat(infd).st_size
+
+        try:
+            fcntl.ioctl(outfd, FICLONE, infd)
+            return
+        except OSError as ex:
+            if ex.errno not in _UNSUPPORTED | {errno.ENOTTY, errno.EBADF}:
+                raise
+
+        methods = [
+            lambda i, o, n, off: os.copy_file_range(i, o, n, off, off),
+            lambda i, o, n, off: os.sendfile(o, i, off, n),
+        ]
+        for copy in methods:
+            try:
+                if _copy_range(infd, outfd, size, copy):
+                    return
+            except OSError as ex:
+                if ex.errno not in _UNSUPPORTED:
+                    raise
+            # Start over with the next method
+            os.ftruncate(outfd, 0)
+
+        fsrc.seek(0)
+        fdest.seek(0)
+        shutil.copyfileobj(fsrc, fdest)
+
+
+class Connection(base.Connection):
+    """
+    Run commands in the local machine.
+
+    Commands run in a local shell and transfers are local file copies, so
+    the local machine can be the target host, e.g. when testing inside a
+    virtual machine, without the ssh overhead.
+    """
+
+    def run_command(self, cmd: PathLike, capture_output=False) -> str:
+        """
+        Run a command in the local machine.
+
+        :param cmd: The command to run.
+        :type cmd: PathLike
+        :param capture_output: if True, return the output of the command.
+        :type capture_output: bool
+
+        :return: If capture_output is True, return the command output.
+                 Otherwise, return an empty string.
+        :rtype: str
+
+        :raise subprocess.CalledProcessError: in case a failure to run the command
+        """
+        return run_cmd(os.fspath(cmd), capture_output=capture_output)
+
+    def put(self, src: PathLike, dest: PathLike) -> None:
+        """
+        Copy a file.
+
+        :param src: The path of the source file.
+        :type src: PathLike
+        :param dest: The path of the destiny file.
+        :type dest: PathLike
+        """
+        _log.logger.info(f"Copying {src} to {dest}")
+        copy_file(src, dest)
+
+    def get(self, src: PathLike, dest: PathLike) -> None:
+        """
+        Copy a file.
+
+        :param src: The path of the source file.
+        :type src: PathLike
+        :param dest: The path of the destiny file.
+        :type dest: PathLike
+        """
+        _log.logger.info(f"Copying {src} to {dest}")
+        copy_file(src, dest)
+
+    def pipe_command(self, cmd: PathLike, stdin: IO[bytes]) -> None:
+        """
+        Run a command in the local machine, feeding its standard input from
+        a stream.
+
+        Streams backed by a file descriptor are passed directly to the command.
+
+        :param cmd: The command to run.
+        :type cmd: PathLike
+        :param stdin: The stream to send to the command standard input.
+        :type stdin: IO[bytes]
+
+        :raise subprocess.CalledProcessError: in case a failure to run the command
+        """
+        try:
+            fd = stdin.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            pass
+        else:
+            run_cmd(os.fspath(cmd), stdin=fd)
+            return
+
+        rfd, wfd = os.pipe()
+        writer = threading.Thread(target=self.__feed, args=(stdin, wfd))
+        writer.start()
+        try:
+            run_cmd(os.fspath(cmd), stdin=rfd)
+        finally:
+            os.close(rfd)
+            writer.join()
+
+    @staticmethod
+    def __feed(stdin: IO[bytes], fd: int) -> None:
+        with open(fd, "wb", buffering=0) as pipe:
+            try:
+                shutil.copyfileobj(stdin, pipe)
+            except BrokenPipeError:
+                # The command exited without reading all its input
+                pass
+
+
+@dataclass(frozen=True, slots=True)
+class ConnectionFactory(base.ConnectionFactory):
+    """Factory for the local Connection class."""
+
+    def create_connection(self) -> Connection:
+        return Connection()
+
+
+__all__ = ["Connection", "ConnectionFactory", "copy_file"]
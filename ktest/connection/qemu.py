@@ -0,0 +1,425 @@
+import os
+import time
+import select
+import shlex
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from subprocess import CalledProcessError
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+from git.types import PathLike
+
+from . import base
+from .. import _log
+
+if TYPE_CHECKING:
+    from ..tasks import Build
+
+# The guest mounts the share directory here, on top of a tmpfs /tmp
+GUEST_SHARE = "/tmp/ktest"
+
+_NINEP = "trans=virtio,version=9p2000.L"
+
+# The agent runs each command file written to the share when its number
+# arrives on the virtio serial port, and answers with the exit status.
+_AGENT = f"""#!/bin/sh
+export PATH=/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin
+mount -t sysfs sysfs /sys
+mount -t devtmpfs devtmpfs /dev
+mount -t tmpfs tmpfs /run
+mount -t 9p -o {_NINEP},ro modules /lib/modules
+hostname ktest-qemu
+
+for p in /sys/class/virtio-ports/*; do
+    [ "$(cat "$p/name")" = ktest ] && port="/dev/${{p##*/}}"
+done
+exec 3<>"$port"
+
+echo ready >&3
+while read -r id <&3; do
+    [ "$id" = quit ] && break
+    sh {GUEST_SHARE}/cmd.$id > {GUEST_SHARE}/out.$id 2>&1 < /dev/null
+    echo "$id $?" >&3
+done
+
+sync
+echo o > /proc/sysrq-trigger
+"""
+
+
+@dataclass(frozen=True)
+class QemuConfig:
+    """
+    Hold the virtual machine parameters.
+
+    The guest uses the host root file system, shared read-only over 9p,
+    and the kernel modules from a directory of the host, so the kernel
+    needs CONFIG_NET_9P_VIRTIO, CONFIG_9P_FS, CONFIG_VIRTIO_PCI and
+    CONFIG_VIRTIO_CONSOLE built in.
+
+    Constructor arguments:
+
+        :param kernel: The path to the kernel image, e.g. bzImage.
+        :type kernel: PathLike
+        :param modules: The path to the directory that is mounted as
+                        /lib/modules in the guest.
+        :type modules: PathLike
+        :param qemu: The QEMU system emulator command.
+        :type qemu: str
+        :param machine: The QEMU machine type, if not the default.
+        :type machine: str
+        :param console: The guest console device.
+        :type console: str
+        :param memory: The guest memory size.
+        :type memory: str
+        :param cpus: The number of guest CPUs.
+        :type cpus: int
+        :param cmdline: Additional kernel command line arguments.
+        :type cmdline: str
+        :param kvm: Use KVM. If None, use it when /dev/kvm is accessible,
+                    otherwise fall back to emulation (TCG).
+        :type kvm: bool | None
+        :param boot_timeout: How long, in seconds, to wait for the guest.
+        :type boot_timeout: float
+        :param command_timeout: How long, in seconds, to wait for a command.
+                                The machine is powered off when a command
+                                times out, and booted again by the next one.
+        :type command_timeout: float
+    """
+
+    kernel: PathLike
+    modules: PathLike
+    qemu: str = "qemu-system-x86_64"
+    machine: str = ""
+    console: str = "ttyS0"
+    memory: str = "2G"
+    cpus: int = 2
+    cmdline: str = ""
+    kvm: bool | None = None
+    boot_timeout: float = 300.0
+    command_timeout: float = 3600.0
+
+    @classmethod
+    def from_build(cls, build: "Build", **kwargs) -> "QemuConfig":
+        """
+        Create the configuration to boot the kernel of a Build.
+
+        :param build: The task that builds the kernel.
+        :type build: Build
+        :param kwargs: Extra QemuConfig arguments.
+        :rtype: QemuConfig
+        """
+        staging = build.stage()
+        release = build.artifacts.release
+        kernel = next((staging / "boot").glob(f"vmlinu[xz]-{release}"))
+        return cls(kernel=kernel, modules=staging / "lib" / "modules", **kwargs)
+
+    @property
+    def use_kvm(self) -> bool:
+        """Return True if the guest runs with KVM."""
+        if self.kvm is None:
+            return os.access("/dev/kvm", os.R_OK | os.W_OK)
+        return self.kvm
+
+
+class Connection(base.Connection):
+    """
+    Run commands in a QEMU virtual machine.
+
+    The machine boots the kernel directly, without boot loader, initramfs
+    or install step, the first time the connection is used. Commands run
+    as root through an agent listening on a virtio serial port, one at a
+    time, and files are exchanged through a directory shared over 9p.
+    Closing the connection powers the machine off.
+    """
+
+    def __init__(self, config: QemuConfig) -> None:
+        """
+        :param config: The virtual machine configuration.
+        :type config: QemuConfig
+        """
+        self.config = config
+        self.__lock = threading.Lock()
+        self.__process: subprocess.Popen | None = None
+        self.__channel: socket.socket | None = None
+        self.__buffer = b""
+        self.__dir: tempfile.TemporaryDirectory[str] | None = None
+        self.__count = 0
+
+    @property
+    def share(self) -> Path:
+        """Return the host path of the directory shared with the guest."""
+        assert self.__dir is not None
+        return Path(self.__dir.name) / "share"
+
+    def command_line(self, work_dir: PathLike) -> list[str]:
+        """
+        Return the QEMU command line.
+
+        :param work_dir: The directory with the share directory and the agent
+                         socket.
+        :type work_dir: PathLike
+        :rtype: list[str]
+        """
+        config = self.config
+        work_dir = Path(work_dir)
+        init = (
+            f"mount -t proc proc /proc; mount -t tmpfs tmpfs /tmp; mkdir {GUEST_SHARE};"
+            f" mount -t 9p -o {_NINEP} ktest {GUEST_SHARE};"
+            f" exec /bin/sh {GUEST_SHARE}/init"
+        )
+        append = (
+            f"root=root rootfstype=9p rootflags={_NINEP} ro console={config.console}"
+            f' {config.cmdline} init=/bin/sh -- -c "{init}"'
+        )
+
+        cmd = [config.qemu]
+        if config.machine:
+            cmd += ["-machine", config.machine]
+        if config.use_kvm:
+            cmd += ["-accel", "kvm", "-cpu", "host"]
+        else:
+            cmd += ["-accel", "tcg", "-cpu", "max"]
+
+        for tag, path, mode in (
+            ("root", "/", "on"),
+            ("modules", config.modules, "on"),
+            ("ktest", work_dir / "share", "off"),
+        ):
+            cmd += [
+                "-fsdev",
+                f"local,id={tag},path={path},security_model=none,readonly={mode}",
+                "-device",
+                f"virtio-9p-pci,fsdev={tag},mount_tag={tag}",
+            ]
+
+        return cmd + [
+            "-m",
+            config.memory,
+            "-smp",
+            str(config.cpus),
+            "-kernel",
+            os.fspath(config.kernel),
+            "-append",
+            append,
+            "-chardev",
+            f"socket,id=agent,path={work_dir / 'agent.sock'}",
+            "-device",
+            "virtio-serial-pci",
+            "-device",
+            "virtserialport,chardev=agent,name=ktest",
+            "-display",
+            "none",
+            "-serial",
+            f"file:{work_dir / 'console.log'}",
+            "-no-reboot",
+        ]
+
+    def __start(self) -> None:
+        """Boot the virtual machine and wait for its agent."""
+        if self.__process is not None:
+            return
+
+        self.__dir = tempfile.TemporaryDirectory(prefix="ktest-qemu-")
+        work_dir = Path(self.__dir.name)
+        self.share.mkdir()
+        (self.share / "init").write_text(_AGENT)
+
+        cmd = self.command_line(work_dir)
+        _log.logger.info(f"Running: ${' '.join(cmd)}")
+
+        with socket.socket(socket.AF_UNIX) as server:
+            server.bind(os.fspath(work_dir / "agent.sock"))
+            server.listen(1)
+            server.settimeout(30)
+            self.__process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL)
+            try:
+                self.__channel, _ = server.accept()
+            except OSError:
+                self.__shutdown(kill=True)
+                raise
+
+        try:
+            ready = self.__readline(self.config.boot_timeout)
+        except OSError:
+            ready = ""
+        if ready.strip() != "ready":
+            log = work_dir / "console.log"
+            console = log.read_text(errors="replace") if log.exists() else ""
+            self.__shutdown(kill=True)
+            raise TimeoutError(f"The virtual machine did not boot:\n{console}")
+
+    def __readline(self, timeout: float) -> str:
+        """
+        Read a line from the agent.
+
+        :return: The line, or an empty string if the agent closed the channel.
+        :raise TimeoutError: if there is no full line after timeout seconds.
+        """
+        assert self.__channel is not None
+        deadline = time.monotonic() + timeout
+        poller = select.poll()
+        poller.register(self.__channel, select.POLLIN)
+
+        while b"\n" not in self.__buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not poller.poll(remaining * 1000):
+                raise TimeoutError(f"No answer from the agent in {timeout} seconds")
+            data = self.__channel.recv(4096)
+            if not data:
+                return ""
+            self.__buffer += data
+
+        line, _, self.__buffer = self.__buffer.partition(b"\n")
+        return line.decode(errors="replace") + "\n"
+
+    def run_command(self, cmd: PathLike, capture_output=False) -> str:
+        """
+        Run a command in the virtual machine.
+
+        :param cmd: The command to run.
+        :type cmd: PathLike
+        :param capture_output: if True, return the output of the command.
+        :type capture_output: bool
+
+        :return: If capture_output is True, return the command output.
+                 Otherwise, return an empty string.
+        :rtype: str
+
+        :raise subprocess.CalledProcessError: in case a failure to run the command
+        """
+        _log.logger.info(f"Running: ${cmd}")
+        with self.__lock:
+            self.__start()
+            assert self.__channel is not None
+
+            self.__count += 1
+            n = self.__count
+            (self.share / f"cmd.{n}").write_text(os.fspath(cmd))
+            self.__channel.sendall(f"{n}\n".encode())
+
+            try:
+                answer = self.__readline(self.config.command_timeout).split()
+            except TimeoutError:
+                # The answer could still come later, the agent is out of sync
+                self.__shutdown(kill=True)
+                raise
+            if len(answer) != 2 or answer[0] != str(n):
+                raise ConnectionError("The virtual machine agent stopped")
+
+            output_file = self.share / f"out.{n}"
+            output = output_file.read_text(errors="replace")
+            output_file.unlink()
+            (self.share / f"cmd.{n}").unlink()
+
+        for line in output.splitlines():
+            _log.logger.info(line)
+
+        rc = int(answer[1])
+        if rc:
+            raise CalledProcessError(returncode=rc, cmd=os.fspath(cmd), output=output)
+
+        return output if capture_output else ""
+
+    def put(self, src: PathLike, dest: PathLike) -> None:
+        """
+        Copy a local file to the virtual machine.
+
+        :param src: The path of the local source file.
+        :type src: PathLike
+        :param dest: The path of the destiny file in the virtual machine.
+        :type dest: PathLike
+        """
+        with self.__transfer_file() as name:
+            shutil.copyfile(src, self.share / name)
+            shared = shlex.quote(f"{GUEST_SHARE}/{name}")
+            self.run_command(f"cp {shared} {shlex.quote(os.fspath(dest))}")
+
+    def get(self, src: PathLike, dest: PathLike) -> None:
+        """
+        Copy a file from the virtual machine.
+
+        :param src: The path of the source file in the virtual machine.
+        :type src: PathLike
+        :param dest: The path of the destiny local file.
+        :type dest: PathLike
+        """
+        with self.__transfer_file() as name:
+            shared = shlex.quote(f"{GUEST_SHARE}/{name}")
+            self.run_command(f"cp {shlex.quote(os.fspath(src))} {shared}")
+            shutil.copyfile(self.share / name, dest)
+
+    def __transfer_file(self) -> "_TransferFile":
+        with self.__lock:
+            self.__start()
+            self.__count += 1
+            return _TransferFile(self.share / f"xfer.{self.__count}")
+
+    def close(self) -> None:
+        """Power the virtual machine off."""
+        with self.__lock:
+            self.__shutdown()
+
+    def __shutdown(self, kill=False) -> None:
+        if self.__channel is not None and not kill:
+            try:
+                self.__channel.sendall(b"quit\n")
+            except OSError:
+                kill = True
+
+        if self.__process is not None:
+            if kill:
+                self.__process.kill()
+            try:
+                self.__process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.__process.kill()
+                self.__process.wait()
+
+        if self.__channel is not None:
+            self.__channel.close()
+        if self.__dir is not None:
+            self.__dir.cleanup()
+
+        self.__process = None
+        self.__channel = None
+        self.__buffer = b""
+        self.__dir = None
+
+
+class _TransferFile:
+    """A file in the share directory that is removed after use."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def __enter__(self) -> str:
+        return self.path.name
+
+    def __exit__(self, *args) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+@dataclass(frozen=True, slots=True)
+class ConnectionFactory(base.ConnectionFactory):
+    """
+    Factory for the QEMU Connection class.
+
+    Each connection boots its own virtual machine.
+
+    :param config: a QemuConfig object containing the machine configuration.
+    :type config: QemuConfig
+    """
+
+    config: QemuConfig
+
+    def create_connection(self) -> base.Connection:
+        return Connection(self.config)
+
+
+__all__ = ["Connection", "ConnectionFactory", "QemuConfig"]
@@ -1,16 +1,24 @@
 import os
-from typing import Iterable
+import time
+import asyncio
+import threading
+from typing import IO, Iterable, Iterator
+from contextlib import contextmanager
 from subprocess import CalledProcessError
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 
 import fabric
+import paramiko
 from git.types import PathLike
 from invoke.watchers import StreamWatcher
 from invoke.exceptions import UnexpectedExit
 
 from . import base
+from .transfer import TransferChannel
 from .. import _log
 
+_CHUNK_SIZE = 2**20
+
 
 class OutputLogger(StreamWatcher):
     def submit(self, stream) -> Iterable[str]:
@@ -38,7 +46,14 @@ class HostConfig:
 
 
 class Connection(base.Connection):
-    """Implement a ssh connection object."""
+    """
+    Implement a ssh connection object.
+
+    All commands and transfers share a single authenticated ssh transport,
+    each one on its own channel, so the object can be used from several
+    threads or through the asynchronous API concurrently. The asynchronous
+    commands are driven by the event loop, the transfers run in threads.
+    """
 
     def __init__(self, config: HostConfig) -> None:
         """
@@ -46,6 +61,89 @@ class Connection(base.Connection):
         :type config: HostConfig
         """
         self.__connection = fabric.Connection(**config.__dict__)
+        self.__lock = threading.Lock()
+        self.__usage_lock = threading.Lock()
+        self.__active = 0
+        self.__last_used = time.monotonic()
+
+    def __open(self) -> None:
+        """Open the ssh transport once, even with concurrent callers."""
+        with self.__lock:
+            if not self.__connection.is_connected:
+                self.__connection.open()
+
+    @contextmanager
+    def __use(self) -> Iterator[None]:
+        """Track a command or transfer running on the session."""
+        with self.__usage_lock:
+            self.__active += 1
+        try:
+            yield
+        finally:
+            with self.__usage_lock:
+                self.__active -= 1
+                self.__last_used = time.monotonic()
+
+    @property
+    def idle_time(self) -> float:
+        """
+        The time, in seconds, since the session was last used.
+
+        It is zero while a command or a transfer runs.
+        """
+        with self.__usage_lock:
+            if self.__active:
+                return 0.0
+            return time.monotonic() - self.__last_used
+
+    def __transport(self) -> paramiko.Transport | None:
+        client = self.__connection.client
+        return client.get_transport() if client is not None else None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return str(self.__connection.host), self.__connection.port or 22
+
+    def is_alive(self, timeout: float = 5.0) -> bool:
+        """
+        Check if the ssh session still works.
+
+        :param timeout: How long, in seconds, to wait for the host to answer.
+        :type timeout: float
+        :return: True if a new channel could be opened in the session.
+        :rtype: bool
+        """
+        transport = self.__transport()
+        if transport is None or not transport.is_active():
+            return False
+
+        try:
+            with self.__use():
+                transport.open_session(timeout=timeout).close()
+        except (paramiko.SSHException, EOFError, OSError):
+            return False
+
+        return True
+
+    def close(self) -> None:
+        """
+        Close the ssh session.
+
+        The session is opened again on the next use of the object.
+        """
+        with self.__lock:
+            self.__connection.close()
+        with self.__usage_lock:
+            self.__last_used = time.monotonic()
+
+    def __sftp(self) -> paramiko.SFTPClient:
+        """Open a SFTP session in a new channel of the ssh transport."""
+        self.__open()
+        transport = self.__transport()
+        assert transport is not None
+        sftp = paramiko.SFTPClient.from_transport(transport)
+        assert sftp is not None
+        return sftp
 
     def run_command(self, cmd: PathLike, capture_output=False) -> str:
         """
@@ -63,10 +161,12 @@ class Connection(base.Connection):
         :raise subprocess.CalledProcessError: in case a failure to run the command
         """
         _log.logger.info(f"Running: ${cmd}")
+        self.__open()
         try:
-            r: fabric.Result = self.__connection.run(
-                os.fspath(cmd), echo=True, watchers=(OutputLogger(),)
-            )
+            with self.__use():
+                r: fabric.Result = self.__connection.run(
+                    os.fspath(cmd), echo=True, watchers=(OutputLogger(),)
+                )
         except UnexpectedExit as ex:
             r: fabric.Result = ex.result
             _log.logger.error(r.stderr)
@@ -89,7 +189,11 @@ class Connection(base.Connection):
         _log.logger.info(
             f"Copying {src} to {self.__connection.user}@{self.__connection.host}:{dest}"
         )
-        self.__connection.put(local=src, remote=dest, preserve_mode=False)
+        self.__open()
+        with self.__use():
+            self.__connection.put(
+                local=os.fspath(src), remote=os.fspath(dest), preserve_mode=False
+            )
 
     def get(self, src: PathLike, dest: PathLike) -> None:
         """
@@ -103,7 +207,196 @@ class Connection(base.Connection):
         _log.logger.info(
             f"Copying {self.__connection.user}@{self.__connection.host}:{dest} to {src}"
         )
-        self.__connection.get(local=dest, remote=src, preserve_mode=False)
+        self.__open()
+        with self.__use():
+            self.__connection.get(
+                local=os.fspath(dest), remote=os.fspath(src), preserve_mode=False
+            )
+
+    def pipe_command(self, cmd: PathLike, stdin: IO[bytes]) -> None:
+        """
+        Run a command in the remote host, streaming a local stream to its
+        standard input over the ssh channel.
+
+        :param cmd: The command to run.
+        :type cmd: PathLike
+        :param stdin: The stream to send to the command standard input.
+        :type stdin: IO[bytes]
+
+        :raise subprocess.CalledProcessError: in case a failure to run the command
+        """
+        _log.logger.info(f"Running: ${cmd}")
+        self.__open()
+        transport = self.__transport()
+        assert transport is not None
+
+        with self.__use(), transport.open_session() as channel:
+            channel.set_combine_stderr(True)
+            channel.exec_command(os.fspath(cmd))
+
+            reader = threading.Thread(target=self.__log_channel, args=(channel,))
+            reader.start()
+            try:
+                while data := stdin.read(_CHUNK_SIZE):
+                    channel.sendall(data)
+                channel.shutdown_write()
+            except BaseException:
+                channel.close()
+                raise
+            finally:
+                reader.join()
+
+            rc = channel.recv_exit_status()
+
+        if rc:
+            raise CalledProcessError(returncode=rc, cmd=os.fspath(cmd))
+
+    @staticmethod
+    def __log_channel(channel: paramiko.Channel) -> None:
+        pending = b""
+        while data := channel.recv(_CHUNK_SIZE):
+            *lines, pending = (pending + data).split(b"\n")
+            for line in lines:
+                _log.logger.info(line.decode(errors="replace"))
+        if pending:
+            _log.logger.info(pending.decode(errors="replace"))
+
+    async def arun_command(self, cmd: PathLike, capture_output=False) -> str:
+        """
+        Run a command in the remote host without blocking the event loop.
+
+        The output of the command is read from the event loop, so commands
+        in flight do not hold a thread each. Only opening the channel, one
+        round trip to the host, waits in the default executor.
+
+        :param cmd: The command to run.
+        :type cmd: PathLike
+        :param capture_output: if True, return the output of the command.
+        :type capture_output: bool
+
+        :return: If capture_output is True, return the command output.
+                 Otherwise, return an empty string.
+        :rtype: str
+
+        :raise subprocess.CalledProcessError: in case a failure to run the command
+        """
+        _log.logger.info(f"Running: ${cmd}")
+        with self.__use():
+            return await self.__arun_command(cmd, capture_output)
+
+    async def __arun_command(self, cmd: PathLike, capture_output: bool) -> str:
+        channel = await asyncio.to_thread(self.__exec, cmd)
+        loop = asyncio.get_running_loop()
+        eof = loop.create_future()
+        output = bytearray()
+        pending = b""
+
+        def on_readable() -> None:
+            nonlocal pending
+            while channel.recv_ready():
+                data = channel.recv(_CHUNK_SIZE)
+                output.extend(data)
+                *lines, pending = (pending + data).split(b"\n")
+                for line in lines:
+                    _log.logger.info(line.decode(errors="replace"))
+            if channel.eof_received and not eof.done():
+                eof.set_result(None)
+
+        fd = channel.fileno()
+        loop.add_reader(fd, on_readable)
+        try:
+            await eof
+            # The channel stays readable after EOF
+            loop.remove_reader(fd)
+            # The exit status follows the end of the output
+            while not channel.exit_status_ready():
+                await asyncio.sleep(0.01)
+        finally:
+            loop.remove_reader(fd)
+            channel.close()
+
+        if pending:
+            _log.logger.info(pending.decode(errors="replace"))
+
+        text = output.decode(errors="replace")
+        rc = channel.recv_exit_status()
+        if rc:
+            raise CalledProcessError(returncode=rc, cmd=os.fspath(cmd), output=text)
+
+        return text if capture_output else ""
+
+    def __exec(self, cmd: PathLike) -> paramiko.Channel:
+        self.__open()
+        transport = self.__transport()
+        assert transport is not None
+        channel = transport.open_session()
+        channel.set_combine_stderr(True)
+        channel.exec_command(os.fspath(cmd))
+        return channel
+
+    async def aput(self, src: PathLike, dest: PathLike) -> None:
+        """
+        Send a file without blocking the event loop.
+
+        Each call uses its own SFTP channel, so transfers run in parallel. The
+        SFTP client is blocking, so each transfer runs in a thread of the
+        default executor.
+
+        :param src: The path of the local source file.
+        :type src: PathLike
+        :param dest: The path of the destiny file in the remote host.
+        :type dest: PathLike
+        """
+        _log.logger.info(
+            f"Copying {src} to {self.__connection.user}@{self.__connection.host}:{dest}"
+        )
+        await asyncio.to_thread(self.__transfer, "put", src, dest)
+
+    async def aget(self, src: PathLike, dest: PathLike) -> None:
+        """
+        Receive a file without blocking the event loop.
+
+        Each call uses its own SFTP channel, so transfers run in parallel. The
+        SFTP client is blocking, so each transfer runs in a thread of the
+        default executor.
+
+        :param scr: The path of the source file in the remote host.
+        :type scr: PathLike
+        :param dest: The path of the destiny local file.
+        :type dest: PathLike
+        """
+        _log.logger.info(
+            f"Copying {self.__connection.user}@{self.__connection.host}:{src} to {dest}"
+        )
+        await asyncio.to_thread(self.__transfer, "get", src, dest)
+
+    def __transfer(self, op: str, src: PathLike, dest: PathLike) -> None:
+        with self.__use(), self.__sftp() as sftp:
+            getattr(sftp, op)(os.fspath(src), os.fspath(dest))
+
+    @contextmanager
+    def transfer_channel(self) -> Iterator[TransferChannel]:
+        """
+        Open a SFTP channel for a worker of the bulk transfer methods.
+
+        Each worker has its own channel, so their requests are pipelined
+        over the ssh session.
+        """
+        with self.__use(), self.__sftp() as sftp:
+            yield _SFTPChannel(sftp)
+
+
+class _SFTPChannel:
+    """Transfer files over a SFTP channel."""
+
+    def __init__(self, sftp: paramiko.SFTPClient) -> None:
+        self.sftp = sftp
+
+    def put(self, src: PathLike, dest: PathLike) -> None:
+        self.sftp.put(os.fspath(src), os.fspath(dest))
+
+    def get(self, src: PathLike, dest: PathLike) -> None:
+        self.sftp.get(os.fspath(src), os.fspath(dest))
 
 
 @dataclass(frozen=True, slots=True)
@@ -119,3 +412,97 @@ class ConnectionFactory(base.ConnectionFactory):
 
     def create_connection(self) -> base.Connection:
         return Connection(self.config)
+
+
+def _pool_key(config: HostConfig) -> tuple:
+    """Key the pool by the HostConfig fields."""
+    key = []
+    for f in fields(config):
+        value = getattr(config, f.name)
+        if isinstance(value, dict):
+            value = tuple(sorted((k, repr(v)) for k, v in value.items()))
+        elif not isinstance(value, (str, int, bool, type(None))):
+            # Configuration and gateway objects are shared by identity
+            value = (type(value).__name__, id(value))
+        key.append(value)
+    return tuple(key)
+
+
+class ConnectionPool:
+    """
+    Keep ssh sessions alive and share them.
+
+    There is a single Connection object per HostConfig. Since Connection
+    multiplexes commands and transfers on channels of one ssh session, the
+    handshake and authentication happen only once per host. Sessions not
+    used for longer than idle_timeout are probed before reuse, and dead
+    sessions, e.g. after a reboot, are transparently opened again.
+    """
+
+    def __init__(self, idle_timeout: float = 30.0, probe_timeout: float = 5.0) -> None:
+        """
+        :param idle_timeout: Idle time, in seconds, after which a session
+                             is probed before it is reused.
+        :type idle_timeout: float
+        :param probe_timeout: How long, in seconds, to wait for a probe answer.
+        :type probe_timeout: float
+        """
+        self.idle_timeout = idle_timeout
+        self.probe_timeout = probe_timeout
+        self.__lock = threading.Lock()
+        self.__connections: dict[tuple, tuple[Connection, threading.Lock]] = {}
+
+    def acquire(self, config: HostConfig) -> Connection:
+        """
+        Return the Connection object for the host.
+
+        :param config: Connection configuration.
+        :type config: HostConfig
+        :rtype: Connection
+        """
+        key = _pool_key(config)
+        with self.__lock:
+            if key not in self.__connections:
+                connection = Connection(config)
+                self.__connections[key] = connection, threading.Lock()
+                return connection
+            connection, probe_lock = self.__connections[key]
+
+        # Probe outside the pool lock, so a dead host does not stall the
+        # others, and once per host: concurrent callers wait for the answer
+        with probe_lock:
+            if connection.idle_time > self.idle_timeout and not connection.is_alive(
+                self.probe_timeout
+            ):
+                _log.logger.info(f"Reconnecting to {config.host}")
+                connection.close()
+
+        return connection
+
+    def close(self) -> None:
+        """Close all sessions."""
+        with self.__lock:
+            for connection, _ in self.__connections.values():
+                connection.close()
+            self.__connections.clear()
+
+
+default_pool = ConnectionPool()
+
+
+@dataclass(frozen=True, slots=True)
+class PooledConnectionFactory(base.ConnectionFactory):
+    """
+    Factory that reuses ssh sessions from a ConnectionPool.
+
+    :param config: a HostConfig object containing the connection configuration.
+    :type config: HostConfig
+    :param pool: The pool of sessions.
+    :type pool: ConnectionPool
+    """
+
+    config: HostConfig
+    pool: ConnectionPool = field(default=default_pool, compare=False)
+
+    def create_connection(self) -> Connection:
+        return self.pool.acquire(self.config)
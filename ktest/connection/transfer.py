@@ -0,0 +1,377 @@
+import os
+import time
+import queue
+import shlex
+import hashlib
+import contextvars
+import threading
+from pathlib import Path, PurePosixPath
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Iterable, Protocol
+
+from git.types import PathLike
+
+from .. import _log
+
+if TYPE_CHECKING:
+    from .base import Connection
+
+# Paths per remote stat, mkdir or touch command, to stay well below the
+# argument size limit
+_STAT_CHUNK = 512
+
+
+class TransferChannel(Protocol):
+    """The file transfer methods of a Connection."""
+
+    def put(self, src: PathLike, dest: PathLike) -> None:
+        """Copy a local file to the host."""
+
+    def get(self, src: PathLike, dest: PathLike) -> None:
+        """Copy a file from the host to the local machine."""
+
+
+@dataclass
+class TransferStats:
+    """
+    The progress of a bulk transfer.
+
+    Constructor arguments:
+
+        :param total_files: The number of files to transfer.
+        :type total_files: int
+        :param total_bytes: The number of bytes to transfer.
+        :type total_bytes: int
+        :param files: The number of files transferred so far.
+        :type files: int
+        :param bytes: The number of bytes transferred so far.
+        :type bytes: int
+        :param skipped: The number of files skipped because they were up to date.
+        :type skipped: int
+        :param elapsed: The elapsed time in seconds.
+        :type elapsed: float
+    """
+
+    total_files: int = 0
+    total_bytes: int = 0
+    files: int = 0
+    bytes: int = 0
+    skipped: int = 0
+    elapsed: float = 0.0
+    lock: threading.Lock = field(
+        default_factory=threading.Lock, init=False, repr=False, compare=False
+    )
+
+    @property
+    def throughput(self) -> float:
+        """Return the transfer rate in bytes per second."""
+        return self.bytes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.files}/{self.total_files} files, "
+            f"{self.bytes / 2**20:.1f}/{self.total_bytes / 2**20:.1f} MiB, "
+            f"{self.skipped} up to date, {self.throughput / 2**20:.1f} MiB/s"
+        )
+
+
+ProgressType = Callable[[TransferStats], None]
+
+# A file size and modification time in whole seconds
+_Stat = tuple[int, int]
+
+
+def _pairs(files: Iterable[tuple[PathLike, PathLike]]) -> list[tuple[str, str]]:
+    return [(os.fspath(src), os.fspath(dest)) for src, dest in files]
+
+
+def _local_stat(path: str) -> _Stat | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, int(st.st_mtime)
+
+
+def remote_stat(connection: "Connection", paths: Iterable[str]) -> dict[str, _Stat]:
+    """
+    Read the size and modification time of files in the host.
+
+    :param connection: A Connection object to the remote peer.
+    :type connection: Connection
+    :param paths: The file paths.
+    :type paths: Iterable[str]
+    :return: A map of the existing paths to their size and modification time.
+    :rtype: dict[str, tuple[int, int]]
+    """
+    paths = list(paths)
+    result: dict[str, _Stat] = {}
+
+    for i in range(0, len(paths), _STAT_CHUNK):
+        end = i + _STAT_CHUNK
+        chunk = " ".join(shlex.quote(p) for p in paths[i:end])
+        output = connection.run_command(
+            f"stat -L -c '%s %Y %n' -- {chunk} 2> /dev/null || true",
+            capture_output=True,
+        )
+        for line in output.splitlines():
+            size, mtime, name = line.split(" ", 2)
+            result[name] = int(size), int(mtime)
+
+    return result
+
+
+def _remote_tree(connection: "Connection", root: str) -> dict[str, _Stat]:
+    """Read the size and modification time of the files under a host directory."""
+    output = connection.run_command(
+        f"find {shlex.quote(root)} -type f -printf '%s %T@ %P\\n' 2> /dev/null || true",
+        capture_output=True,
+    )
+    result: dict[str, _Stat] = {}
+    for line in output.splitlines():
+        size, mtime, name = line.split(" ", 2)
+        result[name] = int(size), int(float(mtime))
+    return result
+
+
+def _local_tree(root: str) -> dict[str, _Stat]:
+    result: dict[str, _Stat] = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            stat = _local_stat(path)
+            if stat is not None:
+                result[os.path.relpath(path, root)] = stat
+    return result
+
+
+def _remote_digests(connection: "Connection", root: str) -> dict[str, str]:
+    output = connection.run_command(
+        f"cd {shlex.quote(root)} 2> /dev/null && "
+        "find . -type f -exec sha256sum {} + || true",
+        capture_output=True,
+    )
+    result = {}
+    for line in output.splitlines():
+        digest, name = line.split(maxsplit=1)
+        result[name.removeprefix("./")] = digest
+    return result
+
+
+def _local_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(2**20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _run_transfers(
+    connection: "Connection",
+    op: str,
+    jobs: list[tuple[str, str, _Stat]],
+    stats: TransferStats,
+    max_workers: int,
+    progress: ProgressType | None,
+) -> None:
+    """Transfer files with a pool of workers, each on its own channel."""
+    pending: queue.SimpleQueue[tuple[str, str, _Stat]] = queue.SimpleQueue()
+    for job in jobs:
+        pending.put(job)
+    start = time.monotonic()
+
+    def worker() -> None:
+        with connection.transfer_channel() as channel:
+            while True:
+                try:
+                    src, dest, (size, _) = pending.get_nowait()
+                except queue.Empty:
+                    return
+                getattr(channel, op)(src, dest)
+                with stats.lock:
+                    stats.files += 1
+                    stats.bytes += size
+                    stats.elapsed = time.monotonic() - start
+                    if progress:
+                        progress(stats)
+
+    workers = max(min(max_workers, len(jobs)), 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Keep the context variables, e.g. the trace span, in the workers
+        futures = [
+            pool.submit(contextvars.copy_context().run, worker) for _ in range(workers)
+        ]
+        for future in futures:
+            future.result()
+
+    stats.elapsed = time.monotonic() - start
+
+
+def _touch(connection: "Connection", jobs: list[tuple[str, str, _Stat]]) -> None:
+    """Give the host files the modification time of their sources."""
+    for i in range(0, len(jobs), _STAT_CHUNK):
+        end = i + _STAT_CHUNK
+        by_mtime: dict[int, list[str]] = {}
+        for _, dest, (_, mtime) in jobs[i:end]:
+            by_mtime.setdefault(mtime, []).append(shlex.quote(dest))
+
+        batch = connection.batch()
+        for mtime, paths in by_mtime.items():
+            batch.run_command(f"touch -m -d @{mtime} -- {' '.join(paths)}")
+        batch.flush()
+
+
+def _mkdir(connection: "Connection", dirs: list[str]) -> None:
+    """Create directories in the host."""
+    for i in range(0, len(dirs), _STAT_CHUNK):
+        end = i + _STAT_CHUNK
+        chunk = " ".join(shlex.quote(d) for d in dirs[i:end])
+        connection.run_command(f"mkdir -p -- {chunk}")
+
+
+def put_many(
+    connection: "Connection",
+    files: Iterable[tuple[PathLike, PathLike]],
+    max_workers: int = 4,
+    progress: ProgressType | None = None,
+    skip_unchanged=True,
+) -> TransferStats:
+    """Implement Connection.put_many()."""
+    pairs = _pairs(files)
+    existing = remote_stat(connection, (d for _, d in pairs)) if skip_unchanged else {}
+
+    stats = TransferStats()
+    jobs = []
+    for src, dest in pairs:
+        stat = _local_stat(src)
+        if stat is None:
+            raise FileNotFoundError(src)
+        if existing.get(dest) == stat:
+            stats.skipped += 1
+        else:
+            jobs.append((src, dest, stat))
+
+    _transfer(connection, "put", jobs, stats, max_workers, progress)
+    return stats
+
+
+def get_many(
+    connection: "Connection",
+    files: Iterable[tuple[PathLike, PathLike]],
+    max_workers: int = 4,
+    progress: ProgressType | None = None,
+    skip_unchanged=True,
+) -> TransferStats:
+    """Implement Connection.get_many()."""
+    pairs = _pairs(files)
+    sources = remote_stat(connection, (s for s, _ in pairs))
+
+    stats = TransferStats()
+    jobs = []
+    for src, dest in pairs:
+        if src not in sources:
+            raise FileNotFoundError(src)
+        if skip_unchanged and _local_stat(dest) == sources[src]:
+            stats.skipped += 1
+        else:
+            jobs.append((src, dest, sources[src]))
+
+    _transfer(connection, "get", jobs, stats, max_workers, progress)
+    return stats
+
+
+def _transfer(
+    connection: "Connection",
+    op: str,
+    jobs: list[tuple[str, str, _Stat]],
+    stats: TransferStats,
+    max_workers: int,
+    progress: ProgressType | None,
+) -> None:
+    stats.total_files = len(jobs)
+    stats.total_bytes = sum(size for _, _, (size, _) in jobs)
+
+    if op == "put":
+        _mkdir(
+            connection, sorted({str(PurePosixPath(dest).parent) for _, dest, _ in jobs})
+        )
+    else:
+        for _, dest, _ in jobs:
+            Path(dest).parent.mkdir(parents=True, exist_ok=True)
+
+    if jobs:
+        _run_transfers(connection, op, jobs, stats, max_workers, progress)
+
+    if op == "put":
+        if jobs:
+            _touch(connection, jobs)
+    else:
+        for _, dest, (_, mtime) in jobs:
+            os.utime(dest, (mtime, mtime))
+
+    _log.logger.info(f"Transfer done: {stats}")
+
+
+def sync_dir(
+    connection: "Connection",
+    src: PathLike,
+    dest: PathLike,
+    upload=True,
+    max_workers: int = 4,
+    progress: ProgressType | None = None,
+    checksum=False,
+) -> TransferStats:
+    """Implement Connection.sync_dir()."""
+    src, dest = os.fspath(src), os.fspath(dest)
+
+    if upload:
+        sources = _local_tree(src)
+        existing = _remote_tree(connection, dest)
+    else:
+        sources = _remote_tree(connection, src)
+        existing = _local_tree(dest)
+
+    if checksum:
+        if upload:
+            local, remote = src, dest
+        else:
+            local, remote = dest, src
+        remote_digests = _remote_digests(connection, remote)
+        unchanged = {
+            name
+            for name in sources.keys() & existing.keys()
+            if sources[name][0] == existing[name][0]
+            and remote_digests.get(name) == _local_digest(os.path.join(local, name))
+        }
+    else:
+        unchanged = {
+            name for name, stat in sources.items() if existing.get(name) == stat
+        }
+
+    stats = TransferStats(skipped=len(unchanged))
+    jobs = [
+        (
+            os.path.join(src, name),
+            str(PurePosixPath(dest, name)) if upload else os.path.join(dest, name),
+            stat,
+        )
+        for name, stat in sorted(sources.items())
+        if name not in unchanged
+    ]
+
+    _transfer(
+        connection, "put" if upload else "get", jobs, stats, max_workers, progress
+    )
+    return stats
+
+
+__all__ = [
+    "ProgressType",
+    "TransferChannel",
+    "TransferStats",
+    "get_many",
+    "put_many",
+    "remote_stat",
+    "sync_dir",
+]
@@ -1,17 +1,26 @@
 import platform
 import os
+import copy
+import time
+import dataclasses
+import threading
 from typing import Protocol
 from tempfile import TemporaryDirectory, gettempdir
 from dataclasses import dataclass
 from graphlib import TopologicalSorter
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from git.repo import Repo
 from git.types import PathLike
 
 from .connection.base import FactoryType, NullFactory, Connection
+from .scheduler import ExecutorType, run_graph
 from .util import expd
-from .make import Make
+from .make import Make, CompilerCache
+from .trace import Tracer, TracedConnection
+from .journal import Journal
+from . import facts, reboot
 from ._log import logger
 
 
@@ -37,6 +46,9 @@ class Context:
         arch=platform.machine(),
         temp_dir: PathLike = gettempdir(),
         build_dir: PathLike | None = None,
+        compiler_cache: CompilerCache | None = None,
+        tracer: Tracer | None = None,
+        journal: Journal | None = None,
     ) -> None:
         """
         :param repo: Kernel git repository.
@@ -49,15 +61,29 @@ class Context:
         :type temp_dir: str | os.PathLike
         :param build_dir: The path to the output binary directory (equals to `make O=`)
         :type build_dir: str | os.PathLike | None
+        :param compiler_cache: Compile through this compiler cache. If it has no
+                               cache directory, use one inside temp_dir.
+        :type compiler_cache: CompilerCache | None
+        :param tracer: Record the timing and resource usage of the tasks.
+        :type tracer: Tracer | None
+        :param journal: Record the completed tasks, and skip the tasks
+                        completed by a previous run with the same inputs.
+        :type journal: Journal | None
         """
         self.__temp_dir = Path(expd(temp_dir))
         self.__temp_dir.mkdir(parents=True, exist_ok=True)
 
         self.repo = repo
+        # GitPython Repo objects are not thread safe
+        self.repo_lock = threading.RLock()
 
         self.__connection_factory = connection_factory
         self.__connection: Connection | None = None
-        self.__graph: TopologicalSorter[TaskInterface] = TopologicalSorter()
+        # A TopologicalSorter runs only once, so keep the edges to build one
+        # on every run
+        self.__graph: dict[TaskInterface, list[TaskInterface]] = {}
+        self.tracer = tracer
+        self.journal = journal
 
         if build_dir:
             build_dir = expd(build_dir)
@@ -66,9 +92,17 @@ class Context:
         else:
             self.__build_dir = TemporaryDirectory(dir=self.__temp_dir)
 
+        if compiler_cache and compiler_cache.cache_dir is None:
+            compiler_cache = dataclasses.replace(
+                compiler_cache, cache_dir=self.__temp_dir / compiler_cache.name
+            )
+
         assert isinstance(self.repo.working_dir, (os.PathLike, str))
         self.make = Make(
-            srcdir=self.repo.working_dir, outdir=self.__build_dir.name, arch=arch
+            srcdir=self.repo.working_dir,
+            outdir=self.__build_dir.name,
+            arch=arch,
+            compiler_cache=compiler_cache,
         )
 
         logger.info(f"Source directory: {self.repo.working_dir}")
@@ -84,13 +118,39 @@ class Context:
         """
         if self.__connection is None:
             self.__connection = self.__connection_factory()
+            if self.tracer:
+                self.__connection = TracedConnection(self.__connection, self.tracer)
         return self.__connection
 
+    @property
+    def temp_dir(self) -> Path:
+        """Return the root temporary directory."""
+        return self.__temp_dir
+
     @property
     def build_dir(self) -> Path:
         """Return the build directory."""
         return Path(self.__build_dir.name)
 
+    def fork(self, connection_factory: FactoryType) -> "Context":
+        """
+        Create a Context for another target host.
+
+        The new Context shares the repository, the build and temporary
+        directories and the make wrapper, but has its own connection and an
+        empty task graph.
+
+        :param connection_factory: A factory of Connection objects to the host.
+        :type connection_factory: FactoryType
+        :return: The new Context object.
+        :rtype: Context
+        """
+        ctx = copy.copy(self)
+        ctx.__connection_factory = connection_factory
+        ctx.__connection = None
+        ctx.__graph = {}
+        return ctx
+
     def add_dependencies(
         self, task: TaskInterface, *dependencies: TaskInterface
     ) -> None:
@@ -103,21 +163,121 @@ class Context:
         :param dependencies: A List of tasks that task depends on.
         :type dependencies: list[Task]
         """
-        self.__graph.add(task, *dependencies)
+        self.__graph.setdefault(task, []).extend(dependencies)
 
     def create_temp_dir(self) -> TemporaryDirectory[str]:
         """Create a new temporary directory."""
         return TemporaryDirectory(dir=self.__temp_dir)
 
-    def reboot(self) -> None:
-        """Reboot the remote machine."""
-        self.connection.run_command("reboot")
+    def reboot(
+        self,
+        wait=False,
+        release: str | None = None,
+        method="reboot",
+        timeout: float = 600.0,
+    ) -> None:
+        """
+        Reboot the remote machine.
+
+        :param wait: Wait until the host is back, checking that it actually
+                     rebooted by comparing its boot id.
+        :type wait: bool
+        :param release: If set, check that the host runs this kernel release
+                        after the reboot. Implies wait.
+        :type release: str | None
+        :param method: "reboot" for a full reboot, or "kexec" to boot the
+                       kernel loaded with kexec, skipping the firmware.
+        :type method: str
+        :param timeout: How long, in seconds, to wait for the host.
+        :type timeout: float
+        :raise ValueError: if the reboot method is unknown.
+        :raise TimeoutError: if the host is not back in time.
+        :raise RuntimeError: if the host runs another kernel release.
+        """
+        if method not in reboot.REBOOT_COMMANDS:
+            raise ValueError(f"Unknown reboot method: {method}")
+
+        wait = wait or release is not None
+        connection = self.connection
+        boot_id = facts.facts(connection).boot_id if wait else ""
+        address = connection.address
+        facts.invalidate(connection)
+
+        # Let the command return before the connection drops
+        cmd = reboot.REBOOT_COMMANDS[method]
+        connection.run_command(f"nohup sh -c 'sleep 1; {cmd}' > /dev/null 2>&1 &")
+        connection.close()
         self.__connection = None
+        if wait:
+            self.wait_for_boot(boot_id, address, release, timeout)
+
+    def wait_for_boot(
+        self,
+        boot_id: str,
+        address: tuple[str, int] | None,
+        release: str | None = None,
+        timeout: float = 600.0,
+    ) -> None:
+        """
+        Wait until the remote machine is back from a reboot.
+
+        :param boot_id: The boot id of the host before the reboot.
+        :type boot_id: str
+        :param address: The host address, as in Connection.address.
+        :type address: tuple[str, int] | None
+        :param release: If set, check that the host runs this kernel release.
+        :type release: str | None
+        :param timeout: How long, in seconds, to wait for the host.
+        :type timeout: float
+        :raise TimeoutError: if the host is not back in time.
+        :raise RuntimeError: if the host runs another kernel release.
+        """
 
-    def run(self) -> None:
-        """Run all tasks in proper order."""
-        for t in self.__graph.static_order():
-            t()
+        def connect() -> Connection:
+            self.__connection = None
+            return self.connection
+
+        start = time.monotonic()
+        reboot.wait_for_reboot(connect, address, boot_id, timeout)
+        running = facts.facts(self.connection).kernel_release
+        logger.info(f"Rebooted in {time.monotonic() - start:.1f}s into {running}")
+
+        if release is not None and running != release:
+            raise RuntimeError(f"Host runs kernel {running}, expected {release}")
+
+    def run(
+        self, max_workers: int = 1, executor: ExecutorType = ThreadPoolExecutor
+    ) -> None:
+        """
+        Run all tasks in proper order.
+
+        With max_workers greater than one, independent tasks run concurrently.
+        If a task fails, the tasks that depend on it do not run.
+
+        With a journal, a task that completed in a previous run with the
+        same inputs is resumed from its recorded state instead of executed,
+        so a run that failed late can be restarted without redoing the
+        earlier tasks.
+
+        :param max_workers: The maximum number of tasks running at the same time.
+        :type max_workers: int
+        :param executor: The executor class used to run the tasks. The tasks
+                         share this Context, its repository and its
+                         connection, and record their results in it, so it
+                         must run them in threads of this process.
+        :type executor: ExecutorType
+
+        :raise ValueError: if executor is a ProcessPoolExecutor.
+        """
+        if isinstance(executor, type) and issubclass(executor, ProcessPoolExecutor):
+            raise ValueError("Tasks cannot run in a process pool")
+
+        graph = TopologicalSorter(self.__graph)
+        if max_workers <= 1:
+            for t in graph.static_order():
+                t()
+        else:
+            run_graph(graph, max_workers=max_workers, executor=executor)
 
 
 __all__ = ["Context"]
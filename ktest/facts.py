@@ -0,0 +1,160 @@
+import threading
+from dataclasses import dataclass, field
+from weakref import WeakKeyDictionary
+
+from .connection.base import Connection
+from .connection.batch import CommandBatch
+from .trace import TracedConnection
+from . import package as pkg
+
+ENTRIES_DIR = "/boot/loader/entries"
+
+
+@dataclass(frozen=True)
+class Facts:
+    """
+    Boot related facts of a host.
+
+    Constructor arguments:
+
+        :param machine_id: The content of /etc/machine-id.
+        :type machine_id: str
+        :param boot_id: The random identifier of the current boot.
+        :type boot_id: str
+        :param kernel_release: The release of the running kernel.
+        :type kernel_release: str
+        :param default_kernel: The path of the default kernel.
+        :type default_kernel: str
+        :param default_title: The title of the default kernel.
+        :type default_title: str
+        :param entries: A map of the boot loader entry names, i.e. the entry
+                        file names without the .conf suffix, to their titles.
+        :type entries: dict[str, str]
+    """
+
+    machine_id: str = ""
+    boot_id: str = ""
+    kernel_release: str = ""
+    default_kernel: str = ""
+    default_title: str = ""
+    entries: dict[str, str] = field(default_factory=dict)
+
+
+_lock = threading.Lock()
+_facts: WeakKeyDictionary[Connection, Facts] = WeakKeyDictionary()
+_link_speeds: WeakKeyDictionary[Connection, float] = WeakKeyDictionary()
+
+
+def _key(connection: Connection) -> Connection:
+    """Return the connection to the host behind batches and tracers."""
+    while isinstance(connection, (CommandBatch, TracedConnection)):
+        connection = connection.connection
+    return connection
+
+
+def _parse_entries(output: str) -> dict[str, str]:
+    entries = {}
+    for line in output.splitlines():
+        path, sep, title = line.partition(":title ")
+        if sep:
+            name = path.rpartition("/")[2].removesuffix(".conf")
+            entries[name] = title.strip()
+    return entries
+
+
+def gather(connection: Connection) -> Facts:
+    """
+    Read the facts of a host in a single round trip.
+
+    Facts that cannot be read, e.g. because grubby is not installed, are
+    left empty.
+
+    :param connection: A Connection object to the remote peer.
+    :type connection: Connection
+    :rtype: Facts
+    """
+    batch = connection.batch()
+    for cmd in (
+        "cat /etc/machine-id",
+        "cat /proc/sys/kernel/random/boot_id",
+        "uname -r",
+        "grubby --default-kernel",
+        "grubby --default-title",
+        f"grep -H '^title ' {ENTRIES_DIR}/*.conf",
+    ):
+        batch.run_command(cmd)
+
+    machine_id, boot_id, release, kernel, title, entries = (
+        r.stdout if r.returncode == 0 else "" for r in batch.flush(check=False)
+    )
+    return Facts(
+        machine_id=machine_id.strip(),
+        boot_id=boot_id.strip(),
+        kernel_release=release.strip(),
+        default_kernel=kernel.strip(),
+        default_title=title.strip(),
+        entries=_parse_entries(entries),
+    )
+
+
+def facts(connection: Connection) -> Facts:
+    """
+    Return the facts of a host, gathering them on first use.
+
+    The facts are cached per connection until invalidate() is called.
+
+    :param connection: A Connection object to the remote peer.
+    :type connection: Connection
+    :rtype: Facts
+    """
+    key = _key(connection)
+    with _lock:
+        cached = _facts.get(key)
+    if cached is not None:
+        return cached
+
+    result = gather(connection)
+    with _lock:
+        _facts[key] = result
+    return result
+
+
+def invalidate(connection: Connection) -> None:
+    """
+    Forget the cached facts of a host.
+
+    Call it after changing the boot configuration or rebooting the host.
+
+    :param connection: A Connection object to the remote peer.
+    :type connection: Connection
+    """
+    with _lock:
+        _facts.pop(_key(connection), None)
+
+
+def link_speed(connection: Connection) -> float:
+    """
+    Return the upload speed to a host, measuring it on first use.
+
+    The speed is cached per connection. Unlike the facts, it is kept by
+    invalidate(), as changing the boot configuration or rebooting the host
+    does not change the link.
+
+    :param connection: A Connection object to the remote peer.
+    :type connection: Connection
+    :return: The link speed in bytes per second.
+    :rtype: float
+    """
+    key = _key(connection)
+    with _lock:
+        cached = _link_speeds.get(key)
+    if cached is not None:
+        return cached
+
+    result = pkg.link_speed(connection)
+    with _lock:
+        _link_speeds[key] = result
+    return result
+
+
+__all__ = ["Facts", "facts", "gather", "invalidate", "link_speed"]
@@ -0,0 +1,132 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Mapping
+
+from .connection.base import FactoryType
+from .connection import ssh
+from .context import Context
+from ._log import logger
+
+SetupType = Callable[[Context], None]
+
+
+@dataclass(frozen=True)
+class HostResult:
+    """
+    The outcome of running the task graph in a host.
+
+    Constructor arguments:
+
+        :param host: The host name.
+        :type host: str
+        :param elapsed: The time, in seconds, it took to run the host tasks.
+        :type elapsed: float
+        :param error: The exception raised by the host tasks, if any.
+        :type error: BaseException | None
+    """
+
+    host: str
+    elapsed: float
+    error: BaseException | None = None
+
+    @property
+    def ok(self) -> bool:
+        """Return True if all tasks succeeded in the host."""
+        return self.error is None
+
+
+class Fleet:
+    """
+    Run a task graph across a fleet of target hosts.
+
+    The tasks of the parent Context, typically the kernel Build, run only
+    once. Then every host gets its own Context, created with Context.fork(),
+    that shares the repository and the build directory but owns its
+    connection and task graph. The setup callable populates the host graph,
+    e.g. with an Install task for the shared Build::
+
+        build = Build(ctx)
+        fleet = Fleet(ctx, {"a": factory_a, "b": factory_b}, max_hosts=2)
+        results = fleet.run(lambda host_ctx: Install(build, ctx=host_ctx))
+    """
+
+    def __init__(
+        self,
+        ctx: Context,
+        hosts: Mapping[str, FactoryType],
+        max_hosts: int | None = None,
+    ) -> None:
+        """
+        :param ctx: The parent Context.
+        :type ctx: Context
+        :param hosts: A map of host names to Connection factories.
+        :type hosts: Mapping[str, FactoryType]
+        :param max_hosts: The maximum number of hosts handled at the same time.
+                          If None, all hosts run at once.
+        :type max_hosts: int | None
+        """
+        self.ctx = ctx
+        self.hosts = dict(hosts)
+        self.max_hosts = max_hosts or max(len(self.hosts), 1)
+
+    @classmethod
+    def from_configs(
+        cls, ctx: Context, configs: Iterable[ssh.HostConfig], **kwargs
+    ) -> "Fleet":
+        """
+        Create a Fleet of ssh hosts.
+
+        :param ctx: The parent Context.
+        :type ctx: Context
+        :param configs: The connection configuration of each host.
+        :type configs: Iterable[HostConfig]
+        :param kwargs: Extra arguments to the Fleet constructor.
+        :return: The new Fleet object.
+        :rtype: Fleet
+        """
+        return cls(ctx, {c.host: ssh.ConnectionFactory(c) for c in configs}, **kwargs)
+
+    def run(self, setup: SetupType, max_workers: int = 1) -> dict[str, HostResult]:
+        """
+        Run the parent tasks, then the host tasks in every host.
+
+        A failure in the parent tasks is raised. A failure in a host only
+        stops that host and is reported in its result. Every call runs the
+        tasks again, with a new host Context per host.
+
+        :param setup: A callable that receives the host Context and adds
+                      the tasks to run in the host.
+        :type setup: SetupType
+        :param max_workers: The maximum number of tasks running at the same
+                            time in each host.
+        :type max_workers: int
+        :return: A map of host names to their results.
+        :rtype: dict[str, HostResult]
+        """
+        self.ctx.run(max_workers=max_workers)
+
+        with ThreadPoolExecutor(max_workers=self.max_hosts) as pool:
+            futures = {
+                host: pool.submit(self.__run_host, host, factory, setup, max_workers)
+                for host, factory in self.hosts.items()
+            }
+            return {host: f.result() for host, f in futures.items()}
+
+    def __run_host(
+        self, host: str, factory: FactoryType, setup: SetupType, max_workers: int
+    ) -> HostResult:
+        start = time.monotonic()
+        try:
+            ctx = self.ctx.fork(factory)
+            setup(ctx)
+            ctx.run(max_workers=max_workers)
+        except Exception as ex:
+            logger.error(f"{host}: {ex}")
+            return HostResult(host, time.monotonic() - start, ex)
+
+        logger.info(f"{host}: done")
+        return HostResult(host, time.monotonic() - start)
+
+
+__all__ = ["Fleet", "HostResult", "SetupType"]
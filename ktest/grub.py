@@ -1,4 +1,5 @@
 from .connection.base import Connection
+from . import facts
 
 
 def grub2reboot(connection: Connection, title: str) -> None:
@@ -13,6 +14,18 @@ def grub2reboot(connection: Connection, title: str) -> None:
     connection.run_command(f"grub2reboot '{title}'")
 
 
+def cancel_reboot(connection: Connection) -> None:
+    """
+    Forget the entry selected with grub2reboot for the next boot.
+
+    Booting without the boot loader, e.g. with kexec, leaves it selected.
+
+    :param connection: A Connection object to the remote peer.
+    :type connection: Connection
+    """
+    connection.run_command("grub2-editenv - unset next_entry")
+
+
 def title(connection: Connection, kernel_version: str) -> str:
     """
     Get the kernel GRUB menu title from the kernel version.
@@ -25,17 +38,17 @@ def title(connection: Connection, kernel_version: str) -> str:
     :return: The GRUB title entry.
     :rtype: str
     """
-    machine_id = connection.run_command(
-        "cat /etc/machine-id", capture_output=True
-    ).removesuffix("\n")
+    host = facts.facts(connection)
+    name = f"{host.machine_id}-{kernel_version}"
+    if name in host.entries:
+        return host.entries[name]
 
+    entry = f"{facts.ENTRIES_DIR}/$(cat /etc/machine-id)-{kernel_version}.conf"
     return " ".join(
-        connection.run_command(
-            f"grep -F title /boot/loader/entries/{machine_id}-{kernel_version}.conf"
-        )
+        connection.run_command(f'grep -F title "{entry}"', capture_output=True)
         .rstrip("\n")
         .split()[1:]
     )
 
 
-__all__ = ["grub2reboot", "title"]
+__all__ = ["cancel_reboot", "grub2reboot", "title"]
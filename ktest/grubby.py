@@ -1,6 +1,7 @@
 import dataclasses
 
 from .connection.base import Connection
+from . import facts
 
 
 @dataclasses.dataclass(frozen=True)
@@ -25,6 +26,7 @@ class Grubby:
         make_default=False,
         copy_default=True,
         title="",
+        initrd="",
     ) -> None:
         """
         Add a new kernel entry.
@@ -38,9 +40,13 @@ class Grubby:
         :type copy_default: bool
         :param title: The GRUB menu kernel title.
         :type title: str
+        :param initrd: The path to the initramfs image.
+        :type initrd: str
         """
         cmdline = f"grubby --add-kernel={self.kernel_version}"
 
+        if initrd:
+            cmdline += f" --initrd={initrd}"
         if args:
             cmdline += f" --args='{args}'"
         if make_default:
@@ -51,6 +57,7 @@ class Grubby:
             cmdline += f" --title='{title}'"
 
         self.connection.run_command(cmdline)
+        facts.invalidate(self.connection)
 
     def add_args(self, args="") -> None:
         """
@@ -62,6 +69,7 @@ class Grubby:
         self.connection.run_command(
             f"grubby --update-kernel={self.kernel_version} --args='{args}'"
         )
+        facts.invalidate(self.connection)
 
     def remove_args(self, args="") -> None:
         """
@@ -73,10 +81,31 @@ class Grubby:
         self.connection.run_command(
             f"grubby --update-kernel={self.kernel_version} --remove-args='{args}'"
         )
+        facts.invalidate(self.connection)
 
     def remove_kernel(self) -> None:
         """Remove the kernel entry."""
         self.connection.run_command(f"grubby --remove-kernel={self.kernel_version}")
+        facts.invalidate(self.connection)
+
+    @property
+    def cmdline(self) -> str:
+        """
+        Return the kernel command line of the entry, including the root device.
+
+        :rtype: str
+        """
+        info = {}
+        for line in self.connection.run_command(
+            f"grubby --info={self.kernel_version}", capture_output=True
+        ).splitlines():
+            key, sep, value = line.partition("=")
+            if sep:
+                info[key] = value.strip('"')
+
+        root = info.get("root")
+        args = info.get("args", "")
+        return f"root={root} {args}" if root else args
 
     @property
     def defaut_kernel(self) -> str:
@@ -85,9 +114,7 @@ class Grubby:
 
         :rtype: str
         """
-        return self.connection.run_command(
-            "grubby --default-kernel", capture_output=True
-        ).rstrip("\n")
+        return facts.facts(self.connection).default_kernel
 
     @property
     def default_title(self) -> str:
@@ -96,9 +123,7 @@ class Grubby:
 
         :rtype: str
         """
-        return self.connection.run_command(
-            "grubby --default-title", capture_output=True
-        ).rstrip("\n")
+        return facts.facts(self.connection).default_title
 
 
 __all__ = ["Grubby"]
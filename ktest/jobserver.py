@@ -0,0 +1,211 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from git.types import PathLike
+
+from .util import expd
+
+
+class JobServer:
+    """
+    A GNU make jobserver shared by the make invocations of the machine.
+
+    The jobserver is a named FIFO holding one token per job slot. Every
+    parallel make joins it through MAKEFLAGS instead of running its own -j
+    pool, so concurrent builds, e.g. of several Contexts, configurations,
+    architectures or ktest processes using the same path, run at most
+    `slots` jobs in total.
+
+    The first process opening the FIFO fills it with `slots` tokens, and
+    the others join its pool, whatever their own slots. The tokens only
+    live while a process keeps the FIFO open: once the last one closes it,
+    the next one fills it again.
+
+    Each make invocation has an implicit slot for its first job, so a
+    token is taken from the pool before make starts, and given back when it
+    exits. A make invocation with a weight reserves that many tokens up
+    front, and gets a private jobserver with them: it runs up to weight
+    jobs, whatever the other builds do.
+
+    A make killed in the middle of a build, e.g. with SIGKILL, does not give
+    back the tokens of its running jobs, and the pool runs with fewer slots
+    until every process using it has closed it, or until reseed() is called.
+    """
+
+    _default: "JobServer | None" = None
+    _default_lock = threading.Lock()
+
+    def __init__(
+        self,
+        slots: int | None = None,
+        max_load: float | None = None,
+        path: PathLike = "~/.cache/ktest/jobserver",
+        fifo_auth: bool = False,
+    ):
+        """
+        :param slots: The maximum number of jobs, if the pool is filled by
+                      this process. Defaults to the CPU count.
+        :type slots: int | None
+        :param max_load: If set, make does not start new jobs while the load
+                         average is above it (`make -l`), but always runs at
+                         least one.
+        :type max_load: float | None
+        :param path: The path to the FIFO of the pool. A lock file and a file
+                     holding the number of slots are created next to it.
+        :type path: PathLike
+        :param fifo_auth: Pass the FIFO path to make instead of file
+                          descriptors (`--jobserver-auth=fifo:PATH`), which
+                          needs make 4.4 or later.
+        :type fifo_auth: bool
+        """
+        self.slots = slots or os.cpu_count() or 1
+        self.max_load = max_load
+        self.path = Path(expd(path))
+        self.fifo_auth = fifo_auth
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.__open()
+        # Reserve the tokens of a weight at once, so concurrent reservations
+        # do not each hold part of the tokens they wait for
+        self.__reserve_lock = threading.Lock()
+
+    def __open(self) -> None:
+        # Every process holds a shared lock on the users file while it has the
+        # FIFO open, so the first one can tell it has to fill the pool
+        lock = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                os.mkfifo(self.path, 0o600)
+            except FileExistsError:
+                pass
+            # Opening a FIFO read-write does not wait for a peer on Linux
+            self.__read = os.open(self.path, os.O_RDWR)
+            self.__write = os.open(self.path, os.O_RDWR)
+            self.__users = os.open(f"{self.path}.users", os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(self.__users, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.slots = int(os.pread(self.__users, 32, 0) or self.slots)
+            else:
+                self.reseed()
+            fcntl.flock(self.__users, fcntl.LOCK_SH)
+        finally:
+            os.close(lock)
+
+    @classmethod
+    def default(cls) -> "JobServer":
+        """Return the jobserver shared by the Make objects without their own."""
+        with cls._default_lock:
+            if cls._default is None:
+                cls._default = cls()
+            return cls._default
+
+    def reseed(self) -> None:
+        """
+        Fill the pool again with `slots` tokens.
+
+        The tokens held by running make invocations are lost, so only call it
+        when no build uses the pool, e.g. after a make was killed.
+        """
+        os.set_blocking(self.__read, False)
+        try:
+            while os.read(self.__read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        finally:
+            os.set_blocking(self.__read, True)
+        os.ftruncate(self.__users, 0)
+        os.pwrite(self.__users, str(self.slots).encode(), 0)
+        os.write(self.__write, b"+" * self.slots)
+
+    def acquire(self, n: int = 1) -> bytes:
+        """
+        Take tokens from the pool, waiting until they are available.
+
+        :param n: The number of tokens.
+        :type n: int
+        :return: The tokens, to give back to release().
+        :rtype: bytes
+        """
+        tokens = b""
+        with self.__reserve_lock:
+            while len(tokens) < n:
+                tokens += os.read(self.__read, n - len(tokens))
+        return tokens
+
+    def release(self, tokens: bytes) -> None:
+        """
+        Give tokens back to the pool.
+
+        :param tokens: The tokens returned by acquire().
+        :type tokens: bytes
+        """
+        os.write(self.__write, tokens)
+
+    def makeflags(self, read: int, write: int) -> str:
+        """
+        Return the MAKEFLAGS that join a jobserver.
+
+        :param read: The file descriptor of the token pipe read end.
+        :type read: int
+        :param write: The file descriptor of the token pipe write end.
+        :type write: int
+        :rtype: str
+        """
+        # make < 4.2 only knows --jobserver-fds
+        return self.__makeflags(
+            f"--jobserver-fds={read},{write} --jobserver-auth={read},{write}"
+        )
+
+    def __makeflags(self, auth: str) -> str:
+        flags = f"-j {auth}"
+        if self.max_load is not None:
+            flags += f" -l{self.max_load}"
+        return flags
+
+    @contextmanager
+    def slot(self, weight: int | None = None) -> Iterator[tuple[str, tuple[int, ...]]]:
+        """
+        Hold the job slots of a make invocation.
+
+        :param weight: The number of slots reserved for the invocation. If
+                       None, it shares the pool with the other invocations.
+        :type weight: int | None
+        :return: A context manager yielding the MAKEFLAGS and the file
+                 descriptors to pass to make.
+        :rtype: Iterator[tuple[str, tuple[int, ...]]]
+        """
+        n = 1 if weight is None else max(min(weight, self.slots), 1)
+        tokens = self.acquire(n)
+        try:
+            if weight is None and self.fifo_auth:
+                yield self.__makeflags(f"--jobserver-auth=fifo:{self.path}"), ()
+                return
+            if weight is None:
+                fds = self.__read, self.__write
+                yield self.makeflags(*fds), fds
+                return
+
+            read, write = os.pipe()
+            try:
+                os.write(write, b"+" * (n - 1))
+                yield self.makeflags(read, write), (read, write)
+            finally:
+                os.close(read)
+                os.close(write)
+        finally:
+            self.release(tokens)
+
+    def close(self) -> None:
+        """Close the FIFO, leaving the pool to the other processes."""
+        os.close(self.__read)
+        os.close(self.__write)
+        os.close(self.__users)
+
+
+__all__ = ["JobServer"]
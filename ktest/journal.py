@@ -0,0 +1,107 @@
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any
+
+from git.types import PathLike
+
+from .util import expd
+from ._log import logger
+
+
+def fingerprint(*inputs: object) -> str:
+    """
+    Compute the fingerprint of task inputs.
+
+    :param inputs: The inputs, converted to strings.
+    :type inputs: object
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    for data in inputs:
+        h.update(hashlib.sha256(str(data).encode()).digest())
+    return h.hexdigest()
+
+
+class Journal:
+    """
+    A persistent record of the tasks completed by Context runs.
+
+    Each line of the journal file is a JSON object with the fingerprint of
+    the inputs of a completed task, the task name, and the state the task
+    needs to resume without running again. Lines are appended as soon as a
+    task completes, so a run that fails or is killed keeps the record of
+    the tasks done before.
+    """
+
+    def __init__(self, path: PathLike) -> None:
+        """
+        :param path: The path to the journal file. It is created if missing.
+        :type path: str | os.PathLike
+        """
+        self.path = Path(expd(path))
+        self.__lock = threading.Lock()
+        self.__entries: dict[str, dict[str, Any]] = {}
+
+        if self.path.exists():
+            for line in self.path.read_text().splitlines():
+                try:
+                    entry = json.loads(line)
+                    self.__entries[entry["fingerprint"]] = entry
+                except (ValueError, KeyError, TypeError):
+                    # A run killed while writing leaves a partial last line
+                    logger.warning(f"Ignoring a malformed journal line: {line!r}")
+
+    def lookup(self, fingerprint: str) -> dict[str, Any] | None:
+        """
+        Find a completed task.
+
+        :param fingerprint: The fingerprint of the task inputs.
+        :type fingerprint: str
+        :return: The state recorded when the task completed, or None if no
+                 task with these inputs completed.
+        :rtype: dict[str, Any] | None
+        """
+        with self.__lock:
+            entry = self.__entries.get(fingerprint)
+        return None if entry is None else entry["state"]
+
+    def record(self, fingerprint: str, name: str, state: dict[str, Any]) -> None:
+        """
+        Record a completed task.
+
+        :param fingerprint: The fingerprint of the task inputs.
+        :type fingerprint: str
+        :param name: The task name, for humans reading the journal.
+        :type name: str
+        :param state: The state the task needs to resume. It must be
+                      serializable to JSON.
+        :type state: dict[str, Any]
+        """
+        entry = {
+            "fingerprint": fingerprint,
+            "task": name,
+            "time": time.time(),
+            "state": state,
+        }
+        line = json.dumps(entry) + "\n"
+        with self.__lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(line)
+            self.__entries[fingerprint] = entry
+
+    def clear(self) -> None:
+        """Forget all the completed tasks, so the next run starts from scratch."""
+        with self.__lock:
+            self.path.unlink(missing_ok=True)
+            self.__entries.clear()
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__entries)
+
+
+__all__ = ["Journal", "fingerprint"]
@@ -0,0 +1,102 @@
+import shlex
+from subprocess import CalledProcessError
+
+from .connection.base import Connection
+from .context import Context
+from . import facts, grub
+from ._log import logger
+
+# Seconds before a panicking kexec kernel reboots through the firmware
+PANIC_TIMEOUT = 10
+
+
+def load(connection: Connection, kernel: str, initrd="", cmdline="") -> None:
+    """
+    Load a kernel to be booted with kexec.
+
+    :param connection: A Connection object to the remote peer.
+    :type connection: Connection
+    :param kernel: The path to the kernel image in the host.
+    :type kernel: str
+    :param initrd: The path to the initramfs image in the host.
+    :type initrd: str
+    :param cmdline: The kernel command line.
+    :type cmdline: str
+    """
+    cmd = f"kexec -l {shlex.quote(kernel)} --command-line={shlex.quote(cmdline)}"
+    if initrd:
+        cmd += f" --initrd={shlex.quote(initrd)}"
+    connection.run_command(cmd)
+
+
+def unload(connection: Connection) -> None:
+    """
+    Unload the kernel loaded with kexec.
+
+    :param connection: A Connection object to the remote peer.
+    :type connection: Connection
+    """
+    connection.run_command("kexec -u")
+
+
+def boot(
+    ctx: Context,
+    release: str,
+    kernel: str,
+    initrd="",
+    cmdline="",
+    timeout: float = 120.0,
+    fallback_timeout: float = 600.0,
+) -> None:
+    """
+    Boot a kernel with kexec, skipping the firmware and the boot loader.
+
+    Select the same kernel for the next firmware boot first, e.g. with
+    grub.grub2reboot, as it is the fallback path: if the kernel cannot be
+    loaded or boots another release, the host is rebooted through the
+    firmware. If the kernel does not come up at all, it is given panic=
+    PANIC_TIMEOUT, so a crashed kernel reboots through the firmware by
+    itself, and we wait for that. Once the kexec kernel runs, the next boot
+    entry is unset, so the next firmware boot uses the default entry again.
+
+    :param ctx: The Context of the host.
+    :type ctx: Context
+    :param release: The release of the kernel.
+    :type release: str
+    :param kernel: The path to the kernel image in the host.
+    :type kernel: str
+    :param initrd: The path to the initramfs image in the host.
+    :type initrd: str
+    :param cmdline: The kernel command line.
+    :type cmdline: str
+    :param timeout: How long, in seconds, to wait for the kexec boot.
+    :type timeout: float
+    :param fallback_timeout: How long, in seconds, to wait for the firmware boot.
+    :type fallback_timeout: float
+    :raise TimeoutError: if the host is not back in time.
+    :raise RuntimeError: if the host does not run the kernel release.
+    """
+    connection = ctx.connection
+    boot_id = facts.facts(connection).boot_id
+    address = connection.address
+
+    try:
+        load(connection, kernel, initrd, f"{cmdline} panic={PANIC_TIMEOUT}")
+    except CalledProcessError as ex:
+        logger.warning(f"kexec load failed, rebooting through the firmware: {ex}")
+        ctx.reboot(release=release, timeout=fallback_timeout)
+        return
+
+    try:
+        ctx.reboot(release=release, method="kexec", timeout=timeout)
+    except TimeoutError:
+        logger.warning("The kexec kernel did not come up, waiting for the firmware")
+        ctx.wait_for_boot(boot_id, address, release, fallback_timeout)
+    except RuntimeError as ex:
+        logger.warning(f"{ex}, rebooting through the firmware")
+        ctx.reboot(release=release, timeout=fallback_timeout)
+    else:
+        grub.cancel_reboot(ctx.connection)
+
+
+__all__ = ["PANIC_TIMEOUT", "boot", "load", "unload"]
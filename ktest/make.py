@@ -1,10 +1,176 @@
 import os
+import json
+import shlex
 import platform
+import threading
 from dataclasses import dataclass, field
 
 from git.types import PathLike
 
 from . import util
+from .jobserver import JobServer
+
+# The compiler of the kernel Makefile with LLVM=1, LLVM=<prefix>/ or LLVM=-<suffix>
+_CLANG = "$(LLVM_PREFIX)clang$(LLVM_SUFFIX)"
+
+
+@dataclass(frozen=True, slots=True)
+class CompilerCacheStats:
+    """
+    Compiler cache hit and miss counters.
+
+    Constructor arguments:
+
+        :param hits: The number of cache hits.
+        :type hits: int
+        :param misses: The number of cache misses.
+        :type misses: int
+    """
+
+    hits: int = 0
+    misses: int = 0
+
+    def __sub__(self, other: "CompilerCacheStats") -> "CompilerCacheStats":
+        return CompilerCacheStats(self.hits - other.hits, self.misses - other.misses)
+
+    @property
+    def hit_rate(self) -> float:
+        """Return the ratio of hits to the total of lookups."""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.hits} hits, {self.misses} misses, {self.hit_rate:.1%} hit rate"
+
+
+@dataclass(frozen=True, slots=True)
+class CompilerCache:
+    """A compiler cache wrapper, ccache or sccache.
+
+    Constructor arguments:
+
+        :param tool: The compiler cache command, "ccache" or "sccache".
+        :type tool: str
+        :param cache_dir: The cache directory. If None, the tool default.
+        :type cache_dir: str | os.PathLike | None
+        :param cc: The target compiler (equals to `make CC=`, without the wrapper).
+                   It may refer to make variables. The default is the compiler
+                   the kernel Makefile picks, $(CROSS_COMPILE)gcc, or clang
+                   with LLVM=1.
+        :type cc: str
+        :param hostcc: The host compiler (equals to `make HOSTCC=`, without
+                       the wrapper). The default is gcc, or clang with LLVM=1.
+        :type hostcc: str
+    """
+
+    tool: str = "ccache"
+    cache_dir: PathLike | None = None
+    cc: str = f"$(if $(LLVM),{_CLANG},$(CROSS_COMPILE)gcc)"
+    hostcc: str = f"$(if $(LLVM),{_CLANG},gcc)"
+
+    @property
+    def name(self) -> str:
+        """Return the tool name, without the directory."""
+        return os.path.basename(self.tool)
+
+    @property
+    def env(self) -> dict[str, str]:
+        """Return the environment variables the tool needs."""
+        if self.cache_dir is None:
+            return {}
+        return {f"{self.name.upper()}_DIR": os.fspath(self.cache_dir)}
+
+    @property
+    def make_args(self) -> str:
+        """Return the make variables that install the compiler wrappers."""
+        return (
+            f"CC={shlex.quote(f'{self.tool} {self.cc}')} "
+            f"HOSTCC={shlex.quote(f'{self.tool} {self.hostcc}')}"
+        )
+
+    def stats(self) -> CompilerCacheStats:
+        """Read the cache counters.
+
+        :raise subprocess.CalledProcessorError: if the command fails
+
+        :rtype: CompilerCacheStats
+        """
+        env = os.environ | self.env
+        if self.name == "sccache":
+            output = util.run_cmd(
+                f"{self.tool} --show-stats --stats-format=json",
+                capture_output=True,
+                env=env,
+            )
+            stats = json.loads(output)["stats"]
+            return CompilerCacheStats(
+                hits=sum(stats["cache_hits"]["counts"].values()),
+                misses=sum(stats["cache_misses"]["counts"].values()),
+            )
+
+        output = util.run_cmd(
+            f"{self.tool} --print-stats", capture_output=True, env=env
+        )
+        counters = dict(
+            line.split("\t", 1) for line in output.splitlines() if "\t" in line
+        )
+        return CompilerCacheStats(
+            hits=int(counters.get("direct_cache_hit", 0))
+            + int(counters.get("preprocessed_cache_hit", 0)),
+            misses=int(counters.get("cache_miss", 0)),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class KernelInfo:
+    """
+    The kernel make variables of a build directory.
+
+    Constructor arguments:
+
+        :param release: The kernel release (`make kernelrelease`).
+        :type release: str
+        :param version: The kernel version (`make kernelversion`).
+        :type version: str
+        :param image_name: The kernel image path inside the build directory
+                           (`make image_name`), e.g. arch/x86/boot/bzImage.
+        :type image_name: str
+    """
+
+    release: str
+    version: str
+    image_name: str
+
+    @property
+    def modules_dir(self) -> str:
+        """Return the modules directory, relative to INSTALL_MOD_PATH."""
+        return f"lib/modules/{self.release}"
+
+
+# The targets that print the KernelInfo fields, in order
+_QUERY_TARGETS = ("kernelrelease", "kernelversion", "image_name")
+
+# The files whose changes invalidate a query result, relative to the source
+# and build directories
+_QUERY_SRC_FILES = ("Makefile",)
+_QUERY_OUT_FILES = (".config", "include/config/kernel.release")
+
+_Stamp = tuple[tuple[int, int] | None, ...]
+
+_query_cache: dict[tuple[str, str, str, str], tuple[_Stamp, KernelInfo]] = {}
+_query_lock = threading.Lock()
+
+
+def _stamp(paths: list[str]) -> _Stamp:
+    stamp = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            stamp.append(None)
+        else:
+            stamp.append((st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
 
 
 @dataclass(frozen=True, slots=True)
@@ -21,12 +187,23 @@ class Make:
         :type arch: str
         :param make: The make command.
         :type make: str
+        :param compiler_cache: If set, compile through this compiler cache.
+        :type compiler_cache: CompilerCache | None
+        :param jobserver: The jobserver parallel builds join. If None, the one
+                          shared by the whole machine, JobServer.default().
+        :type jobserver: JobServer | None
+        :param weight: If set, reserve this many jobserver slots for each
+                       parallel build, instead of sharing the pool.
+        :type weight: int | None
     """
 
     srcdir: PathLike
     outdir: PathLike
     arch: str = field(default_factory=platform.machine)
     make: str = "make"
+    compiler_cache: CompilerCache | None = None
+    jobserver: JobServer | None = None
+    weight: int | None = None
 
     def __call__(self, target="", args="", parallel: bool = False) -> None:
         """Call the make command.
@@ -35,20 +212,67 @@ class Make:
         :type target: str
         :param args: additional arguments to the make command
         :type args: str
-        :param parallel: if True, will run os.cpu_count() instances of the make
-                         `-j$(nproc)`
+        :param parallel: if True, run parallel jobs, as many as the jobserver
+                         gives
         :type parallel: bool
 
         :raise subprocess.CalledProcessorError: if the command fails
 
         :rtype: None
         """
-        j = f"-j{os.cpu_count()}" if parallel else ""
-        util.run_cmd(
-            f"{self.make} ARCH={self.arch} O={os.fspath(self.outdir)} {j} {args} "
-            + f"{target}",
-            cwd=os.fspath(self.srcdir),
+        env = dict(os.environ)
+        if self.compiler_cache:
+            args = f"{self.compiler_cache.make_args} {args}"
+            env |= self.compiler_cache.env
+
+        cmd = f"{self.make} ARCH={self.arch} O={os.fspath(self.outdir)} {args} {target}"
+        if not parallel:
+            util.run_cmd(cmd, cwd=os.fspath(self.srcdir), env=env)
+            return
+
+        jobserver = self.jobserver or JobServer.default()
+        with jobserver.slot(self.weight) as (makeflags, fds):
+            env["MAKEFLAGS"] = makeflags
+            util.run_cmd(cmd, cwd=os.fspath(self.srcdir), env=env, pass_fds=fds)
+
+    def query(self) -> KernelInfo:
+        """Read the kernel make variables of the build directory.
+
+        All the variables come from a single make invocation, as each one
+        parses the whole top level Makefile. The result is cached for the
+        build directory until the Makefile, .config or
+        include/config/kernel.release change.
+
+        :raise subprocess.CalledProcessorError: if the command fails
+
+        :rtype: KernelInfo
+        """
+        srcdir, outdir = os.fspath(self.srcdir), os.fspath(self.outdir)
+        key = (self.make, self.arch, srcdir, outdir)
+        stamp = _stamp(
+            [os.path.join(srcdir, f) for f in _QUERY_SRC_FILES]
+            + [os.path.join(outdir, f) for f in _QUERY_OUT_FILES]
+        )
+
+        with _query_lock:
+            cached = _query_cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        output = util.run_cmd(
+            f"{self.make} -s ARCH={self.arch} O={outdir} " + " ".join(_QUERY_TARGETS),
+            capture_output=True,
+            cwd=srcdir,
         )
+        try:
+            *_, release, version, image_name = output.splitlines()
+        except ValueError:
+            raise ValueError(f"Unexpected make output: {output!r}") from None
+
+        info = KernelInfo(release.strip(), version.strip(), image_name.strip())
+        with _query_lock:
+            _query_cache[key] = stamp, info
+        return info
 
     def kernel_release(self) -> str:
         """Compute the kernel release.
@@ -58,11 +282,7 @@ class Make:
         :return: A string with the kernel release
         :rtype: str
         """
-        return util.run_cmd(
-            f"{self.make} -s kernelrelease",
-            capture_output=True,
-            cwd=os.fspath(self.srcdir),
-        ).rstrip("\n")
+        return self.query().release
 
     def kernel_version(self) -> str:
         """Compute the kernel version.
@@ -72,11 +292,7 @@ class Make:
         :return: A string with the kernel version
         :rtype: str
         """
-        return util.run_cmd(
-            f"{self.make} -s kernelversion",
-            capture_output=True,
-            cwd=os.fspath(self.srcdir),
-        ).rstrip("\n")
+        return self.query().version
 
 
-__all__ = ["Make"]
+__all__ = ["CompilerCache", "CompilerCacheStats", "KernelInfo", "Make"]
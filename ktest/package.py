@@ -0,0 +1,196 @@
+import io
+import os
+import time
+import json
+import hashlib
+import tarfile
+import tempfile
+from enum import Enum
+
+from git.types import PathLike
+
+from .connection.base import Connection
+from ._log import logger
+
+
+class PackageFormat(Enum):
+    """The kernel tarball package formats, named after their make targets."""
+
+    TAR = "tar"
+    GZIP = "targz"
+    BZIP2 = "tarbz2"
+    XZ = "tarxz"
+    ZSTD = "tarzst"
+
+    @property
+    def target(self) -> str:
+        """Return the make target that creates the package."""
+        return f"{self.value}-pkg"
+
+    @property
+    def extension(self) -> str:
+        """Return the package file extension."""
+        return {
+            PackageFormat.TAR: ".tar",
+            PackageFormat.GZIP: ".tar.gz",
+            PackageFormat.BZIP2: ".tar.bz2",
+            PackageFormat.XZ: ".tar.xz",
+            PackageFormat.ZSTD: ".tar.zst",
+        }[self]
+
+    @property
+    def tar_option(self) -> str:
+        """Return the tar command option that (de)compresses the format."""
+        return {
+            PackageFormat.TAR: "",
+            PackageFormat.GZIP: "-z",
+            PackageFormat.BZIP2: "-j",
+            PackageFormat.XZ: "-J",
+            PackageFormat.ZSTD: "--zstd",
+        }[self]
+
+    @classmethod
+    def from_path(cls, path: PathLike) -> "PackageFormat":
+        """
+        Guess the format of a package from its file name.
+
+        :param path: The package path.
+        :type path: str | os.PathLike
+        :raise ValueError: if the file name has no known extension.
+        :rtype: PackageFormat
+        """
+        name = os.fspath(path)
+        for fmt in cls:
+            if name.endswith(fmt.extension):
+                return fmt
+        raise ValueError(f"Unknown package format: {name}")
+
+
+def choose_format(link_speed: float) -> PackageFormat:
+    """
+    Choose the package format for a link speed.
+
+    On fast links, compressing costs more time than it saves. On slow links,
+    the best compression ratio wins.
+
+    :param link_speed: The link speed in bytes per second.
+    :type link_speed: float
+    :rtype: PackageFormat
+    """
+    if link_speed >= 100 * 2**20:
+        return PackageFormat.TAR
+    if link_speed >= 10 * 2**20:
+        return PackageFormat.ZSTD
+    return PackageFormat.XZ
+
+
+def link_speed(connection: Connection, size: int = 4 * 2**20) -> float:
+    """
+    Measure the upload speed to the host.
+
+    :param connection: A Connection object to the remote peer.
+    :type connection: Connection
+    :param size: The size in bytes of the sample sent to the host.
+    :type size: int
+    :return: The link speed in bytes per second.
+    :rtype: float
+    """
+    dest = "/tmp/ktest-link-probe"
+    with tempfile.NamedTemporaryFile() as sample:
+        sample.write(os.urandom(size))
+        sample.flush()
+
+        start = time.monotonic()
+        connection.put(src=sample.name, dest=dest)
+        elapsed = time.monotonic() - start
+
+    connection.run_command(f"rm -f {dest}")
+    speed = size / max(elapsed, 1e-6)
+    logger.info(f"Link speed: {speed / 2**20:.1f} MiB/s")
+    return speed
+
+
+def _name(member: tarfile.TarInfo) -> str:
+    return member.name.removeprefix("./")
+
+
+def manifest(package: PathLike) -> dict[str, str]:
+    """
+    Compute the manifest of a package.
+
+    :param package: The package path. zstd packages are not supported.
+    :type package: str | os.PathLike
+    :return: A map of each file or symbolic link path, relative to the root
+             directory, to a digest of its content.
+    :rtype: dict[str, str]
+    """
+    result: dict[str, str] = {}
+
+    with tarfile.open(package, "r:*") as tar:
+        for member in tar:
+            if member.issym() or member.islnk():
+                result[_name(member)] = f"link:{member.linkname}"
+            elif member.isfile():
+                f = tar.extractfile(member)
+                assert f is not None
+                h = hashlib.sha256()
+                while chunk := f.read(2**20):
+                    h.update(chunk)
+                result[_name(member)] = h.hexdigest()
+
+    return result
+
+
+def write_delta(
+    package: PathLike, dest: PathLike, names: set[str], extra: dict[str, bytes]
+) -> None:
+    """
+    Write a tarball with a subset of the files of a package.
+
+    :param package: The package path.
+    :type package: str | os.PathLike
+    :param dest: The path of the new tarball.
+    :type dest: str | os.PathLike
+    :param names: The paths, as in the manifest, of the files to copy.
+    :type names: set[str]
+    :param extra: Additional files to add, mapping their paths to their content.
+    :type extra: dict[str, bytes]
+    """
+    with tarfile.open(package, "r:*") as src, tarfile.open(dest, "w") as tar:
+        for member in src:
+            if _name(member) in names:
+                tar.addfile(
+                    member, src.extractfile(member) if member.isfile() else None
+                )
+
+        for name, data in extra.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(data))
+
+
+def dumps_manifest(files: dict[str, str]) -> bytes:
+    """Serialize a manifest."""
+    return json.dumps(files, sort_keys=True).encode()
+
+
+def loads_manifest(data: str) -> dict[str, str]:
+    """Deserialize a manifest. Invalid data results in an empty manifest."""
+    try:
+        files = json.loads(data)
+    except ValueError:
+        return {}
+    return files if isinstance(files, dict) else {}
+
+
+__all__ = [
+    "PackageFormat",
+    "choose_format",
+    "dumps_manifest",
+    "link_speed",
+    "loads_manifest",
+    "manifest",
+    "write_delta",
+]
@@ -0,0 +1,110 @@
+import time
+import socket
+from typing import Callable, Iterator
+
+from .connection.base import Connection
+from . import facts
+from ._log import logger
+
+REBOOT_COMMANDS = {
+    "reboot": "reboot",
+    # Hosts without systemd jump to the loaded kernel without a clean shutdown
+    "kexec": "systemctl kexec || kexec -e",
+}
+
+
+def backoff(
+    initial: float = 0.5, maximum: float = 8.0, factor: float = 2.0
+) -> Iterator[float]:
+    """
+    Yield exponentially growing delays.
+
+    >>> from itertools import islice
+    >>> list(islice(backoff(0.5, 3.0), 5))
+    [0.5, 1.0, 2.0, 3.0, 3.0]
+
+    :param initial: The first delay in seconds.
+    :type initial: float
+    :param maximum: The longest delay in seconds.
+    :type maximum: float
+    :param factor: The growth factor of the delays.
+    :type factor: float
+    """
+    delay = initial
+    while True:
+        yield min(delay, maximum)
+        delay *= factor
+
+
+def port_open(address: tuple[str, int], timeout: float = 2.0) -> bool:
+    """
+    Check if a TCP port accepts connections.
+
+    :param address: The host name and port.
+    :type address: tuple[str, int]
+    :param timeout: How long, in seconds, to wait for the connection.
+    :type timeout: float
+    :rtype: bool
+    """
+    try:
+        with socket.create_connection(address, timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def wait_for_reboot(
+    connect: Callable[[], Connection],
+    address: tuple[str, int] | None,
+    boot_id: str,
+    timeout: float,
+) -> Connection:
+    """
+    Wait until a host is back from a reboot.
+
+    The host is back when a connection to it reports a boot id other than
+    boot_id. While the host is down, its port, if known, is probed with an
+    exponential backoff instead of attempting full connections.
+
+    :param connect: A callable that opens a new Connection to the host.
+    :type connect: Callable[[], Connection]
+    :param address: The host name and port, or None to skip port probing.
+    :type address: tuple[str, int] | None
+    :param boot_id: The boot id before the reboot. If empty, the host is
+                    back on the first connection after it was seen down.
+    :type boot_id: str
+    :param timeout: How long, in seconds, to wait for the host.
+    :type timeout: float
+    :return: The Connection to the rebooted host.
+    :rtype: Connection
+    :raise TimeoutError: if the host is not back in time.
+    """
+    deadline = time.monotonic() + timeout
+    delays = backoff()
+    down = False
+
+    while time.monotonic() < deadline:
+        if address is None or port_open(address):
+            connection = connect()
+            try:
+                facts.invalidate(connection)
+                new_id = facts.facts(connection).boot_id
+            except Exception as ex:
+                logger.debug(f"Connection attempt failed: {ex}")
+                connection.close()
+                down = True
+            else:
+                if new_id != boot_id or (down and not boot_id):
+                    logger.info("Host is back")
+                    return connection
+                connection.close()
+        elif not down:
+            logger.info("Host is down")
+            down = True
+
+        time.sleep(min(next(delays), max(deadline - time.monotonic(), 0)))
+
+    raise TimeoutError(f"Host did not come back in {timeout} seconds")
+
+
+__all__ = ["REBOOT_COMMANDS", "backoff", "port_open", "wait_for_reboot"]
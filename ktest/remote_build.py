@@ -0,0 +1,301 @@
+import os
+import shlex
+import tempfile
+import threading
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, Mapping
+
+from git.exc import GitCommandError
+
+from .connection.base import Connection, FactoryType
+from .package import PackageFormat
+from . import config as kconfig
+from .util import expd
+from ._log import logger
+
+if TYPE_CHECKING:
+    from .tasks import Build
+
+# The most recent commits of a build host used as the base of a bundle
+_MAX_HAVES = 32
+
+
+class RemoteBuilder:
+    """
+    Build kernels in remote build hosts.
+
+    Each build host keeps a git repository and one build directory per
+    head and architecture, so builds are incremental there too. Before a
+    build, the host gets the missing commits, either fetched from
+    fetch_url or sent in a git bundle with only the commits it does not
+    have, plus the local changes of the source tree as a patch. Only the
+    kernel package comes back.
+
+    Concurrent builds run on different hosts; a build waits until a host is
+    free, and prefers the host that last built the same head.
+    """
+
+    def __init__(
+        self,
+        hosts: Mapping[str, FactoryType],
+        workdir: str = "/var/tmp/ktest",
+        fetch_url: str | None = None,
+        make: str = "make",
+        jobs: int | None = None,
+    ) -> None:
+        """
+        :param hosts: A map of build host names to Connection factories.
+        :type hosts: Mapping[str, FactoryType]
+        :param workdir: The absolute path of the working directory in the
+                        build hosts.
+        :type workdir: str
+        :param fetch_url: A git URL the build hosts can fetch the commits from.
+                          If None, or if the fetch fails, the commits are sent
+                          in a bundle.
+        :type fetch_url: str | None
+        :param make: The make command in the build hosts.
+        :type make: str
+        :param jobs: The number of make jobs. If None, the host CPU count.
+        :type jobs: int | None
+        """
+        if not hosts:
+            raise ValueError("No build hosts")
+
+        self.hosts = dict(hosts)
+        self.workdir = PurePosixPath(workdir)
+        self.fetch_url = fetch_url
+        self.make = make
+        self.jobs = jobs
+        self.__free = set(self.hosts)
+        self.__last: dict[str, str] = {}
+        self.__cond = threading.Condition()
+
+    @property
+    def srcdir(self) -> PurePosixPath:
+        """Return the path of the source repository in the build hosts."""
+        return self.workdir / "linux"
+
+    def outdir(self, build: "Build") -> PurePosixPath:
+        """
+        Return the build directory of a Build in the build hosts.
+
+        :param build: The task that builds the kernel.
+        :type build: Build
+        :rtype: PurePosixPath
+        """
+        name = build.head.name if build.head else "HEAD"
+        return self.workdir / f"build-{build.make.arch}-{name.replace('/', '-')}"
+
+    def __acquire(self, slot: str) -> str:
+        with self.__cond:
+            self.__cond.wait_for(lambda: bool(self.__free))
+            host = self.__last.get(slot)
+            if host not in self.__free:
+                host = sorted(self.__free)[0]
+            self.__free.remove(host)
+            self.__last[slot] = host
+            return host
+
+    def __release(self, host: str) -> None:
+        with self.__cond:
+            self.__free.add(host)
+            self.__cond.notify()
+
+    def build(self, build: "Build", fmt: PackageFormat) -> tuple[str, Path]:
+        """
+        Build the kernel package of a Build in a build host.
+
+        :param build: The task that builds the kernel.
+        :type build: Build
+        :param fmt: The package format.
+        :type fmt: PackageFormat
+        :return: The kernel release and the package path in the build directory.
+        :rtype: tuple[str, Path]
+        :raise subprocess.CalledProcessError: if a command fails in the host.
+        """
+        outdir = self.outdir(build)
+        host = self.__acquire(os.fspath(outdir))
+        logger.info(f"Building in {host}")
+        connection = self.hosts[host]()
+        try:
+            self.__sync(connection, build)
+            self.__configure(connection, build, outdir)
+            return self.__make(connection, build, outdir, fmt)
+        finally:
+            connection.close()
+            self.__release(host)
+
+    def __sync(self, connection: Connection, build: "Build") -> None:
+        """Check out the commit of the Build, with the local changes, in the host."""
+        src = shlex.quote(os.fspath(self.srcdir))
+        commit = build.commit
+        ref = f"refs/ktest/{commit}"
+
+        connection.run_command(f"git init -q {src}")
+        if not self.__has_commit(connection, commit) and not self.__fetch(
+            connection, commit
+        ):
+            self.__send_bundle(connection, build, commit)
+        connection.run_command(
+            f"git -C {src} update-ref {ref} {commit} && "
+            f"git -C {src} -c advice.detachedHead=false checkout -q -f {commit} && "
+            f"git -C {src} clean -q -fd"
+        )
+
+        # The local changes belong to the commit checked out in the repository
+        with build.ctx.repo_lock:
+            repo = build.ctx.repo
+            if build.worktree or repo.head.commit.hexsha != commit:
+                return
+            diff = repo.git.diff("HEAD", "--binary")
+        if diff:
+            logger.info("Sending the local changes of the source tree")
+            self.__put_text(connection, diff + "\n", self.workdir / "local.patch")
+            connection.run_command(
+                f"git -C {src} apply --whitespace=nowarn "
+                + shlex.quote(os.fspath(self.workdir / "local.patch"))
+            )
+
+    def __has_commit(self, connection: Connection, commit: str) -> bool:
+        src = shlex.quote(os.fspath(self.srcdir))
+        return (
+            connection.run_command(
+                f"git -C {src} cat-file -e {commit}^{{commit}} 2> /dev/null "
+                "&& echo yes || true",
+                capture_output=True,
+            ).strip()
+            == "yes"
+        )
+
+    def __fetch(self, connection: Connection, commit: str) -> bool:
+        if self.fetch_url is None:
+            return False
+
+        src = shlex.quote(os.fspath(self.srcdir))
+        url = shlex.quote(self.fetch_url)
+        connection.run_command(
+            f"git -C {src} fetch -q {url} {commit} 2> /dev/null || true"
+        )
+        if self.__has_commit(connection, commit):
+            return True
+
+        logger.info(f"Could not fetch {commit} from {self.fetch_url}")
+        return False
+
+    def __send_bundle(
+        self, connection: Connection, build: "Build", commit: str
+    ) -> None:
+        """Send the commits the host is missing in a git bundle."""
+        src = shlex.quote(os.fspath(self.srcdir))
+        output = connection.run_command(
+            f"git -C {src} for-each-ref --sort=-committerdate --count={_MAX_HAVES} "
+            "--format='%(objectname)' refs/ktest",
+            capture_output=True,
+        )
+        ref = f"refs/ktest/{commit}"
+        repo = build.ctx.repo
+
+        with tempfile.TemporaryDirectory() as tmp, build.ctx.repo_lock:
+            haves = []
+            for have in output.split():
+                try:
+                    repo.git.cat_file("-e", f"{have}^{{commit}}")
+                except GitCommandError:
+                    continue
+                haves.append(f"^{have}")
+
+            bundle = Path(tmp) / "ktest.bundle"
+            repo.git.update_ref(ref, commit)
+            try:
+                repo.git.bundle("create", "-q", os.fspath(bundle), ref, *haves)
+            finally:
+                repo.git.update_ref("-d", ref)
+
+            logger.info(f"Sending a {bundle.stat().st_size} bytes bundle")
+            dest = self.workdir / "ktest.bundle"
+            connection.put(bundle, dest)
+
+        dest = shlex.quote(os.fspath(dest))
+        connection.run_command(
+            f"git -C {src} fetch -q {dest} {ref}:{ref} && rm -f {dest}"
+        )
+
+    def __configure(
+        self, connection: Connection, build: "Build", outdir: PurePosixPath
+    ) -> None:
+        """
+        Generate the configuration in the host, unless it has the same inputs
+        as the last build there: the requested configuration, and the
+        Kconfig files and defconfigs of the source tree, hashed in the host
+        as kconfig.kconfig_digest does.
+        """
+        base = Path(expd(build.config)).read_text() if build.config else None
+        fragments = [Path(expd(f)).read_text() for f in build.fragments]
+        requested = kconfig.merge(base or "", fragments)
+
+        out = shlex.quote(os.fspath(outdir))
+        make = self.__make_cmd(build, outdir)
+        if base is None:
+            requested = "# defconfig\n" + requested
+            generate = f"{make} defconfig && cat {out}/config.new >> {out}/.config"
+        else:
+            generate = f"cp {out}/config.new {out}/.config"
+
+        if build.clean_build:
+            connection.run_command(f"rm -rf {out}")
+        connection.run_command(f"mkdir -p {out}")
+        self.__put_text(connection, requested, outdir / "config.new")
+        specs = " ".join(shlex.quote(spec) for spec in kconfig.KCONFIG_PATHSPECS)
+        connection.run_command(
+            f"cd {shlex.quote(os.fspath(self.srcdir))} && "
+            f"{{ cat {out}/config.new; {{ git ls-files -s -- {specs}; "
+            f"git diff HEAD -- {specs}; }} | sha256sum; }} > {out}/stamp.new && "
+            f"if cmp -s {out}/stamp.new {out}/{kconfig.STAMP_FILE}; "
+            "then echo 'The configuration is up to date'; "
+            f"else {generate} && {make} olddefconfig && "
+            f"mv {out}/stamp.new {out}/{kconfig.STAMP_FILE}; fi"
+        )
+
+    def __make(
+        self,
+        connection: Connection,
+        build: "Build",
+        outdir: PurePosixPath,
+        fmt: PackageFormat,
+    ) -> tuple[str, Path]:
+        """Build the package in the host and copy it to the build directory."""
+        src = shlex.quote(os.fspath(self.srcdir))
+        out = shlex.quote(os.fspath(outdir))
+        make = self.__make_cmd(build, outdir)
+        jobs = (self.jobs or "$(nproc)") if build.parallel_build else 1
+
+        connection.run_command(
+            f"cd {src} && {make} -j{jobs} {build.build_options} {fmt.target}"
+        )
+        release = connection.run_command(
+            f"cd {src} && {make} -s kernelrelease", capture_output=True
+        ).strip()
+        name = connection.run_command(
+            f"cd {out} && ls -t linux-{release}-*{fmt.extension} | head -n 1",
+            capture_output=True,
+        ).strip()
+        if not name:
+            raise FileNotFoundError(f"No {fmt.extension} package in {outdir}")
+
+        build.build_dir.mkdir(parents=True, exist_ok=True)
+        package = build.build_dir / name
+        connection.get(outdir / name, package)
+        return release, package
+
+    def __make_cmd(self, build: "Build", outdir: PurePosixPath) -> str:
+        return f"{self.make} ARCH={build.make.arch} O={shlex.quote(os.fspath(outdir))}"
+
+    @staticmethod
+    def __put_text(connection: Connection, text: str, dest: PurePosixPath) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=dest.suffix) as f:
+            f.write(text)
+            f.flush()
+            connection.put(f.name, dest)
+
+
+__all__ = ["RemoteBuilder"]
@@ -0,0 +1,71 @@
+from concurrent.futures import (
+    Executor,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+    FIRST_COMPLETED,
+)
+from graphlib import TopologicalSorter
+from typing import Callable, TypeVar
+
+from ._log import logger
+
+T = TypeVar("T", bound=Callable[[], None])
+
+ExecutorType = Callable[..., Executor]
+
+
+def run_graph(
+    graph: TopologicalSorter[T],
+    max_workers: int | None = None,
+    executor: ExecutorType = ThreadPoolExecutor,
+) -> None:
+    """
+    Run the nodes of a dependency graph concurrently.
+
+    Every node whose dependencies are satisfied is submitted to a pool
+    of workers. When a node fails, no more nodes are scheduled, the nodes
+    already running are waited for, and the first error is raised again.
+    Nodes that depend on a failed node never run.
+
+    :param graph: The dependency graph. Each node is a callable object.
+    :type graph: TopologicalSorter
+    :param max_workers: The maximum number of nodes running at the same time.
+                        If None, the executor chooses.
+    :type max_workers: int | None
+    :param executor: A callable that takes a max_workers keyword argument and
+                     returns a concurrent.futures.Executor. If it creates a
+                     process pool, the nodes must be picklable, and their
+                     side effects stay in the worker processes.
+    :type executor: ExecutorType
+
+    :raise graphlib.CycleError: if the graph has a cycle.
+    """
+    graph.prepare()
+
+    with executor(max_workers=max_workers) as pool:
+        running: dict[Future[None], T] = {}
+        error: BaseException | None = None
+
+        while error is None and graph.is_active():
+            for node in graph.get_ready():
+                running[pool.submit(node)] = node
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                exc = future.exception()
+                if exc is None:
+                    graph.done(node)
+                else:
+                    logger.error(f"{node!r} failed: {exc}")
+                    error = error or exc
+
+        if error is not None:
+            if running:
+                logger.info(f"Waiting for {len(running)} running task(s) to finish")
+                wait(running)
+            raise error
+
+
+__all__ = ["ExecutorType", "run_graph"]
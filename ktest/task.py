@@ -1,14 +1,15 @@
-from typing import Callable, Sequence
+from typing import Any, Callable, Sequence
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, InitVar, field
 
 from .context import Context, TaskInterface
+from ._log import logger
 
 PreExecType = Callable[[TaskInterface], None]
 PostExecType = Callable[[TaskInterface], None]
 
 
-@dataclass(frozen=True, unsafe_hash=True, eq=False)
+@dataclass(frozen=True, eq=False)
 class Task(ABC):
     """
     Represent a task to execute.
@@ -38,7 +39,25 @@ class Task(ABC):
         self.ctx.add_dependencies(self, *dependencies)
 
     def __call__(self) -> None:
-        """Run the task."""
+        """Run the task, unless the Context journal has it completed."""
+        journal = self.ctx.journal
+        fingerprint = self.fingerprint() if journal is not None else None
+        if journal is not None and fingerprint:
+            state = journal.lookup(fingerprint)
+            if state is not None and self.resume(state):
+                logger.info(f"{type(self).__name__} completed in a previous run")
+                return
+
+        if self.ctx.tracer:
+            with self.ctx.tracer.span(type(self).__name__, task=self):
+                self.__run()
+        else:
+            self.__run()
+
+        if journal is not None and fingerprint:
+            journal.record(fingerprint, type(self).__name__, self.checkpoint())
+
+    def __run(self) -> None:
         if self.pre_exec:
             self.pre_exec(self)
 
@@ -55,5 +74,35 @@ class Task(ABC):
         Derived classes override this method to define their own behavior.
         """
 
+    def fingerprint(self) -> str | None:
+        """
+        Return a fingerprint of the task inputs, to find the task in the
+        Context journal. Tasks that cannot be resumed return None.
+
+        :rtype: str | None
+        """
+        return None
+
+    def checkpoint(self) -> dict[str, Any]:
+        """
+        Return the state needed to resume the completed task.
+
+        :return: A state that can be serialized to JSON.
+        :rtype: dict[str, Any]
+        """
+        return {}
+
+    def resume(self, state: dict[str, Any]) -> bool:
+        """
+        Restore the state of a task completed in a previous run.
+
+        :param state: The state returned by checkpoint().
+        :type state: dict[str, Any]
+        :return: True if the task was resumed, False if it must run again,
+                 e.g. because its outputs are gone.
+        :rtype: bool
+        """
+        return True
+
 
 __all__ = ["Task"]
@@ -1,12 +1,50 @@
+import io
+import os
+import shlex
 import shutil
-from dataclasses import dataclass
+import subprocess
+import threading
+import dataclasses
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any
 
 from git.refs import Head
+from git.repo import Repo
 from git.types import PathLike
 
 from .util import expd
 from .task import Task
+from .context import Context
+from .cache import BuildCache
+from .remote_build import RemoteBuilder
+from .make import Make
+from .grubby import Grubby
+from . import package as pkg
+from .package import PackageFormat
+from .dracut import make_initrd
+from . import grub
+from . import config as kconfig
+from . import facts, journal, kexec
+from ._log import logger
+
+
+@dataclass
+class Artifacts:
+    """The outputs of a kernel build."""
+
+    release: str | None = None
+    packages: dict[PackageFormat, Path] = field(default_factory=dict)
+    staging: Path | None = None
+    from_cache: bool = False
+    remote: bool = False
+    fingerprint: str | None = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def prebuilt(self) -> bool:
+        """Return True if there is only a package, and no local build tree."""
+        return self.from_cache or self.remote
 
 
 @dataclass(frozen=True, unsafe_hash=True)
@@ -20,6 +58,9 @@ class Build(Task):
                        If None, it generates the configuration with the
                        defconfig target.
         :type config:  PathLike | None
+        :param fragments: Configuration fragments merged, in order, into the
+                          configuration, like with merge_config.sh.
+        :type fragments: tuple[PathLike, ...]
         :param head: Head to the git commit/branch.
         :type head: Head | None
         :param build_options: Extra options to pass to make.
@@ -28,60 +69,597 @@ class Build(Task):
         :type parallel_build: bool
         :param clean_build: Run mrproper before the build.
         :type clean_build: bool
+        :param cache: If set, look up the kernel packages in this cache and
+                      skip the build on a hit. Each package created by
+                      package() is stored in the cache, in its format.
+        :type cache: BuildCache | None
+        :param worktree: Build the head in its own git worktree and build
+                         directory inside the Context temp_dir, instead of
+                         checking it out in the Context repository. Builds
+                         of different heads can then run concurrently, and
+                         the worktree is reused when the same head is built
+                         again, so unchanged files keep their timestamps.
+        :type worktree: bool
+        :param builder: If set, build the kernel package in a build host of
+                        this builder, instead of the local machine.
+        :type builder: RemoteBuilder | None
+        :param weight: If set, reserve this many slots of the make jobserver for
+                       the build, instead of sharing them with the other builds.
+        :type weight: int | None
     """
 
     config: PathLike | None = None
+    fragments: tuple[PathLike, ...] = ()
     head: Head | None = None
     build_options: str = ""
     parallel_build: bool = True
     clean_build: bool = False
+    cache: BuildCache | None = None
+    worktree: bool = False
+    builder: RemoteBuilder | None = None
+    weight: int | None = None
+    artifacts: Artifacts = field(
+        default_factory=Artifacts, init=False, repr=False, compare=False
+    )
 
     def execute(self) -> None:
-        if self.head:
-            self.head.checkout()
+        if self.__restore():
+            return
+
+        if self.builder is not None:
+            # A build host sends a package back as the result of the build
+            with self.artifacts.lock:
+                self.__build_remote(self.builder, PackageFormat.BZIP2)
+        else:
+            self.__build_local()
+
+    def fingerprint(self) -> str:
+        config = Path(expd(self.config)).read_text() if self.config else ""
+        fragments = [Path(expd(f)).read_text() for f in self.fragments]
+        diff = ""
+        if not self.worktree:
+            with self.ctx.repo_lock:
+                diff = self.ctx.repo.git.diff("HEAD")
+
+        result = journal.fingerprint(
+            "Build",
+            self.commit,
+            diff,
+            config,
+            len(fragments),
+            *fragments,
+            self.build_options,
+            self.make.arch,
+            self.build_dir,
+            self.builder is not None,
+        )
+        with self.artifacts.lock:
+            self.artifacts.fingerprint = result
+        return result
+
+    @property
+    def input_fingerprint(self) -> str:
+        """
+        Return the fingerprint of the build inputs.
+
+        It is the fingerprint computed when the build last ran, or was
+        resumed, so the tasks that depend on the build do not hash the
+        source tree again.
+
+        :rtype: str
+        """
+        with self.artifacts.lock:
+            cached = self.artifacts.fingerprint
+        if cached is not None:
+            return cached
+
+        result = self.fingerprint()
+        assert result is not None
+        return result
+
+    def checkpoint(self) -> dict[str, Any]:
+        with self.artifacts.lock:
+            return {
+                "release": self.artifacts.release,
+                "packages": {
+                    fmt.value: os.fspath(path)
+                    for fmt, path in self.artifacts.packages.items()
+                },
+                "from_cache": self.artifacts.from_cache,
+                "remote": self.artifacts.remote,
+            }
+
+    def resume(self, state: dict[str, Any]) -> bool:
+        packages = {
+            PackageFormat(fmt): Path(path) for fmt, path in state["packages"].items()
+        }
+        prebuilt = state["from_cache"] or state["remote"]
+        if not all(path.is_file() for path in packages.values()):
+            return False
+        if not prebuilt and not (self.build_dir / ".config").is_file():
+            return False
+        if not prebuilt and not Path(self.make.srcdir).is_dir():
+            return False
+
+        with self.artifacts.lock:
+            self.artifacts.release = state["release"]
+            self.artifacts.packages.update(packages)
+            self.artifacts.from_cache = state["from_cache"]
+            self.artifacts.remote = state["remote"]
+        return True
+
+    def __build_local(self) -> None:
+        if self.worktree:
+            self.__checkout_worktree()
+        elif self.head:
+            with self.ctx.repo_lock:
+                self.head.checkout()
 
         if self.clean_build:
-            self.ctx.make("mrproper")
+            self.make("mrproper")
+
+        self.__configure()
+
+        compiler_cache = self.make.compiler_cache
+        before = compiler_cache.stats() if compiler_cache else None
+
+        self.make(args=self.build_options, parallel=self.parallel_build)
+
+        if compiler_cache and before is not None:
+            logger.info(f"{compiler_cache.name}: {compiler_cache.stats() - before}")
+
+    def __build_remote(self, builder: RemoteBuilder, fmt: PackageFormat) -> Path:
+        """Build a package in a build host. The artifacts lock must be held."""
+        self.artifacts.release, package = builder.build(self, fmt)
+        self.artifacts.packages[fmt] = package
+        self.artifacts.remote = True
+        self.__store(package)
+        return package
+
+    @property
+    def make(self) -> Make:
+        """Return the make wrapper for the build source and output directories."""
+        make = self.ctx.make
+        if self.weight is not None:
+            make = dataclasses.replace(make, weight=self.weight)
+        if not self.worktree:
+            return make
+
+        path = self.__worktree_path()
+        return dataclasses.replace(
+            make, srcdir=path, outdir=path.parent / f"{path.name}.build"
+        )
+
+    @property
+    def build_dir(self) -> Path:
+        """Return the build output directory."""
+        return Path(self.make.outdir)
 
-        if self.config:
-            config = Path(expd(self.config))
+    def __worktree_path(self) -> Path:
+        name = self.head.name if self.head else "HEAD"
+        return self.ctx.temp_dir / "worktrees" / name.replace("/", "-")
 
-            assert config.exists()
-            assert config.is_file()
+    @property
+    def commit(self) -> str:
+        """Return the hexsha of the built commit."""
+        with self.ctx.repo_lock:
+            return (self.head.commit if self.head else self.ctx.repo.head.commit).hexsha
 
-            shutil.copyfile(config, self.ctx.build_dir / ".config")
-            self.ctx.make("olddefconfig")
+    def __checkout_worktree(self) -> None:
+        commit = self.commit
+        path = self.__worktree_path()
+
+        if (path / ".git").exists():
+            Repo(path).git.checkout("--detach", commit)
+        else:
+            with self.ctx.repo_lock:
+                self.ctx.repo.git.worktree("prune")
+                self.ctx.repo.git.worktree("add", "--detach", str(path), commit)
+
+        self.build_dir.mkdir(parents=True, exist_ok=True)
+
+    def __configure(self) -> None:
+        """
+        Generate the configuration, unless the build directory already has
+        the configuration resolved from the same inputs. Rewriting .config
+        and include/config otherwise makes make rebuild much of the tree.
+        """
+        base = Path(expd(self.config)).read_text() if self.config else None
+        fragments = [Path(expd(f)).read_text() for f in self.fragments]
+
+        if self.worktree:
+            tree = kconfig.kconfig_digest(Repo(self.make.srcdir))
         else:
-            self.ctx.make("defconfig")
+            with self.ctx.repo_lock:
+                tree = kconfig.kconfig_digest(self.ctx.repo)
+
+        digest = kconfig.fingerprint(
+            "config" if base is not None else "defconfig",
+            base or "",
+            *fragments,
+            self.make.arch,
+            tree,
+        )
+        if kconfig.up_to_date(self.build_dir, digest):
+            logger.info("The configuration is up to date")
+            return
+
+        dot_config = self.build_dir / ".config"
+        if base is None:
+            self.make("defconfig")
+            if not fragments:
+                kconfig.record(self.build_dir, digest)
+                return
+            base = dot_config.read_text()
+
+        requested = kconfig.merge("", fragments)
+        dot_config.write_text(kconfig.merge(base, [requested]))
+        self.make("olddefconfig")
+
+        if fragments and dot_config.is_file():
+            for name in kconfig.check(requested, dot_config.read_text()):
+                logger.warning(f"{name} from the fragments is not in the .config")
+
+        kconfig.record(self.build_dir, digest)
+
+    def __cache_key(self) -> str | None:
+        if self.cache is None:
+            return None
+
+        if not self.worktree:
+            with self.ctx.repo_lock:
+                dirty = self.ctx.repo.is_dirty()
+            if dirty:
+                logger.info("The source tree has local changes, not using the cache")
+                return None
+
+        commit = self.commit
+        config = Path(expd(self.config)).read_bytes() if self.config else b""
+        for fragment in self.fragments:
+            config += b"\0" + Path(expd(fragment)).read_bytes()
+        return BuildCache.key(commit, config, self.build_options, self.make.arch)
+
+    def __restore(self) -> bool:
+        key = self.__cache_key()
+        if key is None:
+            return False
+        assert self.cache is not None
+        entry = self.cache.lookup(key)
+        if entry is None:
+            return False
+
+        with self.artifacts.lock:
+            self.build_dir.mkdir(parents=True, exist_ok=True)
+            for fmt, cached in entry.packages.items():
+                package = self.build_dir / cached.name
+                shutil.copyfile(cached, package)
+                self.artifacts.packages[fmt] = package
+            self.artifacts.release = entry.release
+            self.artifacts.from_cache = True
+
+        return True
+
+    def __store(self, package: Path) -> None:
+        key = self.__cache_key()
+        if key is None:
+            return
+        assert self.cache is not None
+        assert self.artifacts.release is not None
+        self.cache.store(key, package, self.artifacts.release)
+
+    def package(self, fmt: PackageFormat = PackageFormat.BZIP2) -> Path:
+        """
+        Create the kernel tarball package.
+
+        Each format is created only once, even if several Install tasks ask
+        for it at the same time, and is added to the build cache, if any.
+        If the build was restored from the cache without a package in this
+        format, the kernel is built first.
+
+        :param fmt: The package format.
+        :type fmt: PackageFormat
+        :return: The path to the package file.
+        :rtype: Path
+        """
+        with self.artifacts.lock:
+            packages = self.artifacts.packages
+            if fmt in packages:
+                return packages[fmt]
+
+            if self.builder is not None:
+                return self.__build_remote(self.builder, fmt)
+
+            if self.artifacts.from_cache:
+                logger.info(f"No {fmt.value} package in the cache, building")
+                self.__build_local()
+                self.artifacts.from_cache = False
+
+            self.make(fmt.target)
+            self.artifacts.release = self.make.kernel_release()
+            packages[fmt] = self.__pkg_filename(self.artifacts.release, fmt)
+            self.__store(packages[fmt])
+            return packages[fmt]
+
+    def stage(self) -> Path:
+        """
+        Install the kernel files in a staging directory inside the build tree.
 
-        self.ctx.make(args=self.build_options, parallel=self.parallel_build)
+        It uses the dir-pkg make target, and runs only once.
+
+        :return: The staging directory, laid out as the target root directory.
+        :rtype: Path
+        """
+        with self.artifacts.lock:
+            if self.artifacts.staging is None:
+                self.make("dir-pkg")
+                self.artifacts.release = self.make.kernel_release()
+                self.artifacts.staging = self.build_dir / "tar-install"
+
+            return self.artifacts.staging
+
+    def __pkg_filename(self, release: str, fmt: PackageFormat) -> Path:
+        arch = self.make.arch
+
+        if arch == "x86_64":
+            arch = "x86"
+
+        return self.build_dir / f"linux-{release}-{arch}{fmt.extension}"
 
 
 class Install(Task):
     """
     Install the kernel in the target machine.
+
+    By default, the kernel is installed in the target of the build Context.
+    To install the same build in another host, pass a Context created with
+    Context.fork(); the package is shared and the build runs only once.
+
+    In streaming mode, the package is piped into tar in the host over a
+    single channel, without staging it in /tmp. If the build has a local
+    build tree, the archive is even created on the fly from
+    the build staging directory, so compression overlaps with the transfer.
+
+    In delta mode, the host keeps a manifest of the installed files, and
+    only the files that changed since the last install of the same kernel
+    release are sent. Files that no longer exist in the package are removed.
     """
 
-    def __init__(self, build: Build, *args, **kwargs) -> None:
-        super().__init__(build.ctx, *args, **kwargs)
-        self.ctx.add_dependencies(self, build)
+    MANIFEST = "ktest.manifest"
+    MARKER = ".ktest"
+
+    def __init__(
+        self,
+        build: Build,
+        *args,
+        ctx: Context | None = None,
+        package_format: PackageFormat | None = PackageFormat.BZIP2,
+        delta: bool = False,
+        streaming: bool = False,
+        **kwargs,
+    ) -> None:
+        """
+        :param build: The task that builds the kernel.
+        :type build: Build
+        :param ctx: The Context of the target host. Defaults to the build Context.
+        :type ctx: Context | None
+        :param package_format: The package format. If None, choose it from the
+                               link speed to the host, measured once per
+                               connection.
+        :type package_format: PackageFormat | None
+        :param delta: Only send the files that changed.
+        :type delta: bool
+        :param streaming: Pipe the package into tar in the host.
+        :type streaming: bool
+        """
+        ctx = ctx or build.ctx
+        super().__init__(ctx, *args, **kwargs)
+        if ctx is build.ctx:
+            self.ctx.add_dependencies(self, build)
         self.build = build
-        self.__extension = ".tar.bz2"
+        self.package_format = package_format
+        self.delta = delta
+        self.streaming = streaming
 
     def execute(self):
-        target = self.__extension.replace(".", "")
-        pkg = self.__pkg_filename()
-        dest = Path("/tmp") / pkg
+        try:
+            if self.delta:
+                self.__install_delta()
+            else:
+                self.__install_package()
 
-        self.ctx.make(f"{target}-pkg")
-        self.ctx.connection.put(src=pkg, dest=dest)
-        self.ctx.connection.run_command(f"tar -xjf {dest} -C /")
+            # Let a later run check that this install is still in place
+            if self.ctx.journal is not None:
+                self.__write_marker()
+        finally:
+            # The kernel install scripts may have changed the boot entries
+            facts.invalidate(self.ctx.connection)
 
-    def __pkg_filename(self) -> Path:
-        release = self.ctx.make.kernel_release()
-        arch = self.ctx.make.arch
+    def fingerprint(self) -> str:
+        return journal.fingerprint(
+            "Install",
+            self.build.input_fingerprint,
+            self.ctx.connection.address,
+            self.package_format.value if self.package_format else None,
+            self.delta,
+            self.streaming,
+        )
 
-        if arch == "x86_64":
-            arch = "x86"
+    def checkpoint(self) -> dict[str, Any]:
+        return {"release": self.build.artifacts.release}
+
+    def resume(self, state: dict[str, Any]) -> bool:
+        # The host may have been reinstalled since
+        release = state["release"]
+        if not self.is_installed(release):
+            return False
+
+        with self.build.artifacts.lock:
+            self.build.artifacts.release = release
+        return True
+
+    def is_installed(self, release: str) -> bool:
+        """
+        Check that the host has the kernel release installed by this task.
+
+        With a Context journal, the install writes the task fingerprint in
+        the MARKER file of the modules directory of the release.
+
+        :param release: The kernel release.
+        :type release: str
+        :rtype: bool
+        """
+        marker = shlex.quote(f"/lib/modules/{release}/{self.MARKER}")
+        installed = self.ctx.connection.run_command(
+            f"cat {marker} 2> /dev/null || true", capture_output=True
+        )
+        return installed.strip() == self.fingerprint()
+
+    def __write_marker(self) -> None:
+        release = self.build.artifacts.release
+        assert release is not None
+        marker = shlex.quote(f"/lib/modules/{release}/{self.MARKER}")
+        self.ctx.connection.run_command(f"echo {self.fingerprint()} > {marker}")
+
+    def __install_package(self) -> None:
+        fmt = self.package_format
+        if fmt is None:
+            fmt = pkg.choose_format(facts.link_speed(self.ctx.connection))
+
+        if self.streaming and not self.build.artifacts.prebuilt:
+            self.__stream_staging(fmt)
+        else:
+            self.__install(self.build.package(fmt))
+
+    def __install(self, package: Path) -> None:
+        connection = self.ctx.connection
+
+        if self.streaming:
+            fmt = PackageFormat.from_path(package)
+            with open(package, "rb") as f:
+                connection.pipe_command(f"tar -x {fmt.tar_option} -f - -C /", f)
+            return
+
+        dest = Path("/tmp") / package.name
+        connection.put(src=package, dest=dest)
+        connection.run_command(f"tar -xf {dest} -C / && rm -f {dest}")
+
+    def __stream_staging(self, fmt: PackageFormat) -> None:
+        staging = self.build.stage()
+        cmd = ["tar", "-c", "--owner=0", "--group=0", "-f", "-", "-C", staging, "."]
+        if fmt.tar_option:
+            cmd.insert(1, fmt.tar_option)
+
+        with subprocess.Popen(cmd, stdout=subprocess.PIPE) as p:
+            assert p.stdout is not None
+            self.ctx.connection.pipe_command(
+                f"tar -x {fmt.tar_option} -f - -C /", p.stdout
+            )
+
+        if p.returncode:
+            raise subprocess.CalledProcessError(p.returncode, cmd)
+
+    def __install_delta(self) -> None:
+        package = self.build.package(PackageFormat.TAR)
+        release = self.build.artifacts.release
+        manifest_path = f"lib/modules/{release}/{self.MANIFEST}"
+        connection = self.ctx.connection
+
+        files = pkg.manifest(package)
+        installed = pkg.loads_manifest(
+            connection.run_command(
+                f"cat /{manifest_path} 2>/dev/null || true", capture_output=True
+            )
+        )
+
+        changed = {
+            name for name, digest in files.items() if installed.get(name) != digest
+        }
+        removed = set(installed) - set(files)
+        logger.info(
+            f"Delta install: {len(changed)} changed, {len(removed)} removed, "
+            + f"{len(files) - len(changed)} unchanged files"
+        )
+
+        if removed:
+            # Any number of paths, without the command line length limit
+            names = b"".join(f"{name}\0".encode() for name in sorted(removed))
+            connection.pipe_command("cd / && xargs -0 rm -f --", io.BytesIO(names))
+
+        if changed or removed:
+            with self.ctx.create_temp_dir() as tmp:
+                delta = Path(tmp) / f"delta-{package.name}"
+                pkg.write_delta(
+                    package,
+                    delta,
+                    changed,
+                    {manifest_path: pkg.dumps_manifest(files)},
+                )
+                self.__install(delta)
+
+
+class Boot(Task):
+    """
+    Boot the installed kernel in the target machine.
+
+    Create the initramfs, add a boot entry for the kernel, select it for the
+    next boot only with grub2-reboot, reboot the machine and wait until it
+    runs the new kernel.
+
+    With kexec, the kernel is booted without going through the firmware and
+    the boot loader; the grub2-reboot entry is the fallback if it fails.
+    """
+
+    def __init__(
+        self, install: Install, *args, cmdline: str = "", kexec=False, **kwargs
+    ) -> None:
+        """
+        :param install: The task that installs the kernel.
+        :type install: Install
+        :param cmdline: Additional kernel command line arguments.
+        :type cmdline: str
+        :param kexec: Boot the kernel with kexec.
+        :type kexec: bool
+        """
+        super().__init__(install.ctx, *args, **kwargs)
+        self.ctx.add_dependencies(self, install)
+        self.install = install
+        self.cmdline = cmdline
+        self.kexec = kexec
+
+    def execute(self) -> None:
+        release = self.install.build.artifacts.release
+        assert release is not None
+
+        kernel = f"/boot/vmlinuz-{release}"
+        initrd = f"/boot/initramfs-{release}.img"
+        with self.ctx.connection.batch() as batch:
+            make_initrd(batch, release)
+            grubby = Grubby(batch, kernel)
+            grubby.add_kernel(args=self.cmdline, initrd=initrd)
+            grub.grub2reboot(batch, grub.title(batch, release))
+            cmdline = grubby.cmdline if self.kexec else ""
+
+        if self.kexec:
+            kexec.boot(self.ctx, release, kernel, initrd, cmdline)
+        else:
+            self.ctx.reboot(release=release)
+
+    def fingerprint(self) -> str:
+        return journal.fingerprint(
+            "Boot", self.install.fingerprint(), self.cmdline, self.kexec
+        )
+
+    def checkpoint(self) -> dict[str, Any]:
+        return {"release": self.install.build.artifacts.release}
+
+    def resume(self, state: dict[str, Any]) -> bool:
+        # The host may have rebooted into another kernel since
+        release = state["release"]
+        if facts.facts(self.ctx.connection).kernel_release != release:
+            return False
+        if not self.install.is_installed(release):
+            return False
 
-        return Path(f"{self.ctx.build_dir}/linux-{release}-{arch}.tar.bz2")
+        with self.install.build.artifacts.lock:
+            self.install.build.artifacts.release = release
+        return True
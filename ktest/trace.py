@@ -0,0 +1,374 @@
+import os
+import json
+import time
+import resource
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import IO, Any, Iterator
+
+from git.types import PathLike
+
+from .connection.base import Connection, FilesType
+from .connection.batch import CommandBatch
+from .connection.transfer import ProgressType, TransferChannel, TransferStats
+
+
+@dataclass
+class Span:
+    """
+    The measurements of a task run.
+
+    Times are in seconds. start is relative to the creation of the Tracer.
+    cpu is the CPU time of the thread running the task. children_cpu is the
+    CPU time of the child processes, like make and the compiler, that
+    finished while the task ran; it is process wide, so with concurrent
+    tasks it includes the children of the other tasks.
+    """
+
+    name: str
+    start: float
+    thread: int
+    args: dict[str, Any] = field(default_factory=dict)
+    wall: float = 0.0
+    cpu: float = 0.0
+    children_cpu: float = 0.0
+    bytes_sent: int = 0
+    bytes_received: int = 0
+    commands: list[tuple[str, float, float]] = field(default_factory=list)
+
+    @property
+    def command_time(self) -> float:
+        """Return the total time spent in remote commands."""
+        return sum(duration for _, _, duration in self.commands)
+
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "ktest_span", default=None
+)
+
+
+def _cpu(who: int) -> float:
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Tracer:
+    """
+    Collect timing and resource usage of tasks.
+
+    Pass a Tracer to the Context to instrument every task it runs, and the
+    commands and transfers of its connection.
+    """
+
+    def __init__(self) -> None:
+        self.__origin = time.perf_counter()
+        self.__lock = threading.Lock()
+        self.spans: list[Span] = []
+
+    def now(self) -> float:
+        """Return the time, in seconds, since the creation of the Tracer."""
+        return time.perf_counter() - self.__origin
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[Span]:
+        """
+        Measure a block of code.
+
+        :param name: The span name.
+        :type name: str
+        :param args: Additional information recorded with the span.
+        """
+        span = Span(name, self.now(), threading.get_ident(), args)
+        token = _current.set(span)
+        cpu = _cpu(resource.RUSAGE_THREAD)
+        children_cpu = _cpu(resource.RUSAGE_CHILDREN)
+        try:
+            yield span
+        finally:
+            span.wall = self.now() - span.start
+            span.cpu = _cpu(resource.RUSAGE_THREAD) - cpu
+            span.children_cpu = _cpu(resource.RUSAGE_CHILDREN) - children_cpu
+            _current.reset(token)
+            with self.__lock:
+                self.spans.append(span)
+
+    def record_command(self, cmd: str, start: float, duration: float) -> None:
+        """
+        Record a remote command in the current span.
+
+        :param cmd: The command line.
+        :type cmd: str
+        :param start: The command start time, as returned by now().
+        :type start: float
+        :param duration: The command duration in seconds.
+        :type duration: float
+        """
+        span = _current.get()
+        if span is not None:
+            span.commands.append((cmd, start, duration))
+
+    def record_transfer(self, sent: int = 0, received: int = 0) -> None:
+        """
+        Record transferred bytes in the current span.
+
+        :param sent: The number of bytes sent to the host.
+        :type sent: int
+        :param received: The number of bytes received from the host.
+        :type received: int
+        """
+        span = _current.get()
+        if span is not None:
+            span.bytes_sent += sent
+            span.bytes_received += received
+
+    def chrome_trace(self) -> dict[str, Any]:
+        """
+        Export the spans in the Chrome trace event format.
+
+        The result can be loaded in chrome://tracing or ui.perfetto.dev.
+
+        :rtype: dict
+        """
+        pid = os.getpid()
+        events: list[dict[str, Any]] = []
+
+        for span in self.spans:
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": "task",
+                    "ph": "X",
+                    "ts": span.start * 1e6,
+                    "dur": span.wall * 1e6,
+                    "pid": pid,
+                    "tid": span.thread,
+                    "args": {
+                        **{k: str(v) for k, v in span.args.items()},
+                        "cpu": span.cpu,
+                        "children_cpu": span.children_cpu,
+                        "bytes_sent": span.bytes_sent,
+                        "bytes_received": span.bytes_received,
+                    },
+                }
+            )
+            for cmd, start, duration in span.commands:
+                events.append(
+                    {
+                        "name": cmd,
+                        "cat": "command",
+                        "ph": "X",
+                        "ts": start * 1e6,
+                        "dur": duration * 1e6,
+                        "pid": pid,
+                        "tid": span.thread,
+                    }
+                )
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: PathLike) -> None:
+        """
+        Write the spans to a Chrome trace JSON file.
+
+        :param path: The output file path.
+        :type path: str | os.PathLike
+        """
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self) -> str:
+        """
+        Format the spans as a table.
+
+        :rtype: str
+        """
+        header = (
+            "Task",
+            "Wall(s)",
+            "CPU(s)",
+            "Children(s)",
+            "Sent(MiB)",
+            "Recv(MiB)",
+            "Cmds",
+            "Cmd(s)",
+        )
+        rows = [
+            (
+                span.name,
+                f"{span.wall:.2f}",
+                f"{span.cpu:.2f}",
+                f"{span.children_cpu:.2f}",
+                f"{span.bytes_sent / 2**20:.2f}",
+                f"{span.bytes_received / 2**20:.2f}",
+                str(len(span.commands)),
+                f"{span.command_time:.2f}",
+            )
+            for span in sorted(self.spans, key=lambda s: s.start)
+        ]
+
+        widths = [
+            max(len(row[i]) for row in [header, *rows]) for i in range(len(header))
+        ]
+        return "\n".join(
+            "  ".join(
+                cell.ljust(w) if i == 0 else cell.rjust(w)
+                for i, (cell, w) in enumerate(zip(row, widths))
+            )
+            for row in [header, *rows]
+        )
+
+
+class _CountingReader:
+    """Count the bytes read from a stream."""
+
+    def __init__(self, stream: IO[bytes]) -> None:
+        self.stream = stream
+        self.count = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.count += len(data)
+        return data
+
+
+class _TracedChannel:
+    """A TransferChannel that records its transfers in a Tracer."""
+
+    def __init__(self, channel: TransferChannel, tracer: Tracer) -> None:
+        self.channel = channel
+        self.tracer = tracer
+
+    def put(self, src: PathLike, dest: PathLike) -> None:
+        self.channel.put(src, dest)
+        self.tracer.record_transfer(sent=os.path.getsize(src))
+
+    def get(self, src: PathLike, dest: PathLike) -> None:
+        self.channel.get(src, dest)
+        self.tracer.record_transfer(received=os.path.getsize(dest))
+
+
+class TracedConnection(Connection):
+    """
+    A Connection that records its commands and transfers in a Tracer.
+
+    Every public method of Connection is delegated to the traced connection,
+    so the overrides of its backend, e.g. the SFTP channel of each ssh
+    transfer, are kept. Other attributes are looked up in the traced
+    connection too.
+    """
+
+    def __init__(self, connection: Connection, tracer: Tracer) -> None:
+        """
+        :param connection: The traced Connection object.
+        :type connection: Connection
+        :param tracer: The Tracer object.
+        :type tracer: Tracer
+        """
+        self.connection = connection
+        self.tracer = tracer
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.connection, name)
+
+    def __record_command(self, cmd: PathLike, start: float) -> None:
+        self.tracer.record_command(os.fspath(cmd), start, self.tracer.now() - start)
+
+    def run_command(self, cmd: PathLike, capture_output=False) -> str:
+        start = self.tracer.now()
+        try:
+            return self.connection.run_command(cmd, capture_output)
+        finally:
+            self.__record_command(cmd, start)
+
+    def put(self, src: PathLike, dest: PathLike) -> None:
+        self.connection.put(src, dest)
+        self.tracer.record_transfer(sent=os.path.getsize(src))
+
+    def get(self, src: PathLike, dest: PathLike) -> None:
+        self.connection.get(src, dest)
+        self.tracer.record_transfer(received=os.path.getsize(dest))
+
+    def pipe_command(self, cmd: PathLike, stdin: IO[bytes]) -> None:
+        reader = _CountingReader(stdin)
+        start = self.tracer.now()
+        try:
+            self.connection.pipe_command(cmd, reader)  # type: ignore[arg-type]
+        finally:
+            self.__record_command(cmd, start)
+            self.tracer.record_transfer(sent=reader.count)
+
+    @contextmanager
+    def transfer_channel(self) -> Iterator[TransferChannel]:
+        with self.connection.transfer_channel() as channel:
+            yield _TracedChannel(channel, self.tracer)
+
+    def put_many(
+        self,
+        files: FilesType,
+        max_workers: int = 4,
+        progress: ProgressType | None = None,
+        skip_unchanged=True,
+    ) -> TransferStats:
+        stats = self.connection.put_many(files, max_workers, progress, skip_unchanged)
+        self.tracer.record_transfer(sent=stats.bytes)
+        return stats
+
+    def get_many(
+        self,
+        files: FilesType,
+        max_workers: int = 4,
+        progress: ProgressType | None = None,
+        skip_unchanged=True,
+    ) -> TransferStats:
+        stats = self.connection.get_many(files, max_workers, progress, skip_unchanged)
+        self.tracer.record_transfer(received=stats.bytes)
+        return stats
+
+    def sync_dir(
+        self,
+        src: PathLike,
+        dest: PathLike,
+        upload=True,
+        max_workers: int = 4,
+        progress: ProgressType | None = None,
+        checksum=False,
+    ) -> TransferStats:
+        stats = self.connection.sync_dir(
+            src, dest, upload, max_workers, progress, checksum
+        )
+        if upload:
+            self.tracer.record_transfer(sent=stats.bytes)
+        else:
+            self.tracer.record_transfer(received=stats.bytes)
+        return stats
+
+    @property
+    def address(self) -> tuple[str, int] | None:
+        return self.connection.address
+
+    def batch(self) -> CommandBatch:
+        # The batch runs through run_command, so its round trips are recorded
+        return CommandBatch(self)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    async def arun_command(self, cmd: PathLike, capture_output=False) -> str:
+        start = self.tracer.now()
+        try:
+            return await self.connection.arun_command(cmd, capture_output)
+        finally:
+            self.__record_command(cmd, start)
+
+    async def aput(self, src: PathLike, dest: PathLike) -> None:
+        await self.connection.aput(src, dest)
+        self.tracer.record_transfer(sent=os.path.getsize(src))
+
+    async def aget(self, src: PathLike, dest: PathLike) -> None:
+        await self.connection.aget(src, dest)
+        self.tracer.record_transfer(received=os.path.getsize(dest))
+
+
+__all__ = ["Span", "TracedConnection", "Tracer"]
@@ -1,12 +1,17 @@
 import subprocess
 import os
-from typing import IO
+import codecs
+import selectors
+from collections import deque
+from typing import IO, Callable, Iterator
 from os.path import expandvars, expanduser
 
 from git.types import PathLike
 
 from ._log import logger
 
+_READ_SIZE = 65536
+
 
 def log_output(output: IO[str] | None) -> None:
     """Log the content of an IO object.
@@ -21,45 +26,113 @@ def log_output(output: IO[str] | None) -> None:
             logger.info(line.rstrip("\n"))
 
 
-def run_cmd(cmd: str, capture_output=False, **kwargs) -> str:
+def iter_cmd(cmd: str, capture_stderr=False, **kwargs) -> Iterator[tuple[str, str]]:
     """
-    Run a shell command.
+    Run a shell command and yield its output lines as they arrive.
+
+    stdout and stderr are read concurrently, so the command never blocks on
+    a full pipe. Each line keeps its line terminator, except maybe the last.
+    If the consumer stops the iteration early, the command is killed.
 
     :param cmd: The command line to execute.
     :type cmd: str
-    :param capture_output: Should we return the command output?
-    :type capture_output: bool
+    :param capture_stderr: If True, yield stderr lines separately. Otherwise,
+                           stderr is merged into stdout.
+    :type capture_stderr: bool
     :param kwargs: Keyword paramaters compatible with subprocess.Popen
 
     :raise subprocess.CalledProcessError: If we fail to execute the command.
 
-    :return: If capture_output is True, return the output of the command. Otherwise,
-             return an empty string.
+    :return: An iterator of (stream, line) pairs, where stream is "stdout"
+             or "stderr".
     """
     logger.info(cmd)
 
     with subprocess.Popen(
         cmd,
         shell=True,
-        text=True,
         stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE if capture_output else subprocess.STDOUT,
-        **kwargs
-    ) as p:
-
-        if capture_output:
-            log_output(p.stderr)
-        else:
-            log_output(p.stdout)
-
+        stderr=subprocess.PIPE if capture_stderr else subprocess.STDOUT,
+        **kwargs,
+    ) as p, selectors.DefaultSelector() as selector:
+        try:
+            for name, stream in (("stdout", p.stdout), ("stderr", p.stderr)):
+                if stream:
+                    os.set_blocking(stream.fileno(), False)
+                    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+                    selector.register(stream, selectors.EVENT_READ, [name, decoder, ""])
+
+            while selector.get_map():
+                for key, _ in selector.select():
+                    name, decoder, pending = key.data
+                    data = os.read(key.fd, _READ_SIZE)
+                    text = pending + decoder.decode(data, final=not data)
+                    lines = text.split("\n")
+                    key.data[2] = lines.pop()
+
+                    for line in lines:
+                        yield name, line + "\n"
+
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        if key.data[2]:
+                            yield name, key.data[2]
+        except BaseException:
+            # The consumer stopped early (GeneratorExit) or failed: nobody
+            # reads the output anymore, so stop the command instead of letting
+            # it block on a full pipe. Popen.__exit__ then reaps it.
+            p.kill()
+            raise
+
+        # After EOF, the command may still run with its output closed
         rc = p.wait()
         if rc:
             raise subprocess.CalledProcessError(rc, p.args)
 
-        if capture_output and p.stdout:
-            return "".join(p.stdout.readlines())
 
-        return ""
+def run_cmd(
+    cmd: str,
+    capture_output=False,
+    capture_limit: int | None = None,
+    on_output: Callable[[str, str], None] | None = None,
+    **kwargs,
+) -> str:
+    """
+    Run a shell command.
+
+    :param cmd: The command line to execute.
+    :type cmd: str
+    :param capture_output: Should we return the command output?
+    :type capture_output: bool
+    :param capture_limit: If set, only the last capture_limit lines of output
+                          are kept.
+    :type capture_limit: int | None
+    :param on_output: A callable that receives each (stream, line) pair as
+                      it arrives.
+    :type on_output: Callable[[str, str], None] | None
+    :param kwargs: Keyword paramaters compatible with subprocess.Popen
+
+    :raise subprocess.CalledProcessError: If we fail to execute the command.
+
+    :return: If capture_output is True, return the output of the command. Otherwise,
+             return an empty string.
+    """
+    captured: deque[str] = deque(maxlen=capture_limit)
+
+    try:
+        for stream, line in iter_cmd(cmd, capture_stderr=capture_output, **kwargs):
+            if on_output:
+                on_output(stream, line)
+
+            if capture_output and stream == "stdout":
+                captured.append(line)
+            else:
+                logger.info(line.rstrip("\n"))
+    except subprocess.CalledProcessError as ex:
+        ex.output = "".join(captured)
+        raise
+
+    return "".join(captured)
 
 
 def expd(p: bytes | PathLike) -> str:
@@ -96,4 +169,4 @@ def expd(p: bytes | PathLike) -> str:
     return expandvars(expanduser(os.fspath(p)))
 
 
-__all__ = ["log_output", "run_cmd", "expd"]
+__all__ = ["log_output", "iter_cmd", "run_cmd", "expd"]
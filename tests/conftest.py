@@ -1,10 +1,46 @@
 from logging import StreamHandler, INFO
+import socket
+import subprocess
+import threading
+from typing import Iterator
 from io import StringIO
+from pathlib import Path
 import copy
 
+import paramiko
 import pytest
+from paramiko.common import AUTH_SUCCESSFUL, OPEN_SUCCEEDED
+from git.types import PathLike
 
 from ktest._log import logger
+from ktest.connection.base import Connection
+from ktest.connection.ssh import HostConfig
+from ktest.util import run_cmd
+
+
+class FakeConnection(Connection):
+    """
+    A Connection that records its commands, and runs them in a local shell
+    if shell is True. Transfers do nothing, except that get() writes
+    content to the destination file.
+    """
+
+    def __init__(self, shell=False, content=b"") -> None:
+        self.shell = shell
+        self.content = content
+        self.commands: list[str] = []
+
+    def run_command(self, cmd: PathLike, capture_output=False) -> str:
+        self.commands.append(str(cmd))
+        if self.shell:
+            return run_cmd(str(cmd), capture_output=capture_output)
+        return ""
+
+    def put(self, src: PathLike, dest: PathLike) -> None:
+        pass
+
+    def get(self, src: PathLike, dest: PathLike) -> None:
+        Path(dest).write_bytes(self.content)
 
 
 def remove_log_handlers() -> None:
@@ -23,3 +59,77 @@ def log_stream() -> StringIO:
     logger.setLevel(INFO)
 
     return log_stre
+
+
+@pytest.fixture
+def fake_connection() -> FakeConnection:
+    """Return a fake connection that only records the commands."""
+    return FakeConnection()
+
+
+@pytest.fixture
+def shell_connection() -> FakeConnection:
+    """Return a fake connection that runs the commands in a local shell."""
+    return FakeConnection(shell=True)
+
+
+class SSHServer(paramiko.ServerInterface):
+    """Accept any password and run the exec requests in a local shell."""
+
+    def get_allowed_auths(self, username: str) -> str:
+        return "password"
+
+    def check_auth_password(self, username: str, password: str) -> int:
+        return AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind: str, chanid: int) -> int:
+        return OPEN_SUCCEEDED
+
+    def check_channel_exec_request(
+        self, channel: paramiko.Channel, command: bytes
+    ) -> bool:
+        threading.Thread(target=self.exec, args=(channel, command)).start()
+        return True
+
+    @staticmethod
+    def exec(channel: paramiko.Channel, command: bytes) -> None:
+        p = subprocess.run(command, shell=True, capture_output=True)
+        channel.sendall(p.stdout + p.stderr)
+        # Like OpenSSH, send the end of the output before the exit status
+        channel.shutdown_write()
+        channel.send_exit_status(p.returncode)
+        channel.close()
+
+
+@pytest.fixture(scope="session")
+def ssh_config() -> Iterator[HostConfig]:
+    """Run a ssh server in the process, and return its configuration."""
+    key = paramiko.RSAKey.generate(2048)
+    listener = socket.create_server(("127.0.0.1", 0))
+    transports: list[paramiko.Transport] = []
+
+    def serve() -> None:
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(sock)
+            transport.add_server_key(key)
+            transport.start_server(server=SSHServer())
+            transports.append(transport)
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield HostConfig(
+        "127.0.0.1",
+        user="root",
+        port=listener.getsockname()[1],
+        connect_kwargs={
+            "password": "root",
+            "look_for_keys": False,
+            "allow_agent": False,
+        },
+    )
+    listener.close()
+    for transport in transports:
+        transport.close()
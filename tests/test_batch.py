@@ -0,0 +1,43 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from .conftest import FakeConnection
+
+
+def test_batch(shell_connection: FakeConnection, tmp_path: Path) -> None:
+    connection = shell_connection
+    with connection.batch() as batch:
+        batch.run_command(f"echo a > {tmp_path}/a")
+        batch.run_command(f"cat {tmp_path}/a >> {tmp_path}/b")
+        assert not connection.commands
+        assert batch.run_command(f"cat {tmp_path}/b", capture_output=True) == "a\n"
+        assert len(connection.commands) == 1
+        assert batch.run_command("printf x", capture_output=True) == "x"
+        batch.run_command(f"touch {tmp_path}/c")
+
+    assert len(connection.commands) == 3
+    assert (tmp_path / "c").exists()
+
+
+def test_batch_failure(shell_connection: FakeConnection, tmp_path: Path) -> None:
+    batch = shell_connection.batch()
+    batch.run_command("echo error; exit 3")
+    batch.run_command(f"touch {tmp_path}/a")
+
+    with pytest.raises(subprocess.CalledProcessError) as ex:
+        batch.flush()
+
+    assert ex.value.returncode == 3
+    assert ex.value.output == "error\n"
+    assert not (tmp_path / "a").exists()
+
+
+def test_batch_no_check(shell_connection: FakeConnection) -> None:
+    batch = shell_connection.batch()
+    batch.run_command("false")
+    batch.run_command("echo ok")
+    results = batch.flush(check=False)
+
+    assert [(r.stdout, r.returncode) for r in results] == [("", 1), ("ok\n", 0)]
@@ -0,0 +1,66 @@
+import threading
+from pathlib import Path
+
+import pytest
+from git.objects import Commit
+from git.repo import Repo
+
+from ktest.bisect import Bisect, KernelTest
+from ktest.connection.base import NullFactory
+from ktest.context import Context
+
+
+@pytest.fixture(scope="module")
+def repo(tmp_path_factory: pytest.TempPathFactory) -> Repo:
+    path: Path = tmp_path_factory.mktemp("linux")
+    repo = Repo.init(path)
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "ktest")
+        config.set_value("user", "email", "ktest@example.com")
+
+    for i in range(40):
+        (path / "VERSION").write_text(str(i))
+        repo.index.add(["VERSION"])
+        repo.index.commit(str(i))
+
+    return repo
+
+
+def number(commit: Commit) -> int:
+    return int(str(commit.message))
+
+
+@pytest.mark.parametrize("workers", [1, 2, 5])
+@pytest.mark.parametrize("first_bad", [1, 17, 39])
+def test_bisect(repo: Repo, workers: int, first_bad: int) -> None:
+    tested: list[int] = []
+    slots: set[int] = set()
+    lock = threading.Lock()
+
+    def evaluate(commit: Commit, slot: int) -> bool:
+        with lock:
+            tested.append(number(commit))
+            slots.add(slot)
+        return number(commit) < first_bad
+
+    commit = Bisect(repo, "HEAD~39", "HEAD", evaluate, workers=workers).run()
+
+    assert number(commit) == first_bad
+    assert slots <= set(range(workers))
+    assert len(tested) == len(set(tested))
+
+
+def test_bisect_invalid(repo: Repo) -> None:
+    with pytest.raises(ValueError):
+        Bisect(repo, "HEAD", "HEAD~1", lambda c, s: True).run()
+
+
+def test_kernel_test_branches(repo: Repo, tmp_path: Path) -> None:
+    ctx = Context(repo, temp_dir=tmp_path)
+    evaluate = KernelTest(
+        ctx, [NullFactory()], lambda c: True, config=tmp_path / "missing.config"
+    )
+
+    with pytest.raises(FileNotFoundError):
+        evaluate(repo.head.commit, 0)
+    assert "ktest-bisect-0" not in repo.heads
@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+
+from ktest.cache import BuildCache
+from ktest.package import PackageFormat
+
+
+def make_package(tmp_path: Path, name: str, size: int) -> Path:
+    package = tmp_path / name
+    package.write_bytes(b"x" * size)
+    return package
+
+
+def test_key() -> None:
+    key = BuildCache.key("abc", b"CONFIG_X=y", "", "x86_64")
+    assert key == BuildCache.key("abc", b"CONFIG_X=y", "", "x86_64")
+    assert key != BuildCache.key("abc", b"CONFIG_X=y", "W=1", "x86_64")
+    assert key != BuildCache.key("abc", b"CONFIG_X=y", "", "arm64")
+    assert key != BuildCache.key("abd", b"CONFIG_X=y", "", "x86_64")
+
+
+def test_store_lookup(tmp_path: Path) -> None:
+    cache = BuildCache(tmp_path / "cache")
+    assert cache.lookup("key") is None
+
+    package = make_package(tmp_path, "linux-6.0-x86.tar.bz2", 16)
+    cache.store("key", package, "6.0")
+
+    entry = cache.lookup("key")
+    assert entry is not None
+    assert entry.release == "6.0"
+    assert list(entry.packages) == [PackageFormat.BZIP2]
+    cached = entry.packages[PackageFormat.BZIP2]
+    assert cached.name == package.name
+    assert cached.read_bytes() == package.read_bytes()
+
+    # Other formats are added to the same entry
+    cache.store("key", make_package(tmp_path, "linux-6.0-x86.tar", 32), "6.0")
+    entry = cache.lookup("key")
+    assert entry is not None
+    assert set(entry.packages) == {PackageFormat.BZIP2, PackageFormat.TAR}
+
+
+def test_evict(tmp_path: Path) -> None:
+    cache = BuildCache(tmp_path / "cache", max_size=250)
+
+    for i in range(3):
+        cache.store(f"key{i}", make_package(tmp_path, f"pkg{i}.tar", 100), str(i))
+        os.utime(cache.root / f"key{i}", (i, i))
+
+    # key0 was the least recently used
+    assert cache.lookup("key0") is None
+    assert cache.lookup("key1") is not None
+    assert cache.lookup("key2") is not None
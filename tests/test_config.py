@@ -0,0 +1,62 @@
+import doctest
+from pathlib import Path
+
+from git.repo import Repo
+
+from ktest import config
+
+
+def test_doctest() -> None:
+    assert doctest.testmod(config).failed == 0
+
+
+def test_merge() -> None:
+    base = "CONFIG_A=y\nCONFIG_B=m\n# CONFIG_C is not set\n"
+    fragments = ["CONFIG_B=y\nCONFIG_D=y\n", "# CONFIG_A is not set\nCONFIG_D=m\n"]
+    assert config.parse(config.merge(base, fragments)) == {
+        "CONFIG_A": None,
+        "CONFIG_B": "y",
+        "CONFIG_C": None,
+        "CONFIG_D": "m",
+    }
+
+
+def test_check() -> None:
+    requested = "CONFIG_A=y\n# CONFIG_B is not set\nCONFIG_C=y\n"
+    resolved = "CONFIG_A=y\nCONFIG_C=m\n"
+    assert config.check(requested, resolved) == ["CONFIG_C"]
+
+
+def test_up_to_date(tmp_path: Path) -> None:
+    digest = config.fingerprint("CONFIG_A=y\n", "x86_64")
+    assert digest != config.fingerprint("CONFIG_A=y\n", "arm64")
+    assert not config.up_to_date(tmp_path, digest)
+
+    dot_config = tmp_path / ".config"
+    dot_config.write_text("CONFIG_A=y\n")
+    config.record(tmp_path, digest)
+    assert config.up_to_date(tmp_path, digest)
+    assert not config.up_to_date(tmp_path, config.fingerprint("CONFIG_A=m\n"))
+
+    # A .config edited by hand is not up to date
+    dot_config.write_text("CONFIG_A=m\n")
+    assert not config.up_to_date(tmp_path, digest)
+
+
+def test_kconfig_digest(tmp_path: Path) -> None:
+    repo = Repo.init(tmp_path)
+    with repo.config_writer() as writer:
+        writer.set_value("user", "name", "ktest")
+        writer.set_value("user", "email", "ktest@example.com")
+
+    (tmp_path / "Kconfig").write_text("config A\n")
+    (tmp_path / "main.c").write_text("int main;\n")
+    repo.index.add(["Kconfig", "main.c"])
+    repo.index.commit("init")
+    digest = config.kconfig_digest(repo)
+
+    (tmp_path / "main.c").write_text("int main(void);\n")
+    assert config.kconfig_digest(repo) == digest
+
+    (tmp_path / "Kconfig").write_text("config B\n")
+    assert config.kconfig_digest(repo) != digest
@@ -1,3 +1,4 @@
+from concurrent.futures import ProcessPoolExecutor
 from typing import Sequence
 
 import pytest
@@ -41,3 +42,39 @@ def test_context_order(ctx: Context) -> None:
     ctx.run()
 
     assert order == [1, 2, 3, 4]
+
+
+def test_context_parallel(ctx: Context) -> None:
+    order: list[int] = []
+    t1 = FakeTask(ctx, 1, order)
+    t2 = FakeTask(ctx, 2, order, (t1,))
+    t3 = FakeTask(ctx, 3, order, (t1,))
+    FakeTask(ctx, 4, order, (t2, t3))
+    ctx.run(max_workers=4)
+
+    assert order[0] == 1
+    assert sorted(order[1:3]) == [2, 3]
+    assert order[3] == 4
+
+
+class FailTask(Task):
+    def execute(self) -> None:
+        raise RuntimeError("task failed")
+
+
+def test_context_parallel_failure(ctx: Context) -> None:
+    order: list[int] = []
+    t1 = FailTask(ctx)
+    FakeTask(ctx, 2, order, (t1,))
+    FakeTask(ctx, 3, order)
+
+    with pytest.raises(RuntimeError):
+        ctx.run(max_workers=2)
+
+    assert 2 not in order
+
+
+def test_context_process_pool(ctx: Context) -> None:
+    FakeTask(ctx, 1, [])
+    with pytest.raises(ValueError):
+        ctx.run(max_workers=2, executor=ProcessPoolExecutor)
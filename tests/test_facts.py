@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from ktest import facts, grub
+from ktest.connection.base import Connection
+from ktest.grubby import Grubby
+
+from .conftest import FakeConnection
+
+
+@pytest.fixture
+def connection(
+    shell_connection: FakeConnection, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> FakeConnection:
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    grubby = bin_dir / "grubby"
+    grubby.write_text(
+        "#!/bin/sh\n"
+        'case "$1" in\n'
+        "--default-kernel) echo /boot/vmlinuz-6.0 ;;\n"
+        "--default-title) echo 'Fedora (6.0)' ;;\n"
+        "esac\n"
+    )
+    grubby.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+
+    entries = tmp_path / "entries"
+    entries.mkdir()
+    monkeypatch.setattr(facts, "ENTRIES_DIR", str(entries))
+
+    return shell_connection
+
+
+def test_facts(connection: FakeConnection, tmp_path: Path) -> None:
+    machine_id = facts.gather(connection).machine_id
+    (tmp_path / "entries" / f"{machine_id}-6.0.conf").write_text(
+        "title Fedora (6.0)\nlinux /vmlinuz-6.0\n"
+    )
+    connection.commands.clear()
+
+    grubby = Grubby(connection, "/boot/vmlinuz-6.0")
+    assert grubby.defaut_kernel == "/boot/vmlinuz-6.0"
+    assert grubby.default_title == "Fedora (6.0)"
+    assert grub.title(connection, "6.0") == "Fedora (6.0)"
+    assert len(connection.commands) == 1
+
+    grubby.add_args("quiet")
+    assert len(connection.commands) == 2
+    assert grub.title(connection.batch(), "6.0") == "Fedora (6.0)"
+    assert len(connection.commands) == 3
+
+
+def test_link_speed(
+    fake_connection: FakeConnection, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    measured: list[Connection] = []
+
+    def link_speed(connection: Connection) -> float:
+        measured.append(connection)
+        return 1e6
+
+    monkeypatch.setattr(facts.pkg, "link_speed", link_speed)
+    connection = fake_connection
+
+    assert facts.link_speed(connection) == 1e6
+    assert facts.link_speed(connection.batch()) == 1e6
+    facts.invalidate(connection)
+    assert facts.link_speed(connection) == 1e6
+    assert measured == [connection]
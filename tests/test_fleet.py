@@ -0,0 +1,76 @@
+import pytest
+from git.repo import Repo
+
+from ktest.context import Context
+from ktest.fleet import Fleet
+from ktest.task import Task
+from ktest.connection.base import NullFactory
+
+
+class RecordTask(Task):
+    def __init__(self, ctx: Context, name: str, log: list[str], fail=False) -> None:
+        self.name = name
+        self.log = log
+        self.fail = fail
+        super().__init__(ctx)
+
+    def execute(self) -> None:
+        if self.fail:
+            raise RuntimeError(self.name)
+        self.log.append(self.name)
+
+
+@pytest.fixture
+def ctx() -> Context:
+    return Context(Repo())
+
+
+def test_fleet(ctx: Context) -> None:
+    log: list[str] = []
+    RecordTask(ctx, "build", log)
+
+    fleet = Fleet(ctx, {h: NullFactory() for h in ("a", "b", "c")}, max_hosts=2)
+
+    def setup(host_ctx: Context) -> None:
+        assert host_ctx is not ctx
+        assert host_ctx.build_dir == ctx.build_dir
+        RecordTask(host_ctx, "install", log)
+
+    results = fleet.run(setup)
+
+    assert log.count("build") == 1
+    assert log[0] == "build"
+    assert log.count("install") == 3
+    assert all(r.ok for r in results.values())
+    assert set(results) == {"a", "b", "c"}
+
+
+def test_fleet_failure(ctx: Context) -> None:
+    log: list[str] = []
+    fleet = Fleet(ctx, {"a": NullFactory(), "b": NullFactory()})
+
+    def setup(host_ctx: Context) -> None:
+        RecordTask(host_ctx, "install", log, fail=host_ctx.connection is bad)
+
+    bad = fleet.hosts["b"]()
+    fleet.hosts["b"] = lambda: bad
+    results = fleet.run(setup)
+
+    assert results["a"].ok
+    assert not results["b"].ok
+    assert isinstance(results["b"].error, RuntimeError)
+    assert log == ["install"]
+
+
+def test_fleet_run_twice(ctx: Context) -> None:
+    log: list[str] = []
+    RecordTask(ctx, "build", log)
+    fleet = Fleet(ctx, {"a": NullFactory()})
+
+    def setup(host_ctx: Context) -> None:
+        RecordTask(host_ctx, "install", log)
+
+    for _ in range(2):
+        assert fleet.run(setup, max_workers=2)["a"].ok
+
+    assert log == ["build", "install", "build", "install"]
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from ktest.jobserver import JobServer
+
+
+def test_slot_shared(tmp_path: Path) -> None:
+    jobserver = JobServer(slots=3, max_load=2.5, path=tmp_path / "jobserver")
+    with jobserver.slot() as (makeflags, (read, write)):
+        assert f"--jobserver-auth={read},{write}" in makeflags
+        assert makeflags.endswith(" -l2.5")
+        # The invocation holds one token, make can take the others
+        assert len(jobserver.acquire(2)) == 2
+        jobserver.release(b"++")
+
+    assert jobserver.acquire(3) == b"+++"
+
+
+def test_slot_weight(tmp_path: Path) -> None:
+    jobserver = JobServer(slots=4, path=tmp_path / "jobserver")
+    with jobserver.slot(weight=3) as (_, (read, _)):
+        assert os.read(read, 10) == b"++"
+        # One token is left to the other invocations
+        assert jobserver.acquire(1) == b"+"
+
+
+def test_slot_bound(tmp_path: Path) -> None:
+    jobserver = JobServer(slots=2, path=tmp_path / "jobserver")
+    lock = threading.Lock()
+    running = []
+    peak = 0
+
+    def job() -> None:
+        nonlocal peak
+        with jobserver.slot():
+            with lock:
+                running.append(1)
+                peak = max(peak, len(running))
+            time.sleep(0.05)
+            with lock:
+                running.pop()
+
+    threads = [threading.Thread(target=job) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert peak == 2
+
+
+def test_shared_fifo(tmp_path: Path) -> None:
+    first = JobServer(slots=2, path=tmp_path / "jobserver")
+    # Another process joins the pool filled by the first one
+    second = JobServer(slots=5, path=tmp_path / "jobserver")
+    assert second.slots == 2
+
+    tokens = first.acquire(2)
+    waiter = threading.Thread(target=lambda: second.release(second.acquire(1)))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()
+    first.release(tokens)
+    waiter.join()
+    assert second.acquire(2) == b"++"
+
+    first.close()
+    second.close()
+    third = JobServer(slots=3, path=tmp_path / "jobserver")
+    assert (third.slots, third.acquire(3)) == (3, b"+++")
+    third.reseed()
+    assert third.acquire(3) == b"+++"
+
+
+def test_slot_fifo_auth(tmp_path: Path) -> None:
+    jobserver = JobServer(slots=2, path=tmp_path / "jobserver", fifo_auth=True)
+    with jobserver.slot() as (makeflags, fds):
+        assert makeflags == f"-j --jobserver-auth=fifo:{tmp_path / 'jobserver'}"
+        assert fds == ()
+
+
+def test_make(tmp_path: Path) -> None:
+    # make -j2 with the pool of two slots: one is the implicit slot of make
+    (tmp_path / "Makefile").write_text(
+        "all: a b\na b:\n\t@touch $@.start; sleep 0.2; ls *.start | wc -l > $@\n"
+    )
+    jobserver = JobServer(slots=2, path=tmp_path / "jobserver")
+    with jobserver.slot() as (makeflags, fds):
+        env = dict(os.environ, MAKEFLAGS=makeflags)
+        subprocess.run(["make"], cwd=tmp_path, env=env, pass_fds=fds, check=True)
+
+    assert {(tmp_path / n).read_text() for n in "ab"} == {"2\n"}
+    assert jobserver.acquire(2) == b"++"
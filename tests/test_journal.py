@@ -0,0 +1,75 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+from git.repo import Repo
+
+from ktest.context import Context
+from ktest.journal import Journal, fingerprint
+from ktest.task import Task
+
+
+class Step(Task):
+    def __init__(self, ctx: Context, name: str, *args, fail=False, **kwargs) -> None:
+        super().__init__(ctx, *args, **kwargs)
+        self.name = name
+        self.fail = fail
+        self.runs = 0
+        self.output = ""
+
+    def execute(self) -> None:
+        self.runs += 1
+        if self.fail:
+            raise RuntimeError(f"{self.name} failed")
+        self.output = self.name.upper()
+
+    def fingerprint(self) -> str | None:
+        return fingerprint("Step", self.name)
+
+    def checkpoint(self) -> dict[str, Any]:
+        return {"output": self.output}
+
+    def resume(self, state: dict[str, Any]) -> bool:
+        self.output = state["output"]
+        return True
+
+
+def make_steps(path: Path, fail: bool) -> tuple[Context, list[Step]]:
+    ctx = Context(Repo(), temp_dir=path / "tmp", journal=Journal(path / "journal"))
+    a = Step(ctx, "a")
+    b = Step(ctx, "b", dependencies=[a])
+    c = Step(ctx, "c", dependencies=[b], fail=fail)
+    return ctx, [a, b, c]
+
+
+def test_journal_resume(tmp_path: Path) -> None:
+    ctx, steps = make_steps(tmp_path, fail=True)
+    with pytest.raises(RuntimeError):
+        ctx.run()
+    assert [s.runs for s in steps] == [1, 1, 1]
+
+    ctx, steps = make_steps(tmp_path, fail=False)
+    ctx.run()
+    assert [s.runs for s in steps] == [0, 0, 1]
+    assert [s.output for s in steps] == ["A", "B", "C"]
+
+    assert ctx.journal is not None
+    ctx.journal.clear()
+    ctx, steps = make_steps(tmp_path, fail=False)
+    ctx.run()
+    assert [s.runs for s in steps] == [1, 1, 1]
+
+
+def test_journal_file(tmp_path: Path) -> None:
+    path = tmp_path / "journal"
+    journal = Journal(path)
+    journal.record("1", "Step", {"output": "A"})
+    journal.record("2", "Step", {"output": "B"})
+    journal.record("1", "Step", {"output": "C"})
+    with open(path, "a") as f:
+        f.write('{"fingerprint": "3", "ta')
+
+    journal = Journal(path)
+    assert len(journal) == 2
+    assert journal.lookup("1") == {"output": "C"}
+    assert journal.lookup("3") is None
@@ -0,0 +1,58 @@
+import os
+import errno
+import subprocess
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+from ktest.connection import local
+
+
+@pytest.fixture
+def connection() -> local.Connection:
+    return local.ConnectionFactory().create_connection()
+
+
+def test_run_command(connection: local.Connection) -> None:
+    assert connection.run_command("echo hello", capture_output=True) == "hello\n"
+    assert connection.run_command("echo hello") == ""
+
+    with pytest.raises(subprocess.CalledProcessError):
+        connection.run_command("exit 1")
+
+
+def test_put_get(connection: local.Connection, tmp_path: Path) -> None:
+    data = os.urandom(3 * 2**20 + 1)
+    (tmp_path / "src").write_bytes(data)
+
+    connection.put(tmp_path / "src", tmp_path / "remote")
+    connection.get(tmp_path / "remote", tmp_path / "dest")
+    assert (tmp_path / "dest").read_bytes() == data
+
+
+def test_copy_fallback(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    def unsupported(*args):
+        raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+
+    monkeypatch.setattr(local.fcntl, "ioctl", unsupported)
+    monkeypatch.setattr(local.os, "copy_file_range", unsupported)
+    monkeypatch.setattr(local.os, "sendfile", unsupported)
+
+    (tmp_path / "src").write_bytes(b"data")
+    local.copy_file(tmp_path / "src", tmp_path / "dest")
+    assert (tmp_path / "dest").read_bytes() == b"data"
+
+
+def test_pipe_command(connection: local.Connection, tmp_path: Path) -> None:
+    data = os.urandom(2**20)
+    connection.pipe_command(f"cat > {tmp_path}/out", BytesIO(data))
+    assert (tmp_path / "out").read_bytes() == data
+
+    (tmp_path / "in").write_bytes(data)
+    with open(tmp_path / "in", "rb") as f:
+        connection.pipe_command(f"cat > {tmp_path}/out2", f)
+    assert (tmp_path / "out2").read_bytes() == data
+
+    with pytest.raises(subprocess.CalledProcessError):
+        connection.pipe_command("exit 1", BytesIO(data))
@@ -0,0 +1,107 @@
+import os
+import stat
+from io import StringIO
+from pathlib import Path
+
+from ktest.jobserver import JobServer
+from ktest.make import CompilerCache, CompilerCacheStats, KernelInfo, Make
+from ktest.util import run_cmd
+
+
+def fake_tool(tmp_path: Path, name: str, output: str) -> str:
+    tool = tmp_path / name
+    tool.write_text(f"#!/bin/sh\ncat <<'EOF'\n{output}\nEOF\n")
+    tool.chmod(tool.stat().st_mode | stat.S_IEXEC)
+    return os.fspath(tool)
+
+
+def test_compiler_cache_args(tmp_path: Path) -> None:
+    cache = CompilerCache(cache_dir=tmp_path, cc="clang", hostcc="gcc")
+    assert cache.make_args == "CC='ccache clang' HOSTCC='ccache gcc'"
+    assert cache.env == {"CCACHE_DIR": os.fspath(tmp_path)}
+
+
+def test_compiler_cache_default_cc(tmp_path: Path) -> None:
+    # The compiler variables of the kernel Makefile
+    makefile = tmp_path / "Makefile"
+    makefile.write_text(
+        "LLVM_PREFIX := $(if $(filter %/,$(LLVM)),$(LLVM))\n"
+        "LLVM_SUFFIX := $(if $(filter -%,$(LLVM)),$(LLVM))\n"
+        "all:\n"
+        "\t@echo $(CC),$(HOSTCC)\n"
+    )
+    make = f"make -s -C {tmp_path} {CompilerCache().make_args}"
+
+    assert run_cmd(make, capture_output=True) == "ccache gcc,ccache gcc\n"
+    assert (
+        run_cmd(f"{make} CROSS_COMPILE=aarch64-linux-gnu-", capture_output=True)
+        == "ccache aarch64-linux-gnu-gcc,ccache gcc\n"
+    )
+    assert (
+        run_cmd(f"{make} LLVM=-15", capture_output=True)
+        == "ccache clang-15,ccache clang-15\n"
+    )
+
+
+def test_ccache_stats(tmp_path: Path) -> None:
+    tool = fake_tool(
+        tmp_path,
+        "ccache",
+        "direct_cache_hit\t3\npreprocessed_cache_hit\t1\ncache_miss\t4",
+    )
+    stats = CompilerCache(tool=tool).stats()
+    assert stats == CompilerCacheStats(hits=4, misses=4)
+    assert stats.hit_rate == 0.5
+    assert stats - CompilerCacheStats(1, 1) == CompilerCacheStats(3, 3)
+
+
+def test_make_compiler_cache(tmp_path: Path, log_stream: StringIO) -> None:
+    make = Make(
+        srcdir=tmp_path,
+        outdir=tmp_path,
+        arch="x86_64",
+        make="echo make",
+        compiler_cache=CompilerCache(cache_dir=tmp_path, cc="gcc", hostcc="gcc"),
+    )
+    make("bzImage")
+    assert "CC=ccache gcc HOSTCC=ccache gcc" in log_stream.getvalue()
+
+
+def test_make_query(tmp_path: Path) -> None:
+    log = tmp_path / "make.log"
+    tool = tmp_path / "make"
+    tool.write_text(
+        f'#!/bin/sh\necho "$@" >> {log}\n'
+        "printf '6.1.0-rc1\\n6.1.0-rc1\\narch/x86/boot/bzImage\\n'\n"
+    )
+    tool.chmod(tool.stat().st_mode | stat.S_IEXEC)
+    outdir = tmp_path / "build"
+    outdir.mkdir()
+    make = Make(srcdir=tmp_path, outdir=outdir, arch="x86_64", make=os.fspath(tool))
+
+    info = make.query()
+    assert info == KernelInfo("6.1.0-rc1", "6.1.0-rc1", "arch/x86/boot/bzImage")
+    assert info.modules_dir == "lib/modules/6.1.0-rc1"
+    assert make.kernel_release() == "6.1.0-rc1"
+    assert make.kernel_version() == "6.1.0-rc1"
+    assert log.read_text().splitlines() == [
+        f"-s ARCH=x86_64 O={outdir} kernelrelease kernelversion image_name"
+    ]
+
+    (outdir / ".config").write_text('CONFIG_LOCALVERSION=""\n')
+    make.query()
+    assert len(log.read_text().splitlines()) == 2
+
+
+def test_make_jobserver(tmp_path: Path, log_stream: StringIO) -> None:
+    tool = tmp_path / "make"
+    tool.write_text('#!/bin/sh\necho "MAKEFLAGS=$MAKEFLAGS"\n')
+    tool.chmod(tool.stat().st_mode | stat.S_IEXEC)
+    jobserver = JobServer(slots=2, path=tmp_path / "jobserver")
+    make = Make(
+        srcdir=tmp_path, outdir=tmp_path, make=os.fspath(tool), jobserver=jobserver
+    )
+
+    make("bzImage", parallel=True)
+    assert "--jobserver-auth=" in log_stream.getvalue()
+    assert jobserver.acquire(2) == b"++"
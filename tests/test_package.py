@@ -0,0 +1,56 @@
+import io
+import tarfile
+from pathlib import Path
+
+import pytest
+
+from ktest.package import (
+    PackageFormat,
+    choose_format,
+    dumps_manifest,
+    loads_manifest,
+    manifest,
+    write_delta,
+)
+
+
+def make_tarball(path: Path, files: dict[str, bytes]) -> Path:
+    with tarfile.open(path, "w:bz2") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+def test_format() -> None:
+    assert PackageFormat.from_path("linux-6.0-x86.tar") == PackageFormat.TAR
+    assert PackageFormat.from_path("linux-6.0-x86.tar.zst") == PackageFormat.ZSTD
+    assert PackageFormat.XZ.target == "tarxz-pkg"
+
+    with pytest.raises(ValueError):
+        PackageFormat.from_path("linux.zip")
+
+
+def test_choose_format() -> None:
+    assert choose_format(1e9) == PackageFormat.TAR
+    assert choose_format(50e6) == PackageFormat.ZSTD
+    assert choose_format(1e6) == PackageFormat.XZ
+
+
+def test_delta(tmp_path: Path) -> None:
+    package = make_tarball(
+        tmp_path / "linux.tar.bz2", {"./boot/vmlinuz": b"a", "./lib/m.ko": b"b"}
+    )
+    files = manifest(package)
+    assert set(files) == {"boot/vmlinuz", "lib/m.ko"}
+    assert loads_manifest(dumps_manifest(files).decode()) == files
+    assert loads_manifest("") == {}
+
+    delta = tmp_path / "delta.tar"
+    write_delta(package, delta, {"lib/m.ko"}, {"lib/ktest.manifest": b"{}"})
+
+    with tarfile.open(delta) as tar:
+        assert tar.getnames() == ["./lib/m.ko", "lib/ktest.manifest"]
+        f = tar.extractfile("./lib/m.ko")
+        assert f is not None and f.read() == b"b"
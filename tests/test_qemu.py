@@ -0,0 +1,97 @@
+import sys
+from pathlib import Path
+from subprocess import CalledProcessError
+
+import pytest
+
+from ktest.connection import qemu
+
+
+def test_command_line(tmp_path: Path) -> None:
+    config = qemu.QemuConfig(kernel="bzImage", modules="modules", kvm=False)
+    cmd = qemu.Connection(config).command_line(tmp_path)
+
+    assert cmd[0] == "qemu-system-x86_64"
+    assert cmd[cmd.index("-accel") + 1] == "tcg"
+    assert cmd[cmd.index("-kernel") + 1] == "bzImage"
+    assert f"path={tmp_path / 'share'}" in " ".join(cmd)
+    assert "rootfstype=9p" in cmd[cmd.index("-append") + 1]
+
+    config = qemu.QemuConfig(kernel="bzImage", modules="modules", kvm=True)
+    cmd = qemu.Connection(config).command_line(tmp_path)
+    assert cmd[cmd.index("-accel") + 1] == "kvm"
+
+
+# Answer the agent protocol from the host, running the commands of the share
+FAKE_QEMU = f"""#!{sys.executable}
+import re, socket, subprocess, sys
+
+args = " ".join(sys.argv)
+share = re.search(r"id=ktest,path=([^,]+)", args)[1]
+agent = socket.socket(socket.AF_UNIX)
+agent.connect(re.search(r"id=agent,path=(\\S+)", args)[1])
+channel = agent.makefile("rw")
+channel.write("ready\\n")
+channel.flush()
+for line in channel:
+    n = line.strip()
+    if n == "quit":
+        break
+    # The share is at its host path instead of the guest one
+    with open(f"{{share}}/cmd.{{n}}") as cmd:
+        cmd = cmd.read().replace("{qemu.GUEST_SHARE}", share)
+    with open(f"{{share}}/out.{{n}}", "w") as out:
+        rc = subprocess.call(["sh", "-c", cmd], stdout=out, stderr=out)
+    channel.write(f"{{n}} {{rc}}\\n")
+    channel.flush()
+"""
+
+
+@pytest.fixture
+def fake_qemu(tmp_path: Path) -> str:
+    path = tmp_path / "qemu"
+    path.write_text(FAKE_QEMU)
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_agent(fake_qemu: str) -> None:
+    config = qemu.QemuConfig(kernel="bzImage", modules="modules", qemu=fake_qemu)
+    connection = qemu.Connection(config)
+    try:
+        assert connection.run_command("echo hi", capture_output=True) == "hi\n"
+        with pytest.raises(CalledProcessError) as ex:
+            connection.run_command("echo error; exit 3")
+        assert ex.value.returncode == 3
+        assert ex.value.output == "error\n"
+    finally:
+        connection.close()
+
+
+def test_agent_timeout(fake_qemu: str) -> None:
+    config = qemu.QemuConfig(
+        kernel="bzImage", modules="modules", qemu=fake_qemu, command_timeout=0.5
+    )
+    connection = qemu.Connection(config)
+    try:
+        with pytest.raises(TimeoutError):
+            connection.run_command("sleep 2")
+        # The next command boots a new machine
+        assert connection.run_command("echo hi", capture_output=True) == "hi\n"
+    finally:
+        connection.close()
+
+
+def test_transfer(fake_qemu: str, tmp_path: Path) -> None:
+    config = qemu.QemuConfig(kernel="bzImage", modules="modules", qemu=fake_qemu)
+    connection = qemu.Connection(config)
+    src = tmp_path / "a file; $(exit 1)"
+    src.write_text("content")
+    try:
+        connection.put(src, tmp_path / "it's copied")
+        connection.get(tmp_path / "it's copied", tmp_path / "back")
+    finally:
+        connection.close()
+
+    assert (tmp_path / "it's copied").read_text() == "content"
+    assert (tmp_path / "back").read_text() == "content"
@@ -0,0 +1,191 @@
+import os
+import subprocess
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from git.repo import Repo
+from git.types import PathLike
+
+from ktest import facts, kexec, reboot
+from ktest.connection.base import Connection
+from ktest.context import Context
+from ktest.tasks import Boot, Build, Install
+
+from .conftest import FakeConnection
+
+
+@pytest.fixture
+def boots(monkeypatch: pytest.MonkeyPatch) -> list[facts.Facts | Exception]:
+    """Answer the fact gathering with the items of the returned list."""
+    answers: list[facts.Facts | Exception] = []
+
+    def gather(connection: Connection) -> facts.Facts:
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(facts, "gather", gather)
+    monkeypatch.setattr(reboot.time, "sleep", lambda delay: None)
+    return answers
+
+
+@pytest.fixture
+def ctx(fake_connection: FakeConnection, tmp_path: Path) -> Iterator[Context]:
+    yield Context(Repo(), lambda: fake_connection, temp_dir=tmp_path)
+
+
+def test_reboot_wait(
+    ctx: Context,
+    fake_connection: FakeConnection,
+    boots: list[facts.Facts | Exception],
+) -> None:
+    boots.extend(
+        [
+            facts.Facts(boot_id="a", kernel_release="6.0"),
+            facts.Facts(boot_id="a", kernel_release="6.0"),
+            OSError("connection refused"),
+            facts.Facts(boot_id="b", kernel_release="6.1"),
+        ]
+    )
+    ctx.reboot(release="6.1")
+
+    assert "reboot" in fake_connection.commands[0]
+    assert not boots
+
+
+def test_reboot_wrong_release(
+    ctx: Context,
+    fake_connection: FakeConnection,
+    boots: list[facts.Facts | Exception],
+) -> None:
+    boots.extend(
+        [
+            facts.Facts(boot_id="a", kernel_release="6.0"),
+            facts.Facts(boot_id="b", kernel_release="6.0"),
+        ]
+    )
+    with pytest.raises(RuntimeError):
+        ctx.reboot(release="6.1", method="kexec")
+
+    assert "systemctl kexec" in fake_connection.commands[0]
+
+
+def test_reboot_timeout(ctx: Context, boots: list[facts.Facts | Exception]) -> None:
+    boots.append(facts.Facts(boot_id="a"))
+    boots.extend(OSError("connection refused") for _ in range(10))
+
+    with pytest.raises(TimeoutError):
+        reboot.wait_for_reboot(lambda: ctx.connection, None, "a", timeout=0.01)
+
+
+class NoKexecConnection(FakeConnection):
+    def run_command(self, cmd: PathLike, capture_output=False) -> str:
+        if str(cmd).startswith("kexec"):
+            raise subprocess.CalledProcessError(127, cmd)
+        return super().run_command(cmd, capture_output)
+
+
+def test_kexec(
+    ctx: Context,
+    fake_connection: FakeConnection,
+    boots: list[facts.Facts | Exception],
+) -> None:
+    boots.extend(
+        [
+            facts.Facts(boot_id="a", kernel_release="6.0"),
+            OSError("connection refused"),
+            facts.Facts(boot_id="b", kernel_release="6.1"),
+        ]
+    )
+    kexec.boot(ctx, "6.1", "/boot/vmlinuz-6.1", cmdline="root=/dev/sda1")
+
+    assert fake_connection.commands[0].startswith("kexec -l /boot/vmlinuz-6.1")
+    assert "root=/dev/sda1 panic=" in fake_connection.commands[0]
+    assert "systemctl kexec" in fake_connection.commands[1]
+    # The grub2reboot fallback entry is not left armed
+    assert fake_connection.commands[2] == "grub2-editenv - unset next_entry"
+
+
+def test_kexec_fallback(tmp_path: Path, boots: list[facts.Facts | Exception]) -> None:
+    connection = NoKexecConnection()
+    ctx = Context(Repo(), lambda: connection, temp_dir=tmp_path)
+    boots.extend(
+        [
+            facts.Facts(boot_id="a", kernel_release="6.0"),
+            facts.Facts(boot_id="b", kernel_release="6.1"),
+        ]
+    )
+    kexec.boot(ctx, "6.1", "/boot/vmlinuz-6.1")
+
+    assert "'sleep 1; reboot'" in connection.commands[0]
+    assert not any("grub2-editenv" in cmd for cmd in connection.commands)
+
+
+# Log the arguments of the boot tools, one per line, after the tool name
+BOOT_TOOL = """#!/bin/sh
+printf '%s\\n' "${0##*/}" "$@" >> "${0%/*}/boot.log"
+case "${0##*/} $1" in
+"grubby --info=/boot/vmlinuz-6.1") printf 'root="/dev/sda1"\\nargs="ro it'"'"'s"\\n' ;;
+"kexec -l") exit "$KEXEC_STATUS" ;;
+esac
+"""
+
+
+@pytest.fixture
+def boot_log(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Run fake boot tools, and return the log of their arguments."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    tools = "dracut grubby grub2reboot grub2-editenv kexec systemctl reboot"
+    for tool in tools.split():
+        (bin_dir / tool).write_text(BOOT_TOOL)
+        (bin_dir / tool).chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}:{os.environ['PATH']}")
+    monkeypatch.setenv("KEXEC_STATUS", "0")
+    return bin_dir / "boot.log"
+
+
+def boot_task(ctx: Context) -> Boot:
+    build = Build(ctx)
+    build.artifacts.release = "6.1"
+    return Boot(Install(build), kexec=True)
+
+
+@pytest.mark.parametrize("kexec_status", [0, 1])
+def test_boot_kexec(
+    shell_connection: FakeConnection,
+    tmp_path: Path,
+    boots: list[facts.Facts | Exception],
+    boot_log: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    kexec_status: int,
+) -> None:
+    monkeypatch.setenv("KEXEC_STATUS", str(kexec_status))
+    ctx = Context(Repo(), lambda: shell_connection, temp_dir=tmp_path)
+    entries = {"m-6.1": "Kernel 6.1"}
+    boots.extend(
+        [
+            facts.Facts(machine_id="m", boot_id="a", entries=entries),
+            facts.Facts(boot_id="b", kernel_release="6.1"),
+        ]
+    )
+    boot_task(ctx).execute()
+
+    log = boot_log.read_text().split("\n")
+    assert log[log.index("grub2reboot") + 1] == "Kernel 6.1"
+    kexec_args = log.index("kexec")
+    end = kexec_args + 5
+    assert log[kexec_args:end] == [
+        "kexec",
+        "-l",
+        "/boot/vmlinuz-6.1",
+        "--command-line=root=/dev/sda1 ro it's panic=10",
+        "--initrd=/boot/initramfs-6.1.img",
+    ]
+    # The kexec boot unsets the fallback entry, the firmware boot uses it
+    method = "kexec" if kexec_status == 0 else "reboot"
+    assert ("grub2-editenv" in log) == (method == "kexec")
+    reboot_cmd = f"sleep 1; {reboot.REBOOT_COMMANDS[method]}'"
+    assert any(reboot_cmd in cmd for cmd in shell_connection.commands)
@@ -0,0 +1,106 @@
+import dataclasses
+import tarfile
+from pathlib import Path
+
+import pytest
+from git.repo import Repo
+
+from ktest.connection import local
+from ktest.context import Context
+from ktest.remote_build import RemoteBuilder
+from ktest.tasks import Build
+
+# Build the package from the VERSION file of the source tree
+FAKE_MAKE = """#!/bin/sh
+for a; do case $a in O=*) out=${a#O=};; esac; done
+echo "$@" >> "$out/make.log"
+case "$*" in
+*kernelrelease*) echo 6.0.0-ktest ;;
+*defconfig*) echo CONFIG_A=y > "$out/.config" ;;
+*tarbz2-pkg*) tar -cjf "$out/linux-6.0.0-ktest-x86.tar.bz2" VERSION ;;
+esac
+"""
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Repo:
+    repo = Repo.init(tmp_path / "linux")
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "ktest")
+        config.set_value("user", "email", "ktest@example.com")
+
+    for version in ("1", "2"):
+        (tmp_path / "linux" / "VERSION").write_text(version)
+        repo.index.add(["VERSION"])
+        repo.index.commit(f"version {version}")
+        repo.create_head(f"v{version}")
+
+    return repo
+
+
+@pytest.fixture
+def builder(tmp_path: Path) -> RemoteBuilder:
+    make = tmp_path / "make"
+    make.write_text(FAKE_MAKE)
+    make.chmod(0o755)
+    return RemoteBuilder(
+        {"builder": local.ConnectionFactory()},
+        workdir=str(tmp_path / "remote"),
+        make=str(make),
+    )
+
+
+def built_version(build: Build) -> str:
+    package = build.package()
+    with tarfile.open(package) as tar:
+        f = tar.extractfile("VERSION")
+        assert f is not None
+        return f.read().decode()
+
+
+def test_remote_build(repo: Repo, builder: RemoteBuilder, tmp_path: Path) -> None:
+    ctx = Context(repo, temp_dir=tmp_path / "tmp")
+    ctx.make = dataclasses.replace(ctx.make, arch="x86_64")
+    builds = [
+        Build(ctx, head=repo.heads[f"v{v}"], worktree=True, builder=builder)
+        for v in "12"
+    ]
+    ctx.run(max_workers=2)
+
+    for version, build in zip("12", builds):
+        assert build.artifacts.release == "6.0.0-ktest"
+        assert build.artifacts.remote
+        assert built_version(build) == version
+
+    # The second build of the same head reuses the host configuration
+    builds[0].execute()
+    log = (Path(builder.outdir(builds[0])) / "make.log").read_text()
+    assert log.count("olddefconfig") == 1
+
+
+def test_remote_build_local_changes(
+    repo: Repo, builder: RemoteBuilder, tmp_path: Path
+) -> None:
+    (tmp_path / "linux" / "VERSION").write_text("dirty")
+    ctx = Context(repo, temp_dir=tmp_path / "tmp")
+
+    build = Build(ctx, builder=builder)
+    build.execute()
+    assert built_version(build) == "dirty"
+
+
+def test_remote_build_kconfig(
+    repo: Repo, builder: RemoteBuilder, tmp_path: Path
+) -> None:
+    ctx = Context(repo, temp_dir=tmp_path / "tmp")
+    Build(ctx, head=repo.heads.v1, worktree=True, builder=builder).execute()
+
+    # A Kconfig change in the sources generates the configuration again
+    repo.heads.v1.checkout()
+    (tmp_path / "linux" / "Kconfig").write_text("config A\n\tbool\n")
+    repo.index.add(["Kconfig"])
+    repo.index.commit("Add Kconfig")
+    build = Build(ctx, head=repo.heads.v1, worktree=True, builder=builder)
+    build.execute()
+    log = (Path(builder.outdir(build)) / "make.log").read_text()
+    assert log.count("olddefconfig") == 2
@@ -1,4 +1,5 @@
-from io import StringIO
+import asyncio
+from io import BytesIO, StringIO
 from os.path import dirname, join
 from subprocess import CalledProcessError
 from typing import IO, Any
@@ -92,3 +93,58 @@ def test_get(connection: base.Connection, test_str: str, test_filename: str) ->
 
     with open(dest, "r") as f:
         assert test_str == f.read()
+
+
+def test_async(
+    connection: base.Connection, tmp_file: IO[Any], test_str: str, test_filename: str
+) -> None:
+    async def run() -> list[str]:
+        return await asyncio.gather(
+            *(
+                connection.arun_command(f"echo -n {test_str}{i}", capture_output=True)
+                for i in range(8)
+            )
+        )
+
+    assert asyncio.run(run()) == [f"{test_str}{i}" for i in range(8)]
+
+    with tmp_file:
+        asyncio.run(connection.aput(src=tmp_file.name, dest=test_filename))
+
+    dest = join(gettempdir(), "file.txt")
+    asyncio.run(connection.aget(src=test_filename, dest=dest))
+
+    with open(dest, "r") as f:
+        assert test_str == f.read()
+
+
+def test_pool(factory: ssh.ConnectionFactory, test_str: str) -> None:
+    pool = ssh.ConnectionPool(idle_timeout=0)
+    pooled = ssh.PooledConnectionFactory(factory.config, pool)
+
+    connection = pooled.create_connection()
+    assert connection is pooled()
+    assert (
+        connection.run_command(f"echo -n {test_str}", capture_output=True) == test_str
+    )
+
+    connection.close()
+    assert not connection.is_alive()
+    assert pooled().run_command(f"echo -n {test_str}", capture_output=True) == test_str
+
+    pool.close()
+
+
+def test_pipe_command(
+    connection: base.Connection, tmp_file: IO[Any], test_str: str, test_filename: str
+) -> None:
+    with tmp_file:
+        tmp_file.seek(0)
+        connection.pipe_command(f"cat > {test_filename}", tmp_file)
+
+    assert test_str == connection.run_command(
+        f"cat {test_filename}", capture_output=True
+    )
+
+    with pytest.raises(CalledProcessError):
+        connection.pipe_command("cat > /dev/null; exit 1", BytesIO(b""))
@@ -0,0 +1,38 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import CalledProcessError
+from typing import Iterator
+
+import pytest
+
+from ktest.connection import ssh
+
+
+@pytest.fixture
+def connection(ssh_config: ssh.HostConfig) -> Iterator[ssh.Connection]:
+    connection = ssh.Connection(ssh_config)
+    yield connection
+    connection.close()
+
+
+def test_arun_command(connection: ssh.Connection) -> None:
+    async def run() -> list[str]:
+        # Commands in flight do not hold a thread of the default executor
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(1))
+        return await asyncio.gather(
+            *(
+                connection.arun_command(f"sleep 0.5; echo {i}", capture_output=True)
+                for i in range(16)
+            )
+        )
+
+    start = time.monotonic()
+    assert asyncio.run(run()) == [f"{i}\n" for i in range(16)]
+    assert time.monotonic() - start < 4
+    assert asyncio.run(connection.arun_command("echo out")) == ""
+
+    with pytest.raises(CalledProcessError) as ex:
+        asyncio.run(connection.arun_command("echo error; exit 3"))
+    assert ex.value.returncode == 3
+    assert ex.value.output == "error\n"
@@ -0,0 +1,83 @@
+import threading
+from io import BytesIO
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ktest.connection import ssh
+
+
+def test_pool_key() -> None:
+    pool = ssh.ConnectionPool()
+    a = pool.acquire(ssh.HostConfig("a", connect_kwargs={"key_filename": "k"}))
+    assert a is pool.acquire(ssh.HostConfig("a", connect_kwargs={"key_filename": "k"}))
+    assert a is not pool.acquire(ssh.HostConfig("a", port=2222))
+
+
+def test_pool_probe_unlocked(monkeypatch: pytest.MonkeyPatch) -> None:
+    probing = threading.Event()
+    release = threading.Event()
+
+    def is_alive(self: ssh.Connection, timeout: float = 5.0) -> bool:
+        probing.set()
+        release.wait(5)
+        return False
+
+    monkeypatch.setattr(ssh.Connection, "is_alive", is_alive)
+    monkeypatch.setattr(ssh.Connection, "close", lambda self: None)
+    pool = ssh.ConnectionPool(idle_timeout=-1)
+    dead = ssh.HostConfig("dead")
+    pool.acquire(dead)
+
+    prober = threading.Thread(target=pool.acquire, args=(dead,))
+    prober.start()
+    assert probing.wait(5)
+
+    # Another host is not stalled by the probe of the dead one
+    start = time.monotonic()
+    pool.acquire(ssh.HostConfig("alive"))
+    assert time.monotonic() - start < 1
+
+    release.set()
+    prober.join()
+
+
+def test_pool_single_connection(monkeypatch: pytest.MonkeyPatch) -> None:
+    def is_alive(self: ssh.Connection, timeout: float = 5.0) -> bool:
+        time.sleep(0.1)
+        return False
+
+    monkeypatch.setattr(ssh.Connection, "is_alive", is_alive)
+    monkeypatch.setattr(ssh.Connection, "close", lambda self: None)
+    pool = ssh.ConnectionPool(idle_timeout=-1)
+    dead = ssh.HostConfig("dead")
+    first = pool.acquire(dead)
+
+    # Callers waiting for the probe get the same session
+    with ThreadPoolExecutor(4) as executor:
+        connections = list(executor.map(pool.acquire, [dead] * 4))
+    assert all(c is first for c in connections)
+
+
+def test_pool_in_use(ssh_config: ssh.HostConfig) -> None:
+    pool = ssh.ConnectionPool(idle_timeout=0.2)
+    connection = pool.acquire(ssh_config)
+    try:
+        command = threading.Thread(
+            target=connection.pipe_command, args=("sleep 0.5", BytesIO())
+        )
+        command.start()
+        time.sleep(0.3)
+        # The session runs a command, so it is not idle
+        assert connection.idle_time == 0
+        command.join()
+        assert 0 < connection.idle_time < 0.2
+
+        time.sleep(0.3)
+        assert connection.idle_time > 0.2
+        assert pool.acquire(ssh_config) is connection
+        # The probe used the session
+        assert connection.idle_time < 0.2
+    finally:
+        pool.close()
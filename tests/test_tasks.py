@@ -0,0 +1,320 @@
+import dataclasses
+import io
+import re
+import tarfile
+from pathlib import Path
+from typing import IO, Any
+
+import pytest
+from git.repo import Repo
+from git.types import PathLike
+
+from ktest import package as pkg
+from ktest.cache import BuildCache
+from ktest.connection import local
+from ktest.context import Context
+from ktest.journal import Journal
+from ktest.package import PackageFormat
+from ktest.tasks import Build, Install
+
+from .conftest import FakeConnection
+
+# Create empty packages, and log the make targets
+FAKE_MAKE = """#!/bin/sh
+for a; do case $a in O=*) out=${a#O=};; esac; done
+echo "$@" >> "$out/make.log"
+case "$*" in
+*kernelrelease*) printf '6.0.0\\n6.0.0\\nbzImage\\n' ;;
+*tar-pkg*) : > "$out/linux-6.0.0-x86.tar" ;;
+*tarbz2-pkg*) : > "$out/linux-6.0.0-x86.tar.bz2" ;;
+esac
+"""
+
+
+@pytest.fixture
+def repo(tmp_path: Path) -> Repo:
+    repo = Repo.init(tmp_path / "linux")
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "ktest")
+        config.set_value("user", "email", "ktest@example.com")
+
+    for version in ("1", "2"):
+        (tmp_path / "linux" / "VERSION").write_text(version)
+        repo.index.add(["VERSION"])
+        repo.index.commit(f"version {version}")
+        repo.create_head(f"v{version}")
+
+    return repo
+
+
+@pytest.fixture
+def ctx(repo: Repo, tmp_path: Path) -> Context:
+    ctx = Context(repo, temp_dir=tmp_path / "tmp")
+    ctx.make = dataclasses.replace(ctx.make, make="true")
+    return ctx
+
+
+def test_build_worktree(ctx: Context, repo: Repo) -> None:
+    builds = [Build(ctx, head=repo.heads[f"v{v}"], worktree=True) for v in "12"]
+    ctx.run(max_workers=2)
+
+    for version, build in zip("12", builds):
+        assert (Path(build.make.srcdir) / "VERSION").read_text() == version
+        assert build.build_dir.is_dir()
+        assert build.build_dir != ctx.build_dir
+
+    # The main checkout is untouched
+    assert repo.head.commit == repo.heads.v2.commit
+
+    version = Path(builds[0].make.srcdir) / "VERSION"
+    mtime = version.stat().st_mtime_ns
+    builds[0].execute()
+    assert version.stat().st_mtime_ns == mtime
+
+
+def test_build_config_fingerprint(ctx: Context, tmp_path: Path) -> None:
+    log = tmp_path / "make.log"
+    make = tmp_path / "make"
+    make.write_text(f'#!/bin/sh\necho "$@" >> {log}\n')
+    make.chmod(0o755)
+    ctx.make = dataclasses.replace(ctx.make, make=str(make))
+
+    base = tmp_path / "base.config"
+    base.write_text("CONFIG_A=y\nCONFIG_B=y\n")
+    fragment = tmp_path / "debug.config"
+    fragment.write_text("# CONFIG_B is not set\n")
+
+    build = Build(ctx, config=base, fragments=(fragment,))
+    build.execute()
+    assert (build.build_dir / ".config").read_text() == (
+        "CONFIG_A=y\n# CONFIG_B is not set\n"
+    )
+    assert "olddefconfig" in log.read_text()
+
+    log.unlink()
+    build.execute()
+    assert "olddefconfig" not in log.read_text()
+
+    fragment.write_text("CONFIG_C=y\n")
+    build.execute()
+    assert "olddefconfig" in log.read_text()
+
+
+def test_build_resume(repo: Repo, tmp_path: Path) -> None:
+    log = tmp_path / "make.log"
+    make = tmp_path / "make"
+    make.write_text(f'#!/bin/sh\necho "$@" >> {log}\n')
+    make.chmod(0o755)
+    config = tmp_path / "base.config"
+    config.write_text("CONFIG_A=y\n")
+
+    def run() -> Build:
+        ctx = Context(repo, temp_dir=tmp_path / "tmp", journal=Journal(tmp_path / "j"))
+        ctx.make = dataclasses.replace(ctx.make, make=str(make))
+        build = Build(ctx, config=config, head=repo.heads.v1, worktree=True)
+        ctx.run()
+        return build
+
+    run()
+    assert log.read_text().count("olddefconfig") == 1
+
+    log.unlink()
+    run()
+    assert not log.exists()
+
+    config.write_text("CONFIG_A=m\n")
+    run()
+    assert "olddefconfig" in log.read_text()
+
+
+def test_build_cache(repo: Repo, tmp_path: Path) -> None:
+    make = tmp_path / "make"
+    make.write_text(FAKE_MAKE)
+    make.chmod(0o755)
+    cache = BuildCache(tmp_path / "cache")
+
+    def build() -> Build:
+        ctx = Context(repo, temp_dir=tmp_path / "tmp")
+        ctx.make = dataclasses.replace(ctx.make, make=str(make), arch="x86_64")
+        build = Build(ctx, head=repo.heads.v1, worktree=True, cache=cache)
+        build.execute()
+        return build
+
+    def targets(build: Build) -> list[str]:
+        log = build.build_dir / "make.log"
+        targets = [line.split()[-1] for line in log.read_text().splitlines()]
+        log.unlink()
+        return targets
+
+    # Only the package asked for is created, and cached
+    first = build()
+    assert not first.artifacts.from_cache
+    assert first.package(PackageFormat.TAR).name == "linux-6.0.0-x86.tar"
+    assert "tarbz2-pkg" not in targets(first)
+
+    # The cached format is restored without building
+    second = build()
+    assert second.artifacts.from_cache
+    assert second.package(PackageFormat.TAR).name == "linux-6.0.0-x86.tar"
+    assert not (second.build_dir / "make.log").exists()
+
+    # Another format needs the build tree
+    assert second.package().name == "linux-6.0.0-x86.tar.bz2"
+    assert not second.artifacts.from_cache
+    assert "tarbz2-pkg" in targets(second)
+
+    entry = cache.lookup(next(p.name for p in cache.root.iterdir()))
+    assert entry is not None
+    assert set(entry.packages) == {PackageFormat.TAR, PackageFormat.BZIP2}
+
+
+class MarkerConnection(FakeConnection):
+    """Keep the content of the install marker of the host."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.marker = ""
+
+    def run_command(self, cmd: PathLike, capture_output=False) -> str:
+        super().run_command(cmd, capture_output)
+        words = str(cmd).split()
+        if words[0] == "echo" and words[-1].endswith(Install.MARKER):
+            self.marker = words[1]
+        if words[0] == "cat" and words[1].endswith(Install.MARKER):
+            return self.marker
+        return ""
+
+
+def test_install_resume(
+    repo: Repo, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    make = tmp_path / "make"
+    make.write_text(FAKE_MAKE)
+    make.chmod(0o755)
+    connection = MarkerConnection()
+    fingerprints: list[str] = []
+    build_fingerprint = Build.fingerprint
+
+    def fingerprint(build: Build) -> str:
+        fingerprints.append(build_fingerprint(build))
+        return fingerprints[-1]
+
+    monkeypatch.setattr(Build, "fingerprint", fingerprint)
+
+    def run() -> Install:
+        ctx = Context(
+            repo,
+            lambda: connection,
+            temp_dir=tmp_path / "tmp",
+            journal=Journal(tmp_path / "journal"),
+        )
+        ctx.make = dataclasses.replace(ctx.make, make=str(make), arch="x86_64")
+        install = Install(Build(ctx, head=repo.heads.v1, worktree=True))
+        connection.commands.clear()
+        fingerprints.clear()
+        ctx.run()
+        return install
+
+    install = run()
+    assert connection.marker == install.fingerprint()
+    # The source tree is hashed once per build
+    assert len(fingerprints) == 1
+
+    run()
+    assert not any(cmd.startswith("tar") for cmd in connection.commands)
+
+    # The host was installed by something else since
+    connection.marker = "other"
+    run()
+    assert any(cmd.startswith("tar") for cmd in connection.commands)
+
+
+class RootConnection(local.Connection):
+    """Run commands and transfers locally, inside a root directory."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.commands: list[str] = []
+
+    def __rooted(self, cmd: PathLike) -> str:
+        self.commands.append(str(cmd))
+        return re.sub(r"(?<=[\s'])/(?!dev/null)", f"{self.root}/", str(cmd))
+
+    def run_command(self, cmd: PathLike, capture_output=False) -> str:
+        return super().run_command(self.__rooted(cmd), capture_output)
+
+    def pipe_command(self, cmd: PathLike, stdin: IO[bytes]) -> None:
+        super().pipe_command(self.__rooted(cmd), stdin)
+
+    def put(self, src: PathLike, dest: PathLike) -> None:
+        super().put(src, f"{self.root}{dest}")
+
+
+def make_package(path: Path, files: dict[str, bytes]) -> Path:
+    with tarfile.open(path, "w:bz2" if path.suffix == ".bz2" else "w") as tar:
+        for name, content in files.items():
+            info = tarfile.TarInfo(f"./{name}")
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+def install(ctx: Context, package: Path, **kwargs: Any) -> Install:
+    build = Build(ctx)
+    build.artifacts.release = "6.0.0"
+    build.artifacts.from_cache = True
+    build.artifacts.packages[PackageFormat.from_path(package)] = package
+    task = Install(build, package_format=PackageFormat.from_path(package), **kwargs)
+    task.execute()
+    return task
+
+
+def test_install_delta(repo: Repo, tmp_path: Path) -> None:
+    root = tmp_path / "root"
+    (root / "tmp").mkdir(parents=True)
+    connection = RootConnection(root)
+    ctx = Context(repo, lambda: connection, temp_dir=tmp_path / "tmp")
+    modules = "lib/modules/6.0.0"
+    files = {
+        "boot/vmlinuz-6.0.0": b"kernel",
+        f"{modules}/a.ko": b"a",
+        f"{modules}/old.ko": b"old",
+    }
+    # More stale files than the length limit of a single command line
+    stale = {f"{modules}/kernel/{'driver' * 10}-{i}.ko": b"" for i in range(3000)}
+    install(ctx, make_package(tmp_path / "v1.tar", files | stale), delta=True)
+    assert (root / modules / "old.ko").read_bytes() == b"old"
+    assert pkg.loads_manifest((root / modules / Install.MANIFEST).read_text()) == (
+        pkg.manifest(tmp_path / "v1.tar")
+    )
+    assert len(list((root / modules / "kernel").iterdir())) == len(stale)
+
+    # Only the changed files are sent, and the stale ones are removed
+    (root / "boot" / "vmlinuz-6.0.0").write_bytes(b"untouched")
+    del files[f"{modules}/old.ko"]
+    files[f"{modules}/a.ko"] = b"changed"
+    install(ctx, make_package(tmp_path / "v2.tar", files), delta=True)
+    assert (root / modules / "a.ko").read_bytes() == b"changed"
+    assert not (root / modules / "old.ko").exists()
+    assert not list((root / modules / "kernel").iterdir())
+    assert (root / "boot" / "vmlinuz-6.0.0").read_bytes() == b"untouched"
+    assert pkg.loads_manifest((root / modules / Install.MANIFEST).read_text()) == (
+        pkg.manifest(tmp_path / "v2.tar")
+    )
+
+    # Nothing changed: nothing is sent
+    connection.commands.clear()
+    install(ctx, tmp_path / "v2.tar", delta=True)
+    assert not any("tar" in cmd for cmd in connection.commands)
+
+
+def test_install_streaming(repo: Repo, tmp_path: Path) -> None:
+    root = tmp_path / "root"
+    root.mkdir()
+    connection = RootConnection(root)
+    ctx = Context(repo, lambda: connection, temp_dir=tmp_path / "tmp")
+    files = {"boot/vmlinuz-6.0.0": b"kernel", "lib/modules/6.0.0/a.ko": b"a"}
+    install(ctx, make_package(tmp_path / "linux.tar.bz2", files), streaming=True)
+
+    assert (root / "lib/modules/6.0.0/a.ko").read_bytes() == b"a"
+    assert connection.commands == ["tar -x -j -f - -C /"]
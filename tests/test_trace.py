@@ -0,0 +1,101 @@
+import os
+import json
+import asyncio
+import subprocess
+from io import BytesIO
+from pathlib import Path
+from typing import IO
+
+from git.repo import Repo
+from git.types import PathLike
+
+from ktest.connection.base import Connection
+from ktest.connection.transfer import TransferStats
+from ktest.context import Context
+from ktest.task import Task
+from ktest.trace import TracedConnection, Tracer
+
+from .conftest import FakeConnection
+
+
+class BusyTask(Task):
+    def execute(self) -> None:
+        subprocess.run(["sh", "-c", "i=0; while [ $i -lt 20000 ]; do i=$((i+1)); done"])
+        self.ctx.connection.run_command("uname -r")
+        self.ctx.connection.put(__file__, "/tmp/x")
+
+
+class GetTask(Task):
+    def execute(self) -> None:
+        self.ctx.connection.get("/tmp/x", self.ctx.temp_dir / "ktest-trace-get")
+
+
+def test_tracer(fake_connection: FakeConnection, tmp_path: Path) -> None:
+    fake_connection.content = b"x" * 10
+    tracer = Tracer()
+    ctx = Context(Repo(), lambda: fake_connection, temp_dir=tmp_path, tracer=tracer)
+    busy = BusyTask(ctx)
+    GetTask(ctx, dependencies=(busy,))
+    ctx.run()
+
+    spans = {span.name: span for span in tracer.spans}
+    assert set(spans) == {"BusyTask", "GetTask"}
+
+    busy_span = spans["BusyTask"]
+    assert busy_span.children_cpu > 0
+    assert busy_span.bytes_sent == os.path.getsize(__file__)
+    assert [cmd for cmd, _, _ in busy_span.commands] == ["uname -r"]
+    assert spans["GetTask"].bytes_received == 10
+    assert spans["GetTask"].start >= busy_span.start + busy_span.wall
+
+    trace = tmp_path / "trace.json"
+    tracer.write_chrome_trace(trace)
+    events = json.loads(trace.read_text())["traceEvents"]
+    assert {e["cat"] for e in events} == {"task", "command"}
+
+    lines = tracer.summary().splitlines()
+    assert lines[0].startswith("Task")
+    assert lines[1].startswith("BusyTask")
+
+
+class SSHLikeConnection(FakeConnection):
+    """A backend that overrides the concrete methods, like ssh does."""
+
+    def __init__(self) -> None:
+        super().__init__(content=b"x" * 10)
+        self.calls: list[str] = []
+
+    async def aput(self, src: PathLike, dest: PathLike) -> None:
+        self.calls.append("aput")
+
+    async def aget(self, src: PathLike, dest: PathLike) -> None:
+        self.calls.append("aget")
+        Path(dest).write_bytes(self.content)
+
+    def put_many(self, files, max_workers=4, progress=None, skip_unchanged=True):
+        self.calls.append("put_many")
+        return TransferStats(files=1, bytes=5)
+
+    def pipe_command(self, cmd: PathLike, stdin: IO[bytes]) -> None:
+        self.calls.append("pipe_command")
+        stdin.read()
+
+
+def test_traced_connection_overrides(tmp_path: Path) -> None:
+    # Every public method of Connection reaches the backend
+    public = {name for name in dir(Connection) if not name.startswith("_")}
+    assert public <= set(vars(TracedConnection))
+
+    tracer = Tracer()
+    backend = SSHLikeConnection()
+    connection = TracedConnection(backend, tracer)
+
+    with tracer.span("transfers") as span:
+        asyncio.run(connection.aput(__file__, "/tmp/x"))
+        asyncio.run(connection.aget("/tmp/x", tmp_path / "x"))
+        assert connection.put_many([(__file__, "/tmp/x")]).files == 1
+        connection.pipe_command("cat", BytesIO(b"abc"))
+
+    assert backend.calls == ["aput", "aget", "put_many", "pipe_command"]
+    assert span.bytes_sent == os.path.getsize(__file__) + 5 + 3
+    assert span.bytes_received == 10
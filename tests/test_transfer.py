@@ -0,0 +1,91 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from ktest.connection import local
+from ktest.connection.transfer import _STAT_CHUNK, TransferStats
+
+
+@pytest.fixture
+def connection() -> local.Connection:
+    return local.ConnectionFactory().create_connection()
+
+
+def make_tree(root: Path) -> None:
+    for name in ("a", "b/c", "b/d/e"):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(os.urandom(1000))
+
+
+def test_put_get_many(connection: local.Connection, tmp_path: Path) -> None:
+    make_tree(tmp_path / "src")
+    files = {tmp_path / "src" / n: tmp_path / "dest" / n for n in ("a", "b/c")}
+    updates: list[int] = []
+
+    stats = connection.put_many(
+        files.items(), progress=lambda s: updates.append(s.files)
+    )
+    assert (stats.files, stats.skipped, stats.bytes) == (2, 0, 2000)
+    assert sorted(updates) == [1, 2]
+    assert (tmp_path / "dest" / "b" / "c").read_bytes() == (
+        tmp_path / "src" / "b" / "c"
+    ).read_bytes()
+
+    stats = connection.put_many(files.items())
+    assert (stats.files, stats.skipped) == (0, 2)
+
+    back = {dest: tmp_path / "back" / src.name for src, dest in files.items()}
+    stats = connection.get_many(back.items())
+    assert stats.files == 2
+    assert connection.get_many(back.items()).skipped == 2
+
+
+def test_sync_dir(connection: local.Connection, tmp_path: Path) -> None:
+    make_tree(tmp_path / "src")
+
+    stats = connection.sync_dir(tmp_path / "src", tmp_path / "dest")
+    assert stats.files == 3
+    assert (tmp_path / "dest" / "b" / "d" / "e").exists()
+
+    (tmp_path / "src" / "a").write_bytes(b"changed")
+    stats = connection.sync_dir(tmp_path / "src", tmp_path / "dest")
+    assert (stats.files, stats.skipped) == (1, 2)
+    assert (tmp_path / "dest" / "a").read_bytes() == b"changed"
+
+    stats = connection.sync_dir(tmp_path / "dest", tmp_path / "back", upload=False)
+    assert stats.files == 3
+
+    (tmp_path / "back" / "a").write_bytes(b"CHANGED")
+    os.utime(tmp_path / "back" / "a", (0, os.stat(tmp_path / "dest" / "a").st_mtime))
+    stats = connection.sync_dir(
+        tmp_path / "dest", tmp_path / "back", upload=False, checksum=True
+    )
+    assert (stats.files, stats.skipped) == (1, 2)
+    assert (tmp_path / "back" / "a").read_bytes() == b"changed"
+
+
+def test_stats() -> None:
+    stats = TransferStats(total_files=2, total_bytes=2**21, files=1, bytes=2**20)
+    stats.elapsed = 0.5
+    assert stats.throughput == 2**21
+    assert str(stats).startswith("1/2 files")
+
+
+def test_sync_dir_many(connection: local.Connection, tmp_path: Path) -> None:
+    # More files and directories than the paths of a single remote command
+    src = tmp_path / "src"
+    count = 3 * _STAT_CHUNK
+    for i in range(count):
+        path = src / f"directory-{i:04}" / f"file-{i:04}"
+        path.parent.mkdir(parents=True)
+        path.write_text(str(i))
+        os.utime(path, (i, i))
+
+    stats = connection.sync_dir(src, tmp_path / "dest")
+    assert stats.files == count
+
+    last = tmp_path / "dest" / f"directory-{count - 1:04}" / f"file-{count - 1:04}"
+    assert last.read_text() == str(count - 1)
+    assert connection.sync_dir(src, tmp_path / "dest").skipped == count
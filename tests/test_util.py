@@ -1,7 +1,8 @@
 import pytest
 from subprocess import CalledProcessError
-from ktest.util import run_cmd, log_output
+from ktest.util import iter_cmd, run_cmd, log_output
 from io import StringIO
+from pathlib import Path
 
 
 def test_log_output(log_stream: StringIO) -> None:
@@ -30,3 +31,53 @@ def test_run_cmd_fail(log_stream: StringIO) -> None:
         run_cmd("ls /invalid-dir")
 
     assert "No such file or directory" in log_stream.getvalue()
+
+
+def test_run_cmd_no_deadlock() -> None:
+    # Fill the stderr pipe while stdout is captured
+    output = run_cmd(
+        "head -c 1000000 /dev/zero | tr '\\0' 'e' >&2; echo done",
+        capture_output=True,
+    )
+
+    assert output == "done\n"
+
+
+def test_run_cmd_capture_limit() -> None:
+    output = run_cmd("seq 1 1000", capture_output=True, capture_limit=3)
+
+    assert output == "998\n999\n1000\n"
+
+
+def test_run_cmd_on_output() -> None:
+    lines: list[tuple[str, str]] = []
+    run_cmd(
+        "echo out; echo err >&2",
+        capture_output=True,
+        on_output=lambda *a: lines.append(a),
+    )
+
+    assert sorted(lines) == [("stderr", "err\n"), ("stdout", "out\n")]
+
+
+def test_iter_cmd() -> None:
+    lines = list(iter_cmd("printf 'a\\nb'"))
+
+    assert lines == [("stdout", "a\n"), ("stdout", "b")]
+
+    with pytest.raises(CalledProcessError):
+        list(iter_cmd("exit 3"))
+
+
+def test_run_cmd_closed_output(tmp_path: Path) -> None:
+    # The command keeps running after closing its output
+    done = tmp_path / "done"
+    assert (
+        run_cmd(f"echo hi; exec >&- 2>&-; sleep 0.5; touch {done}", capture_output=True)
+        == "hi\n"
+    )
+    assert done.exists()
+
+    with pytest.raises(CalledProcessError) as ex:
+        run_cmd("exec > /dev/null 2>&1; sleep 0.5; exit 3")
+    assert ex.value.returncode == 3